@@ -1,32 +1,158 @@
-from flask import Flask
+from flask import Flask, render_template, session, redirect, url_for, request
 from flask_sqlalchemy import SQLAlchemy
-from config import Config
+from config import get_config
+from app.services.replica import RoutingSession
 
-# 初始化数据库
-db = SQLAlchemy()
+# 初始化数据库（会话按读写分离规则选择主库或只读副本）
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-def create_app():
+# 不需要登录就能访问的路由
+LOGIN_WHITELIST = (
+    'auth.login',           # 登录页面
+    'auth.logout',          # 登出
+    'auth.init_admin',      # 初始化管理员
+    'static'                # 静态文件
+)
+
+
+def create_app(config_name=None):
+    """应用工厂（run.py 开发服务器、wsgi.py 生产入口、命令行共用）
+
+    启动时不再每次 create_all、查询管理员：数据库结构按 schema_migration 中的版本判断是否需要建表
+    （设置 SCHEMA_CHECK=0 可完全跳过），创建管理员用命令 flask --app run auth init-admin。
+    """
     app = Flask(__name__)
-    app.config.from_object(Config)
-    
-    # 绑定数据库
+
+    # 数据库配置（医药销售管理系统，连接地址和连接池参数见 config.py，按 APP_ENV 选择环境）
+    app.config.from_object(get_config(config_name))
+    app.secret_key = 'your_secure_secret_key'  # 用于flash消息和会话
+
+    # 会话配置
+    app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 会话超时时间：1小时（单位：秒）
+    app.config['SESSION_COOKIE_NAME'] = 'pharmacy_session'  # 会话 Cookie 名称
+    app.config['SESSION_COOKIE_HTTPONLY'] = True  # 防止 JavaScript 访问 Cookie
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # CSRF 防护
+
+    _init_services(app)
+    _register_blueprints(app)
+    _register_scheduled_jobs(app)
+
+    app.before_request(_check_login)
+
+    @app.route('/')
+    def index():
+        return render_template('index.html')
+
+    # 数据库结构检查（最新版本已登记时只有一次查询）
+    if app.config['SCHEMA_CHECK']:
+        from app.migrations import ensure_schema
+        app.extensions['schema_status'] = ensure_schema(app)
+    return app
+
+
+def _init_services(app):
+    from app.services.db_pool import init_pool
+    from app.services.oplog import oplog
+    from app.services.jobs import jobs
+    from app.services.replica import replica_router
+    from app.services.report_cache import report_cache
+    from app.services.dashboard import dashboard
+    from app.services.idempotency import idempotency
+    from app.services.ratelimit import rate_limiter
+    from app.services.async_db import async_db
+    from app.migrations import schema_cli
+
+    # 初始化数据库（先配置带监控的连接池）
+    init_pool(app)
     db.init_app(app)
-    
-    # 注册路由
-    from app.routes.main import main_bp
-    from app.routes.api import api_bp
+    oplog.init_app(app)  # 操作日志后台批量写入
+    jobs.init_app(app)  # 后台任务线程池
+    replica_router.init_app(app)  # 读写分离（配置了只读副本时启用）
+    report_cache.init_app(app)  # 报表结果缓存
+    dashboard.init_app(app)  # 首页 KPI 缓存
+    idempotency.init_app(app)  # 新增单据接口的幂等键
+    rate_limiter.init_app(app)  # 按用户和接口类别限流
+    async_db.init_app(app)  # 异步只读接口的数据库连接（ASGI 入口 asgi.py 中使用）
+    app.cli.add_command(schema_cli)  # 数据库结构迁移命令：flask --app run schema upgrade
+
+
+def _register_blueprints(app):
+    from app.routes.main import main_bp  # 总导航
+    from app.routes.material import material_bp  # 物资管理
+    from app.routes.material_category import material_category_bp  # 物资分类
+    from app.routes.supplier import supplier_bp  # 供应商管理
+    from app.routes.inbound import inbound_bp  # 入库管理
+    from app.routes.outbound import outbound_bp  # 出库管理
+    from app.routes.warehouse import warehouse_bp  # 仓库管理
+    from app.routes.unit import unit_bp  # 单位管理
+    from app.routes.stock import stock_bp  # 库存管理
+    from app.routes.database import database_bp  # 数据库管理
+    from app.routes.auth import auth_bp  # 用户认证
+    from app.routes.metrics import metrics_bp  # 运行指标
+    from app.routes.api import api_bp  # RESTful API
+    from app.routes.report import report_bp  # 统计报表
+    from app.routes.system import system_bp  # 系统管理（用户、操作日志）
+    from app.routes.jobs import jobs_bp  # 后台任务
+
     app.register_blueprint(main_bp)
+    app.register_blueprint(material_bp)
+    app.register_blueprint(material_category_bp)
+    app.register_blueprint(supplier_bp)
+    app.register_blueprint(inbound_bp)
+    app.register_blueprint(outbound_bp)
+    app.register_blueprint(warehouse_bp)
+    app.register_blueprint(unit_bp)
+    app.register_blueprint(stock_bp)
+    app.register_blueprint(database_bp)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(metrics_bp)
     app.register_blueprint(api_bp)
-    
-    # 创建数据库表（首次运行自动创建）
-    with app.app_context():
-        db.create_all()
-        # 初始化默认管理员（如果没有）
-        from app.models import User
-        if not User.query.filter_by(username="admin").first():
-            admin = User(username="admin", real_name="系统管理员")
-            admin.set_password("123456")  # 密码123456
-            db.session.add(admin)
-            db.session.commit()
-    
-    return app
\ No newline at end of file
+    app.register_blueprint(report_bp, url_prefix='/report')
+    app.register_blueprint(system_bp, url_prefix='/system')
+    app.register_blueprint(jobs_bp)
+
+
+def _register_scheduled_jobs(app):
+    """定时任务：每日效期扫描、补货建议计算、销售日汇总对账、分析数据增量导出、操作日志分区维护、过期任务清理、
+    过期幂等键清理、心跳超时任务检查（cron）、定时备份（cron）"""
+    from functools import partial
+    from app.services import expiry, replenish, rollup, analytics_export
+    from app.services.jobs import jobs
+    from app.services.idempotency import idempotency
+    from app.services.oplog import maintain_partitions
+    from app.services.scheduler import scheduler
+
+    scheduler.add_daily_job('expiry_scan', expiry.scan_expiry, at=app.config['EXPIRY_SCAN_AT'])
+    scheduler.add_daily_job('reorder', partial(replenish.compute_suggestions, app.config), at=app.config['REORDER_RUN_AT'])
+    scheduler.add_daily_job('sales_rollup_reconcile', partial(rollup.reconcile_recent, app.config['ROLLUP_RECONCILE_DAYS']),
+                            at=app.config['ROLLUP_RECONCILE_AT'])
+    scheduler.add_daily_job('analytics_export', partial(analytics_export.export_all, app.config),
+                            at=app.config['ANALYTICS_EXPORT_AT'])
+    scheduler.add_daily_job('oplog_partitions', partial(maintain_partitions, app.config['LOG_RETENTION_MONTHS']),
+                            at=app.config['LOG_MAINTAIN_AT'])
+    scheduler.add_daily_job('job_cleanup', partial(jobs.cleanup, app.config['JOB_RETENTION_DAYS']),
+                            at=app.config['JOB_CLEANUP_AT'])
+    scheduler.add_daily_job('idempotency_cleanup', idempotency.cleanup, at=app.config['IDEMPOTENCY_CLEANUP_AT'])
+    scheduler.add_cron_job('job_expire', jobs.expire_stale, cron=app.config['JOB_EXPIRE_CRON'])
+    if app.config['BACKUP_CRON']:
+        from app.services import backup  # 登记备份任务
+        # 定时器只负责提交，导出和压缩在后台任务线程中执行，可在任务页查看进度
+        scheduler.add_cron_job('database_backup', partial(jobs.submit, 'database_backup'), cron=app.config['BACKUP_CRON'])
+
+
+# 全局登录验证（在每次请求前执行）
+def _check_login():
+    # 如果访问的是白名单中的路由，直接放行
+    if request.endpoint in LOGIN_WHITELIST:
+        return None
+
+    # 如果访问静态文件，直接放行
+    if request.path.startswith('/static/'):
+        return None
+
+    # 检查是否已登录
+    if 'user_id' not in session:
+        # 未登录，重定向到登录页
+        return redirect(url_for('auth.login', next=request.url))
+
+    return None
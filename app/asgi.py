@@ -0,0 +1,125 @@
+"""ASGI 应用：/api/async/ 由异步只读接口处理（app/routes/async_api.py），其余请求交给 Flask 应用
+
+Flask 应用通过 asgiref 的 WsgiToAsgi 挂在同一个 ASGI 进程中（在线程中执行），页面和写接口的行为不变。
+/api/async/ 不经过 Flask 的请求钩子，限流（app/services/ratelimit.py）在这里按 read 类别执行，与页面查询共用令牌桶。
+lifespan：进程退出时关闭异步连接池。
+"""
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import parse_qs
+
+from werkzeug.http import parse_cookie
+
+from app.routes.async_api import PREFIX, HTTPError, Request, router
+from app.services.async_db import async_db
+from app.services.ratelimit import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'无法序列化 {type(value).__name__}')
+
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json; charset=utf-8'),
+        (b'content-length', str(len(body)).encode('ascii')),
+        (b'cache-control', b'no-store'),
+        *headers,
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AsgiApp:
+    def __init__(self, flask_app):
+        from asgiref.wsgi import WsgiToAsgi
+
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        # 与 Flask 相同的会话 Cookie 校验（签名、过期时间）
+        self.cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+        self.serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and (scope['path'] == PREFIX or scope['path'].startswith(PREFIX + '/')):
+            await self._handle(scope, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _user_id(self, scope):
+        """从 Flask 会话 Cookie 中取当前用户ID，未登录或会话已过期返回 None（不检查用户是否仍存在、启用）"""
+        cookie = b'; '.join(value for name, value in scope['headers'] if name == b'cookie').decode('latin-1')
+        value = parse_cookie(cookie).get(self.cookie_name)
+        if not value:
+            return None
+        try:
+            return self.serializer.loads(value, max_age=self.max_age).get('user_id')
+        except Exception:
+            return None  # 签名不正确或已过期
+
+    async def _handle(self, scope, send):
+        path = scope['path'][len(PREFIX):] or '/'
+        handler, path_params = router.match(path)
+        if handler is None:
+            return await _send_json(send, 404, {'status': 'error', 'message': '接口不存在'})
+        if scope['method'] != 'GET':
+            return await _send_json(send, 405, {'status': 'error', 'message': '只支持 GET 请求'})
+        user_id = self._user_id(scope)
+        if user_id is None:
+            return await _send_json(send, 401, {'status': 'error', 'message': '请先登录'})
+        try:
+            active = await async_db.active_user(user_id)
+        except Exception:
+            logger.exception('异步接口检查用户 %s 失败', user_id)
+            return await _send_json(send, 500, {'status': 'error', 'message': '服务器内部错误'})
+        if not active:
+            return await _send_json(send, 401, {'status': 'error', 'message': '用户不存在或已禁用，请重新登录'})
+
+        if not (rate_limiter.enabled and 'read' in rate_limiter.limits):
+            return await self._dispatch(scope, send, path, handler, path_params, user_id)
+        retry_after = rate_limiter.acquire(user_id, 'read')
+        if retry_after:
+            return await _send_json(send, 429, {'status': 'error', 'message': f'查询请求过于频繁，请 {retry_after} 秒后重试'},
+                                    headers=[(b'retry-after', str(retry_after).encode('ascii'))])
+        try:
+            await self._dispatch(scope, send, path, handler, path_params, user_id)
+        finally:
+            rate_limiter.release(user_id, 'read')
+
+    async def _dispatch(self, scope, send, path, handler, path_params, user_id):
+        query = parse_qs(scope['query_string'].decode('latin-1'), encoding='utf-8')
+        request = Request(path, {name: values[-1] for name, values in query.items()}, path_params, user_id)
+        try:
+            payload = await handler(request)
+        except HTTPError as e:
+            return await _send_json(send, e.status, {'status': 'error', 'message': e.message})
+        except Exception:
+            logger.exception('异步接口 %s 执行失败', scope['path'])
+            return await _send_json(send, 500, {'status': 'error', 'message': '服务器内部错误'})
+        await _send_json(send, 200, payload)
+
+
+def create_asgi_app(flask_app):
+    """由 Flask 应用（create_app() 创建，已初始化 async_db）创建 ASGI 应用"""
+    return AsgiApp(flask_app)
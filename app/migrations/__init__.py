@@ -0,0 +1,228 @@
+"""数据库结构版本管理（替代手工执行的 .sql 脚本）
+
+每个迁移是本目录下的一个模块 vNNN_说明.py，按版本号顺序执行，模块中定义：
+    description = '说明'
+    def upgrade(conn): ...
+    def downgrade(conn): ...
+conn 是 SQLAlchemy 连接，每个迁移在一个事务中执行并记入 schema_migration 表。
+MySQL 的 DDL 会隐式提交，迁移需写成可重复执行（create_index / drop_index 已检查是否存在）。
+
+应用启动时 ensure_schema() 只查询一次 schema_migration：最新版本已执行时不再调用 create_all；
+空数据库由 create_all 建表，并把全部迁移登记为已执行（模型已包含迁移的全部改动）。
+
+命令（在项目根目录执行）：
+    flask --app run schema status            查看各版本是否已执行
+    flask --app run schema upgrade [--to v]  执行未执行的迁移（默认到最新版本）
+    flask --app run schema downgrade --to v  回退到版本 v（v 之后的迁移依次回退，--to v000 全部回退）
+"""
+import importlib
+import pkgutil
+import time
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import MetaData, Table, delete, insert, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+from app import db
+from app.models import SchemaMigration
+
+
+def available():
+    """全部迁移 [(版本, 模块)]，按版本排序"""
+    migrations = []
+    for module in pkgutil.iter_modules(__path__):
+        if module.name.startswith('v'):
+            migrations.append((module.name.split('_', 1)[0], importlib.import_module(f'{__name__}.{module.name}')))
+    return sorted(migrations, key=lambda m: m[0])
+
+
+def latest():
+    """最新的迁移版本（只读模块名，不导入迁移模块）"""
+    versions = [module.name.split('_', 1)[0] for module in pkgutil.iter_modules(__path__) if module.name.startswith('v')]
+    return max(versions, default=None)
+
+
+def applied():
+    """已执行的版本 {版本: 执行时间}"""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return dict(conn.execute(select(SchemaMigration.version, SchemaMigration.applied_time)).all())
+
+
+def upgrade(target=None, echo=print):
+    """执行未执行的迁移（到 target 为止），返回执行的版本列表"""
+    done = applied()
+    executed = []
+    for version, module in available():
+        if target and version > target:
+            break
+        if version in done:
+            continue
+        echo(f'执行迁移 {version}：{module.description}')
+        with db.engine.begin() as conn:
+            module.upgrade(conn)
+            conn.execute(insert(SchemaMigration).values(
+                version=version, description=module.description, applied_time=datetime.now()
+            ))
+        executed.append(version)
+    return executed
+
+
+def downgrade(target, echo=print):
+    """回退 target 之后已执行的迁移（倒序），返回回退的版本列表"""
+    done = applied()
+    reverted = []
+    for version, module in reversed(available()):
+        if version <= target or version not in done:
+            continue
+        echo(f'回退迁移 {version}：{module.description}')
+        with db.engine.begin() as conn:
+            module.downgrade(conn)
+            conn.execute(delete(SchemaMigration).where(SchemaMigration.version == version))
+        reverted.append(version)
+    return reverted
+
+
+def stamp(echo=print):
+    """把全部迁移登记为已执行但不执行（用于 create_all 新建的数据库），返回登记的版本列表"""
+    done = applied()
+    stamped = []
+    with db.engine.begin() as conn:
+        for version, module in available():
+            if version not in done:
+                conn.execute(insert(SchemaMigration).values(
+                    version=version, description=module.description, applied_time=datetime.now()
+                ))
+                stamped.append(version)
+    if stamped:
+        echo(f"登记迁移 {'、'.join(stamped)}（新建的数据库已包含这些改动）")
+    return stamped
+
+
+def ensure_schema(app):
+    """应用启动时检查数据库结构，返回 (状态, 耗时秒)：
+
+    current   最新迁移已执行，不做任何改动（只有一次查询）
+    created   空数据库，create_all 建表并登记全部迁移
+    outdated  已有数据库但迁移未执行完：create_all 补建缺少的表，提示执行 schema upgrade
+              （命令行仍可启动以执行 schema upgrade；服务入口由 require_current_schema 拒绝启动）
+    """
+    started = time.perf_counter()
+    with app.app_context():
+        target = latest()
+        try:
+            with db.engine.connect() as conn:
+                current = target is not None and conn.execute(
+                    select(SchemaMigration.version).where(SchemaMigration.version == target)
+                ).first() is not None
+        except Exception:
+            current = False  # schema_migration 表不存在
+        if current:
+            status = 'current'
+        elif not inspect(db.engine).has_table('medicine'):
+            db.create_all()
+            stamp(echo=app.logger.info)
+            status = 'created'
+        else:
+            db.create_all()
+            app.logger.warning('数据库结构不是最新版本（%s），请执行 flask --app run schema upgrade', target)
+            status = 'outdated'
+    return status, time.perf_counter() - started
+
+
+def require_current_schema(app):
+    """服务入口（run.py 开发服务器、wsgi.py）启动前调用：数据库结构不是最新版本时拒绝启动
+
+    模型已映射 v003/v004/v006 等迁移新增的列，未升级的数据库上进货、销售的查询都会出错，
+    与其启动后每个请求返回 500，不如启动时直接报错。命令行（flask --app run schema upgrade 等）
+    不经过这里，可以照常执行升级。
+    """
+    status, _ = app.extensions.get('schema_status', ('current', 0))
+    if status == 'outdated':
+        raise RuntimeError(f'数据库结构不是最新版本（{latest()}），请先执行 flask --app run schema upgrade'
+                           '（设置 SCHEMA_CHECK=0 可跳过检查）')
+
+
+# ---------------------------- 迁移中使用的工具函数 ----------------------------
+def _reflect(conn, table):
+    return Table(table, MetaData(), autoload_with=conn)
+
+
+def has_index(conn, table, name):
+    return any(index['name'] == name for index in inspect(conn).get_indexes(table))
+
+
+def create_index(conn, table, name, columns, unique=False):
+    """创建索引（已存在时跳过），返回是否新建"""
+    if has_index(conn, table, name):
+        return False
+    reflected = _reflect(conn, table)
+    db.Index(name, *[reflected.c[column] for column in columns], unique=unique).create(conn)
+    return True
+
+
+def drop_index(conn, table, name):
+    """删除索引（不存在时跳过），返回是否删除"""
+    if not has_index(conn, table, name):
+        return False
+    reflected = _reflect(conn, table)
+    next(index for index in reflected.indexes if index.name == name).drop(conn)
+    return True
+
+
+def has_column(conn, table, name):
+    return any(column['name'] == name for column in inspect(conn).get_columns(table))
+
+
+def add_column(conn, table, column):
+    """添加列（column 为 db.Column，已存在时跳过），返回是否新建"""
+    if has_column(conn, table, column.name):
+        return False
+    conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}'))
+    return True
+
+
+def drop_column(conn, table, name):
+    """删除列（不存在时跳过），返回是否删除"""
+    if not has_column(conn, table, name):
+        return False
+    conn.execute(text(f'ALTER TABLE {table} DROP COLUMN {name}'))
+    return True
+
+
+# ---------------------------- 命令行 ----------------------------
+schema_cli = AppGroup('schema', help='数据库结构版本管理')
+
+
+@schema_cli.command('status')
+def status_command():
+    """查看各迁移是否已执行"""
+    done = applied()
+    for version, module in available():
+        state = done[version].strftime('%Y-%m-%d %H:%M:%S') if version in done else '未执行'
+        click.echo(f'{version}  {state:<19}  {module.description}')
+
+
+@schema_cli.command('upgrade')
+@click.option('--to', 'target', default=None, help='升级到的版本（默认最新）')
+def upgrade_command(target):
+    """执行未执行的迁移"""
+    executed = upgrade(target, echo=click.echo)
+    click.echo(f'已执行 {len(executed)} 个迁移' if executed else '数据库结构已是最新版本')
+
+
+@schema_cli.command('stamp')
+def stamp_command():
+    """把全部迁移登记为已执行（数据库由 create_all / 创建数据库.sql 新建、已是最新结构时使用）"""
+    stamped = stamp(echo=click.echo)
+    click.echo(f'已登记 {len(stamped)} 个迁移' if stamped else '没有需要登记的迁移')
+
+
+@schema_cli.command('downgrade')
+@click.option('--to', 'target', required=True, help='回退到的版本（该版本保留，v000 表示全部回退）')
+def downgrade_command(target):
+    """回退迁移"""
+    reverted = downgrade(target, echo=click.echo)
+    click.echo(f'已回退 {len(reverted)} 个迁移' if reverted else '没有需要回退的迁移')
@@ -0,0 +1,26 @@
+"""仓库位置唯一约束（原 更新仓库唯一约束.sql）"""
+from sqlalchemy import func, inspect, select
+
+from app.migrations import _reflect, create_index, drop_index
+
+description = '仓库位置（warehouse.location）唯一约束'
+
+
+def upgrade(conn):
+    inspector = inspect(conn)
+    # 新建的数据库由模型 unique=True 创建了唯一约束，不再重复添加
+    if any(c['column_names'] == ['location'] for c in inspector.get_unique_constraints('warehouse')) or \
+            any(i['unique'] and i['column_names'] == ['location'] for i in inspector.get_indexes('warehouse')):
+        return
+    warehouse = _reflect(conn, 'warehouse')
+    duplicates = conn.execute(
+        select(warehouse.c.location).where(warehouse.c.location.isnot(None))
+        .group_by(warehouse.c.location).having(func.count() > 1)
+    ).scalars().all()
+    if duplicates:
+        raise RuntimeError(f"仓库位置存在重复，请先修改后再执行迁移：{'、'.join(duplicates)}")
+    create_index(conn, 'warehouse', 'uk_warehouse_location', ['location'], unique=True)
+
+
+def downgrade(conn):
+    drop_index(conn, 'warehouse', 'uk_warehouse_location')
@@ -0,0 +1,25 @@
+"""入库、出库、库存、报表常用查询的覆盖索引（与模型中声明的索引一致，新建的数据库已包含）"""
+from app.migrations import create_index, drop_index
+
+description = '采购单、销售单、明细、药品库存的查询索引'
+
+INDEXES = [
+    # (表, 索引名, 列)
+    ('purchase', 'idx_purchase_date_audit', ['purchase_date', 'audit_status', 'supplier_id']),
+    ('sale', 'idx_sale_date_audit', ['sale_date', 'audit_status', 'warehouse_id']),
+    ('sale', 'idx_sale_customer_phone', ['customer_phone']),
+    ('purchase_detail', 'idx_purchase_detail_order', ['purchase_id', 'medicine_id', 'quantity', 'unit_price']),
+    ('purchase_detail', 'idx_purchase_detail_medicine_price', ['medicine_id', 'unit_price']),
+    ('sale_detail', 'idx_sale_detail_order', ['sale_id', 'medicine_id', 'quantity', 'amount']),
+    ('medicine', 'idx_medicine_stock', ['stock', 'min_stock']),
+]
+
+
+def upgrade(conn):
+    for table, name, columns in INDEXES:
+        create_index(conn, table, name, columns)
+
+
+def downgrade(conn):
+    for table, name, _ in reversed(INDEXES):
+        drop_index(conn, table, name)
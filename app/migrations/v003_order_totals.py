@@ -0,0 +1,43 @@
+"""采购单、销售单主表的汇总字段（明细行数、总数量；总金额字段已有但未维护），按明细回填
+
+回填语句按迁移编写时的表结构写成固定 SQL，不引用模型和业务代码（之后修改 order_totals 不影响本迁移）。
+"""
+from sqlalchemy import text
+
+from app import db
+from app.migrations import add_column, drop_column
+
+description = '采购单、销售单主表汇总字段（总金额、明细行数、总数量）'
+
+TABLES = [
+    # (主表, 明细表, 单号列)
+    ('purchase', 'purchase_detail', 'purchase_id'),
+    ('sale', 'sale_detail', 'sale_id'),
+]
+
+COLUMNS = [
+    ('line_count', db.Integer),  # 明细行数
+    ('total_quantity', db.Integer),  # 总数量
+]
+
+# 早期通过 API 新增的明细没有写金额，按 数量×单价 计算
+BACKFILL = """
+UPDATE {header} SET
+    line_count = (SELECT COUNT(*) FROM {detail} d WHERE d.{key} = {header}.{key}),
+    total_quantity = COALESCE((SELECT SUM(d.quantity) FROM {detail} d WHERE d.{key} = {header}.{key}), 0),
+    total_amount = COALESCE((SELECT ROUND(SUM(COALESCE(d.amount, d.quantity * d.unit_price)), 2)
+                             FROM {detail} d WHERE d.{key} = {header}.{key}), 0)
+"""
+
+
+def upgrade(conn):
+    for header, detail, key in TABLES:
+        for name, type_ in COLUMNS:
+            add_column(conn, header, db.Column(name, type_, server_default='0'))
+        conn.execute(text(BACKFILL.format(header=header, detail=detail, key=key)))
+
+
+def downgrade(conn):
+    for header, _, _ in TABLES:
+        for name, _ in reversed(COLUMNS):
+            drop_column(conn, header, name)
@@ -0,0 +1,17 @@
+"""采购单、销售单的版本号（乐观锁，编辑保存时检查）"""
+from app import db
+from app.migrations import add_column, drop_column
+
+description = '采购单、销售单版本号（乐观锁）'
+
+TABLES = ['purchase', 'sale']
+
+
+def upgrade(conn):
+    for table in TABLES:
+        add_column(conn, table, db.Column('version', db.Integer, nullable=False, server_default='1'))
+
+
+def downgrade(conn):
+    for table in TABLES:
+        drop_column(conn, table, 'version')
@@ -0,0 +1,12 @@
+"""接口幂等键表（新增采购单/销售单接口的 Idempotency-Key）"""
+from app.models import IdempotencyKey
+
+description = '接口幂等键表'
+
+
+def upgrade(conn):
+    IdempotencyKey.__table__.create(conn, checkfirst=True)
+
+
+def downgrade(conn):
+    IdempotencyKey.__table__.drop(conn, checkfirst=True)
@@ -0,0 +1,17 @@
+"""采购单、销售单的审核时间（分析导出据此重导已封存月份中新审核、修改的单据）"""
+from app import db
+from app.migrations import add_column, drop_column
+
+description = '采购单、销售单审核时间'
+
+TABLES = ['purchase', 'sale']
+
+
+def upgrade(conn):
+    for table in TABLES:
+        add_column(conn, table, db.Column('audit_time', db.DateTime))
+
+
+def downgrade(conn):
+    for table in TABLES:
+        drop_column(conn, table, 'audit_time')
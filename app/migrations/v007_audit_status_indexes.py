@@ -0,0 +1,20 @@
+"""以审核状态开头的索引：首页待审核采购单、销售单计数（audit_status = 0）只读索引范围，不扫描整表"""
+from app.migrations import create_index, drop_index
+
+description = '采购单、销售单 审核状态+日期 索引'
+
+INDEXES = [
+    # (表, 索引名, 列)
+    ('purchase', 'idx_purchase_audit_date', ['audit_status', 'purchase_date']),
+    ('sale', 'idx_sale_audit_date', ['audit_status', 'sale_date']),
+]
+
+
+def upgrade(conn):
+    for table, name, columns in INDEXES:
+        create_index(conn, table, name, columns)
+
+
+def downgrade(conn):
+    for table, name, _ in reversed(INDEXES):
+        drop_index(conn, table, name)
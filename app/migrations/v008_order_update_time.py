@@ -0,0 +1,23 @@
+"""采购单、销售单的修改时间（每次保存更新，分析导出据此重导已封存月份中修改过的单据）
+
+已有单据按 审核时间/创建时间 回填。
+"""
+from sqlalchemy import text
+
+from app import db
+from app.migrations import add_column, drop_column
+
+description = '采购单、销售单修改时间'
+
+TABLES = ['purchase', 'sale']
+
+
+def upgrade(conn):
+    for table in TABLES:
+        add_column(conn, table, db.Column('update_time', db.DateTime))
+        conn.execute(text(f'UPDATE {table} SET update_time = COALESCE(audit_time, create_time) WHERE update_time IS NULL'))
+
+
+def downgrade(conn):
+    for table in TABLES:
+        drop_column(conn, table, 'update_time')
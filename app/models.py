@@ -83,6 +83,7 @@ class Medicine(db.Model):
     __table_args__ = (
         db.UniqueConstraint('name', 'specification', name='uq_medicine_name_spec'),
         db.Index('idx_medicine_name', 'name'),  # 查询优化索引
+        db.Index('idx_medicine_stock', 'stock', 'min_stock'),  # 低库存预警、按库存排序（覆盖索引）
     )
 
 
@@ -93,14 +94,29 @@ class Purchase(db.Model):
     supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'))  # 关联供应商
     warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'))  # 关联仓库
     purchase_date = db.Column(db.Date, nullable=False)  # 采购日期
-    total_amount = db.Column(db.Float, default=0)  # 总金额
+    total_amount = db.Column(db.Float, default=0)  # 总金额（明细金额合计，随明细同事务维护）
+    line_count = db.Column(db.Integer, default=0)  # 明细行数
+    total_quantity = db.Column(db.Integer, default=0)  # 总数量
     remark = db.Column(db.Text)  # 备注
     audit_status = db.Column(db.Integer, default=0)  # 审核状态（0=待审核，1=已审核，2=已驳回）
+    audit_time = db.Column(db.DateTime)  # 审核时间（审核状态改为已审核时记录）
     create_time = db.Column(db.DateTime, default=datetime.now)
+    update_time = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)  # 修改时间（每次保存更新，分析导出据此重导已封存月份）
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # 版本号（乐观锁，每次保存加一）
 
     # 关联采购明细
     details = db.relationship('PurchaseDetail', backref='purchase', lazy=True)
 
+    # 更新时 WHERE version = 加载时的版本号；版本号由 check_version() 在保存时加一
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
+
+    __table_args__ = (
+        # 列表按日期倒序、入库统计按 日期范围+已审核 汇总到供应商（覆盖索引）
+        db.Index('idx_purchase_date_audit', 'purchase_date', 'audit_status', 'supplier_id'),
+        # 首页待审核数、按审核状态筛选的列表（按日期倒序）
+        db.Index('idx_purchase_audit_date', 'audit_status', 'purchase_date'),
+    )
+
 # 为了兼容旧路由代码，在类定义后添加字段别名
 Purchase.inbound_date = Purchase.purchase_date
 Purchase.inbound_id = Purchase.purchase_id
@@ -119,6 +135,11 @@ class PurchaseDetail(db.Model):
     unit_price = db.Column(db.Float, nullable=False)  # 采购单价
     amount = db.Column(db.Float)  # 金额（数量×单价）
 
+    __table_args__ = (
+        db.Index('idx_purchase_detail_order', 'purchase_id', 'medicine_id', 'quantity', 'unit_price'),  # 按单汇总数量、金额
+        db.Index('idx_purchase_detail_medicine_price', 'medicine_id', 'unit_price'),  # 库存汇总按药品取平均采购价
+    )
+
 
 # 8. 销售出库单主表（对应 Sale）
 class Sale(db.Model):
@@ -129,14 +150,29 @@ class Sale(db.Model):
     prescription_no = db.Column(db.String(50))  # 处方单号（处方药需要）
     warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'))  # 关联仓库
     sale_date = db.Column(db.Date, nullable=False)  # 销售日期
-    total_amount = db.Column(db.Float, default=0)  # 总金额
+    total_amount = db.Column(db.Float, default=0)  # 总金额（明细金额合计，随明细同事务维护）
+    line_count = db.Column(db.Integer, default=0)  # 明细行数
+    total_quantity = db.Column(db.Integer, default=0)  # 总数量
     remark = db.Column(db.Text)  # 备注
     audit_status = db.Column(db.Integer, default=0)  # 审核状态
+    audit_time = db.Column(db.DateTime)  # 审核时间（审核状态改为已审核时记录）
     create_time = db.Column(db.DateTime, default=datetime.now)
+    update_time = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)  # 修改时间（每次保存更新，分析导出据此重导已封存月份）
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # 版本号（乐观锁，每次保存加一）
 
     # 关联销售明细
     details = db.relationship('SaleDetail', backref='sale', lazy=True)
 
+    # 更新时 WHERE version = 加载时的版本号；版本号由 check_version() 在保存时加一
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
+
+    __table_args__ = (
+        # 列表按日期倒序、日汇总对账按 日期范围+已审核 分仓库汇总（覆盖索引）
+        db.Index('idx_sale_date_audit', 'sale_date', 'audit_status', 'warehouse_id'),
+        db.Index('idx_sale_audit_date', 'audit_status', 'sale_date'),  # 首页待审核数、按审核状态筛选的列表
+        db.Index('idx_sale_customer_phone', 'customer_phone'),  # 按客户电话查询
+    )
+
 # 为了兼容旧路由代码，在类定义后添加字段别名
 Sale.outbound_date = Sale.sale_date
 Sale.outbound_id = Sale.sale_id
@@ -153,6 +189,10 @@ class SaleDetail(db.Model):
     unit_price = db.Column(db.Float, nullable=False)  # 销售单价
     amount = db.Column(db.Float)  # 金额（数量×单价）
 
+    __table_args__ = (
+        db.Index('idx_sale_detail_order', 'sale_id', 'medicine_id', 'quantity', 'amount'),  # 按单读取明细、日汇总对账
+    )
+
 
 # 10. 库存盘点主表（对应 StockCheck）
 class StockCheck(db.Model):
@@ -201,6 +241,166 @@ class User(db.Model):
         return check_password_hash(self.password, password)
 
 
+# 13. 库存批次表（对应 StockLot，采购单审核通过时按明细生成）
+class StockLot(db.Model):
+    __tablename__ = 'stock_lot'
+    id = db.Column(db.Integer, primary_key=True)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), nullable=False)  # 关联药品
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'))  # 所在仓库
+    purchase_id = db.Column(db.String(50), db.ForeignKey('purchase.purchase_id'))  # 来源采购单
+    production_batch = db.Column(db.String(50))  # 生产批次
+    production_date = db.Column(db.Date)  # 生产日期
+    expiry_date = db.Column(db.Date)  # 有效期
+    quantity = db.Column(db.Integer, nullable=False)  # 入库数量
+    remaining = db.Column(db.Integer, nullable=False)  # 剩余数量
+    expiry_bucket = db.Column(db.String(10))  # 效期分组（expired/d30/d60/d90，90天以外或已用完为空）
+    create_time = db.Column(db.DateTime, default=datetime.now)
+
+    medicine = db.relationship('Medicine', backref=db.backref('lots', lazy=True))
+    warehouse = db.relationship('Warehouse', backref=db.backref('lots', lazy=True))
+
+    __table_args__ = (
+        db.Index('idx_lot_medicine_expiry', 'medicine_id', 'expiry_date'),  # 近效期先出（FEFO）按 药品+有效期 范围读取
+        db.Index('idx_lot_warehouse_bucket', 'warehouse_id', 'expiry_bucket'),  # 效期检查按 仓库+效期分组 读取
+    )
+
+
+# 14. 销售批次分配表（对应 SaleLotAllocation，记录销售单从哪些批次出库，用于撤销审核时归还）
+class SaleLotAllocation(db.Model):
+    __tablename__ = 'sale_lot_allocation'
+    id = db.Column(db.Integer, primary_key=True)
+    sale_id = db.Column(db.String(50), db.ForeignKey('sale.sale_id'), nullable=False, index=True)  # 关联销售单
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), nullable=False)  # 关联药品
+    lot_id = db.Column(db.Integer, db.ForeignKey('stock_lot.id'), nullable=False)  # 关联批次
+    quantity = db.Column(db.Integer, nullable=False)  # 分配数量
+
+    lot = db.relationship('StockLot', lazy=True)
+
+
+# 15. 效期分组汇总表（对应 ExpiryBucketStat，按 仓库+效期分组 汇总批次数和数量，随批次变动增量更新）
+class ExpiryBucketStat(db.Model):
+    __tablename__ = 'expiry_bucket_stat'
+    id = db.Column(db.Integer, primary_key=True)
+    warehouse_id = db.Column(db.Integer, nullable=False, default=0)  # 仓库ID（0=未指定仓库）
+    bucket = db.Column(db.String(10), nullable=False)  # 效期分组
+    lot_count = db.Column(db.Integer, nullable=False, default=0)  # 批次数
+    quantity = db.Column(db.Integer, nullable=False, default=0)  # 剩余数量合计
+    update_time = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint('warehouse_id', 'bucket', name='uq_expiry_bucket_warehouse'),
+    )
+
+
+# 16. 补货建议表（对应 ReorderSuggestion，由补货计算任务整表重写）
+class ReorderSuggestion(db.Model):
+    __tablename__ = 'reorder_suggestion'
+    id = db.Column(db.Integer, primary_key=True)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), nullable=False, unique=True)  # 关联药品
+    stock = db.Column(db.Integer, nullable=False)  # 计算时库存
+    min_stock = db.Column(db.Integer, nullable=False)  # 最低库存
+    avg_daily_demand = db.Column(db.Float, nullable=False)  # 近期日均销量（移动平均）
+    seasonal_factor = db.Column(db.Float, nullable=False)  # 季节系数（参考去年同期）
+    forecast_daily_demand = db.Column(db.Float, nullable=False)  # 预测日均销量
+    days_of_cover = db.Column(db.Float)  # 可售天数（无销量为空）
+    reorder_qty = db.Column(db.Integer, nullable=False)  # 建议补货数量
+    compute_time = db.Column(db.DateTime, default=datetime.now)
+
+    medicine = db.relationship('Medicine', lazy=True)
+
+
+# 17. 销售日汇总表（对应 SalesDailyRollup，日期×药品×仓库，冗余分类便于按分类汇总；随销售单审核增量更新）
+class SalesDailyRollup(db.Model):
+    __tablename__ = 'sales_daily_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    sale_date = db.Column(db.Date, nullable=False)  # 销售日期
+    medicine_id = db.Column(db.Integer, nullable=False)  # 药品ID
+    warehouse_id = db.Column(db.Integer, nullable=False, default=0)  # 仓库ID（0=未指定仓库）
+    category_id = db.Column(db.Integer, nullable=False, default=0)  # 药品分类ID（0=未分类）
+    quantity = db.Column(db.Integer, nullable=False, default=0)  # 销售数量
+    amount = db.Column(db.Float, nullable=False, default=0)  # 销售金额
+    line_count = db.Column(db.Integer, nullable=False, default=0)  # 明细行数
+
+    __table_args__ = (
+        db.UniqueConstraint('sale_date', 'medicine_id', 'warehouse_id', name='uq_rollup_day_medicine_warehouse'),
+        db.Index('idx_rollup_day_category', 'sale_date', 'category_id'),
+        db.Index('idx_rollup_day_warehouse', 'sale_date', 'warehouse_id'),
+    )
+
+
+# 18. 操作日志表（对应 OperationLog，按 log_date 分区：MySQL 上按月 RANGE 分区，由后台写入线程批量插入）
+class OperationLog(db.Model):
+    __tablename__ = 'operation_log'
+    log_id = db.Column(db.Integer, primary_key=True)
+    log_date = db.Column(db.Date, nullable=False)  # 日志日期（分区键）
+    operation_time = db.Column(db.DateTime, nullable=False, default=datetime.now)  # 操作时间
+    user_id = db.Column(db.Integer)  # 操作人ID（分区表不支持外键，不做关联约束）
+    username = db.Column(db.String(50))  # 操作人（冗余，便于展示）
+    operation = db.Column(db.String(50), nullable=False)  # 操作类型（如：采购入库、销售出库）
+    detail = db.Column(db.String(500))  # 操作详情
+    ip_address = db.Column(db.String(50))  # 操作IP
+
+    __table_args__ = (
+        db.Index('idx_log_date_time', 'log_date', 'operation_time'),  # 按日期范围分页（命中分区裁剪）
+        db.Index('idx_log_user_time', 'user_id', 'operation_time'),  # 按操作人查询
+    )
+
+# MySQL 分区表的主键必须包含分区列；建表后改为 (log_id, log_date) 并按月分区，其他数据库保持普通表
+db.event.listen(OperationLog.__table__, 'after_create', db.DDL(
+    "ALTER TABLE operation_log DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, log_date) "
+    "PARTITION BY RANGE COLUMNS(log_date) (PARTITION p_future VALUES LESS THAN (MAXVALUE))"
+).execute_if(dialect='mysql'))
+
+
+# 19. 后台任务表（对应 Job，导出/导入/报表等耗时操作提交后在后台线程执行，页面轮询进度）
+class Job(db.Model):
+    __tablename__ = 'job'
+    job_id = db.Column(db.String(32), primary_key=True)  # 任务ID（uuid）
+    kind = db.Column(db.String(50), nullable=False)  # 任务类型（如：database_export、report_inbound）
+    params = db.Column(db.Text)  # 任务参数（JSON）
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending/running/succeeded/failed/cancelled
+    progress = db.Column(db.Integer, nullable=False, default=0)  # 进度（0-100）
+    message = db.Column(db.String(255))  # 当前步骤说明
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)  # 是否已请求取消
+    result = db.Column(db.Text)  # 结果摘要（JSON）
+    result_file = db.Column(db.String(255))  # 结果文件路径
+    error = db.Column(db.Text)  # 失败原因
+    created_by = db.Column(db.Integer)  # 提交人ID
+    created_time = db.Column(db.DateTime, nullable=False, default=datetime.now)  # 提交时间
+    started_time = db.Column(db.DateTime)  # 开始时间
+    heartbeat_time = db.Column(db.DateTime)  # 最近一次进度更新时间（用于识别进程退出后遗留的任务）
+    finished_time = db.Column(db.DateTime)  # 结束时间
+
+    __table_args__ = (
+        db.Index('idx_job_status_created', 'status', 'created_time'),
+    )
+
+
+# 20. 数据库结构版本表（对应 SchemaMigration，记录已执行的迁移，见 app/migrations）
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migration'
+    version = db.Column(db.String(20), primary_key=True)  # 迁移版本（如：v002）
+    description = db.Column(db.String(200))  # 迁移说明
+    applied_time = db.Column(db.DateTime, nullable=False, default=datetime.now)  # 执行时间
+
+
+# 21. 接口幂等键表（对应 IdempotencyKey，新增采购单/销售单接口按 Idempotency-Key 记录首次请求的结果，见 app/services/idempotency.py）
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+    key_hash = db.Column(db.String(64), primary_key=True)  # sha256(用户ID + 接口 + Idempotency-Key)
+    endpoint = db.Column(db.String(50), nullable=False)  # 接口（如：api.add_inbound）
+    user_id = db.Column(db.Integer)  # 请求用户ID
+    request_hash = db.Column(db.String(64), nullable=False)  # 请求体 sha256（同一个键用于不同内容的请求时拒绝）
+    status = db.Column(db.String(20), nullable=False, default='processing')  # processing/completed
+    response_code = db.Column(db.Integer)  # 首次请求的响应状态码
+    response_body = db.Column(db.Text)  # 首次请求的响应内容（JSON）
+    created_time = db.Column(db.DateTime, nullable=False, default=datetime.now)  # 首次请求时间（超过窗口期后失效并清理）
+
+    __table_args__ = (
+        db.Index('idx_idempotency_created', 'created_time'),
+    )
+
+
 # ============================================================
 # 兼容层：为旧路由代码提供别名，避免导入错误
 # ============================================================
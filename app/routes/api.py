@@ -5,11 +5,28 @@ from app.models import (
     Material, Supplier, Warehouse,
     Inbound, InboundDetail, Outbound, OutboundDetail
 )
+from app.services import fefo, expiry, rollup, order_totals
+from app.services.oplog import oplog
+from app.services.concurrency import check_version, CONFLICT_ERRORS
+from app.services.idempotency import idempotency, idempotent
+from app.services.replica import read_replica
 
 api_bp = Blueprint("api", __name__, url_prefix="/api")
 
+
+def _conflict(model, id):
+    """单据已被其他用户修改：回滚，返回 409 和最新的主表数据（客户端按最新版本号重新提交）"""
+    db.session.rollback()
+    order = model.query.get_or_404(id)
+    current = {}
+    for column in model.__table__.columns:
+        value = getattr(order, column.name)
+        current[column.name] = value.isoformat() if hasattr(value, "isoformat") else value
+    return jsonify({"status": "conflict", "message": "单据已被其他用户修改，请按最新数据重新提交", "current": current}), 409
+
 # -------------------------- 物资管理接口 --------------------------
 @api_bp.route("/materials", methods=["GET"])
+@read_replica
 def get_materials():
     """查询物资（支持名称筛选）"""
     name = request.args.get("name", "")
@@ -59,8 +76,28 @@ def delete_material(id):
     db.session.commit()
     return jsonify({"status": "success"})
 
+# -------------------------- 效期检查接口 --------------------------
+@api_bp.route("/stock/expiry", methods=["GET"])
+@read_replica
+def get_stock_expiry():
+    """近效期/过期库存（读取效期分组汇总，可按 bucket、warehouse_id 查询批次明细）"""
+    warehouse_id = request.args.get("warehouse_id", type=int)
+    bucket = request.args.get("bucket", "")
+    data = {"summary": expiry.bucket_summary(warehouse_id)}
+    if bucket in expiry.BUCKET_NAMES:
+        data["lots"] = [{
+            "lot_id": lot.id,
+            "medicine_id": lot.medicine_id,
+            "warehouse_id": lot.warehouse_id,
+            "production_batch": lot.production_batch,
+            "expiry_date": lot.expiry_date.strftime("%Y-%m-%d") if lot.expiry_date else None,
+            "remaining": lot.remaining
+        } for lot in expiry.bucket_lots(bucket, warehouse_id)]
+    return jsonify(data)
+
 # -------------------------- 供应商管理接口 --------------------------
 @api_bp.route("/suppliers", methods=["GET"])
+@read_replica
 def get_suppliers():
     """查询供应商"""
     name = request.args.get("supplier_name", "")
@@ -112,6 +149,7 @@ def delete_supplier(id):
 
 # -------------------------- 仓库管理接口 --------------------------
 @api_bp.route("/warehouses", methods=["GET"])
+@read_replica
 def get_warehouses():
     """查询仓库"""
     warehouses = Warehouse.query.all()
@@ -153,6 +191,7 @@ def delete_warehouse(id):
 
 # -------------------------- 入库管理接口 --------------------------
 @api_bp.route("/inbounds", methods=["GET"])
+@read_replica
 def get_inbounds():
     """查询入库单"""
     inbound_id = request.args.get("inbound_id", "")
@@ -174,12 +213,17 @@ def get_inbounds():
         "name": i.warehouse.name if i.warehouse else "",
         "inbound_date": i.inbound_date.strftime("%Y-%m-%d"),
         "audit_status": ["未审核", "已通过", "已驳回"][i.audit_status],
+        "version": i.version,
+        "line_count": i.line_count or 0,
+        "total_quantity": i.total_quantity or 0,
+        "total_amount": i.total_amount or 0,
         "remark": i.remark or ""
     } for i in inbounds])
 
 @api_bp.route("/inbounds", methods=["POST"])
+@idempotent
 def add_inbound():
-    """添加入库单（主表+明细）"""
+    """添加入库单（主表+明细），带 Idempotency-Key 请求头时重试返回首次结果"""
     data = request.json
     # 生成单号：IN+20251114+001（日期+3位序号）
     today = datetime.now().strftime("%Y%m%d")
@@ -198,26 +242,42 @@ def add_inbound():
     db.session.add(new_inbound)
     
     # 添加明细+更新库存
+    details = []
     for item in data["details"]:
         detail = InboundDetail(
             purchase_id=inbound_id,  # 修正：使用purchase_id
             medicine_id=item["material_id"],  # 修正：使用medicine_id（参数名保持material_id以兼容API）
+            production_batch=item.get("production_batch"),
+            expiry_date=datetime.strptime(item["expiry_date"], "%Y-%m-%d").date() if item.get("expiry_date") else None,
             quantity=int(item["quantity"]),
-            unit_price=float(item["unit_price"])
+            unit_price=float(item["unit_price"]),
+            amount=int(item["quantity"]) * float(item["unit_price"])
         )
         db.session.add(detail)
+        details.append(detail)
         # 增加库存
         mat = Material.query.get(item["material_id"])
         mat.stock += int(item["quantity"])
+    order_totals.apply(new_inbound, details)
+    # 已审核时按明细生成批次（未审核的在审核通过时生成）
+    fefo.sync_purchase(new_inbound, None, details)
     
+    # 带 Idempotency-Key 时响应与单据同一事务写入
+    response = idempotency.record(jsonify({"status": "success", "inbound_id": inbound_id}))
     db.session.commit()
-    return jsonify({"status": "success"})
+    oplog.log("新增入库单", f"入库单 {inbound_id}（API）")
+    return response
 
 @api_bp.route("/inbounds/<string:id>", methods=["PUT"])
 def edit_inbound(id):
-    """编辑入库单（含审核状态）"""
+    """编辑入库单（含审核状态），传入 version 时检查是否已被他人修改（不一致返回 409）"""
     inbound = Inbound.query.get_or_404(id)
     data = request.json
+    try:
+        check_version(inbound, data.get("version"))
+    except CONFLICT_ERRORS:
+        return _conflict(Inbound, id)
+    old_audit_status = inbound.audit_status
     
     # 更新主表
     inbound.supplier_id = data["supplier_id"]
@@ -226,10 +286,20 @@ def edit_inbound(id):
     inbound.remark = data["remark"]
     inbound.audit_status = int(data["audit_status"])
     inbound.auditor_id = 1  # 默认管理员审核
-    inbound.audit_time = datetime.now()
+    if inbound.audit_status == 1 and old_audit_status != 1:
+        inbound.audit_time = datetime.now()
     
-    db.session.commit()
-    return jsonify({"status": "success"})
+    try:
+        # 审核状态变化时生成或撤销批次（与页面编辑相同）
+        fefo.sync_purchase(inbound, old_audit_status, InboundDetail.query.filter_by(purchase_id=id).all())
+        db.session.commit()
+    except CONFLICT_ERRORS:
+        return _conflict(Inbound, id)
+    except fefo.LotsConsumed as e:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 409
+    oplog.log("编辑入库单", f"入库单 {id}，审核状态 {inbound.audit_status}（API）")
+    return jsonify({"status": "success", "version": inbound.version})
 
 @api_bp.route("/inbounds/<string:id>", methods=["DELETE"])
 def delete_inbound(id):
@@ -241,14 +311,17 @@ def delete_inbound(id):
         mat = Material.query.get(d.medicine_id)  # 修正：使用medicine_id
         mat.stock -= d.quantity
         db.session.delete(d)
+    fefo.reverse_purchase(id)
     # 删除主表
     inbound = Inbound.query.get_or_404(id)
     db.session.delete(inbound)
     db.session.commit()
+    oplog.log("删除入库单", f"入库单 {id}（API）")
     return jsonify({"status": "success"})
 
 # -------------------------- 出库管理接口（逻辑类似入库） --------------------------
 @api_bp.route("/outbounds", methods=["GET"])
+@read_replica
 def get_outbounds():
     """查询出库单"""
     outbound_id = request.args.get("outbound_id", "")
@@ -270,12 +343,17 @@ def get_outbounds():
         "name": o.warehouse.name if o.warehouse else "",
         "outbound_date": o.outbound_date.strftime("%Y-%m-%d"),
         "audit_status": ["未审核", "已通过", "已驳回"][o.audit_status],
+        "version": o.version,
+        "line_count": o.line_count or 0,
+        "total_quantity": o.total_quantity or 0,
+        "total_amount": o.total_amount or 0,
         "remark": o.remark or ""
     } for o in outbounds])
 
 @api_bp.route("/outbounds", methods=["POST"])
+@idempotent
 def add_outbound():
-    """添加出库单"""
+    """添加出库单，带 Idempotency-Key 请求头时重试返回首次结果"""
     data = request.json
     # 生成单号：OUT+20251114+001
     today = datetime.now().strftime("%Y%m%d")
@@ -294,25 +372,46 @@ def add_outbound():
     db.session.add(new_outbound)
     
     # 添加明细+更新库存
+    details = []
     for item in data["details"]:
+        # 未传单价时使用药品零售价（与页面新增出库单一致）
+        mat = Material.query.get(item["material_id"])
+        unit_price = float(item["unit_price"]) if item.get("unit_price") is not None else mat.retail_price
         detail = OutboundDetail(
             sale_id=outbound_id,  # 修正：使用sale_id
             medicine_id=item["material_id"],  # 修正：使用medicine_id（参数名保持material_id以兼容API）
-            quantity=int(item["quantity"])
+            quantity=int(item["quantity"]),
+            unit_price=unit_price,
+            amount=int(item["quantity"]) * unit_price
         )
         db.session.add(detail)
+        details.append(detail)
         # 减少库存
-        mat = Material.query.get(item["material_id"])
         mat.stock -= int(item["quantity"])
+    order_totals.apply(new_outbound, details)
+    # 已审核时按近效期先出（FEFO）消耗批次（未审核的在审核通过时分配）
+    fefo.sync_sale(new_outbound, None, [(d.medicine_id, d.quantity) for d in details])
     
+    # 带 Idempotency-Key 时响应与单据同一事务写入
+    response = idempotency.record(jsonify({"status": "success", "outbound_id": outbound_id}))
     db.session.commit()
-    return jsonify({"status": "success"})
+    oplog.log("新增出库单", f"出库单 {outbound_id}（API）")
+    return response
 
 @api_bp.route("/outbounds/<string:id>", methods=["PUT"])
 def edit_outbound(id):
-    """编辑出库单"""
+    """编辑出库单，传入 version 时检查是否已被他人修改（不一致返回 409）"""
     outbound = Outbound.query.get_or_404(id)
     data = request.json
+    try:
+        check_version(outbound, data.get("version"))
+    except CONFLICT_ERRORS:
+        return _conflict(Outbound, id)
+    # 已审核的销售单先从销售日汇总中移出，按新状态重新计入
+    details = OutboundDetail.query.filter_by(sale_id=id).all()
+    old_audit_status = outbound.audit_status
+    if outbound.audit_status == 1:
+        rollup.apply_sale(outbound.outbound_date, outbound.warehouse_id, details, -1)
     
     outbound.dept_name = data["dept_name"]
     outbound.warehouse_id = data["warehouse_id"]
@@ -320,23 +419,36 @@ def edit_outbound(id):
     outbound.remark = data["remark"]
     outbound.audit_status = int(data["audit_status"])
     outbound.auditor_id = 1
-    outbound.audit_time = datetime.now()
+    if outbound.audit_status == 1 and old_audit_status != 1:
+        outbound.audit_time = datetime.now()
+    # 审核状态变化时归还或分配批次（与页面编辑相同）
+    fefo.sync_sale(outbound, old_audit_status, [(d.medicine_id, d.quantity) for d in details])
+    if outbound.audit_status == 1:
+        rollup.apply_sale(outbound.outbound_date, outbound.warehouse_id, details, 1)
     
-    db.session.commit()
-    return jsonify({"status": "success"})
+    try:
+        db.session.commit()
+    except CONFLICT_ERRORS:
+        return _conflict(Outbound, id)
+    oplog.log("编辑出库单", f"出库单 {id}，审核状态 {outbound.audit_status}（API）")
+    return jsonify({"status": "success", "version": outbound.version})
 
 @api_bp.route("/outbounds/<string:id>", methods=["DELETE"])
 def delete_outbound(id):
     """删除出库单"""
     # 删除明细
     details = OutboundDetail.query.filter_by(sale_id=id).all()  # 修正：使用sale_id
+    outbound = Outbound.query.get_or_404(id)
+    if outbound.audit_status == 1:
+        rollup.apply_sale(outbound.outbound_date, outbound.warehouse_id, details, -1)
     for d in details:
         # 增加库存
         mat = Material.query.get(d.medicine_id)  # 修正：使用medicine_id
         mat.stock += d.quantity
         db.session.delete(d)
+    fefo.release_sale(id)
     # 删除主表
-    outbound = Outbound.query.get_or_404(id)
     db.session.delete(outbound)
     db.session.commit()
+    oplog.log("删除出库单", f"出库单 {id}（API）")
     return jsonify({"status": "success"})
\ No newline at end of file
@@ -0,0 +1,243 @@
+"""异步只读接口（/api/async/）：药品、库存、单据查询，供门店终端和移动端高频轮询
+
+运行在 ASGI 下（入口 asgi.py，与 Flask 应用挂在同一个进程），查询使用异步驱动（app/services/async_db.py），
+等待数据库时不占用线程，一个进程可以同时保持数千个轮询连接。不经过 Flask，路由由下面的 Router 分发，
+登录状态从 Flask 的会话 Cookie 中读取（先在页面或 /auth/login 登录），未登录返回 401。
+
+    GET /api/async/medicines?keyword=&category_id=&low_stock=1&limit=&offset=   药品及当前库存
+    GET /api/async/medicines/<id>                                                 药品及各仓库有剩余的批次（按有效期）
+    GET /api/async/stock?medicine_id=&warehouse_id=                               按 药品+仓库 汇总的批次剩余数量
+    GET /api/async/inbounds?start_date=&end_date=&audit_status=&limit=           采购单（按日期倒序）
+    GET /api/async/inbounds/<id>                                                  采购单及明细
+    GET /api/async/outbounds?start_date=&end_date=&audit_status=&limit=          销售单（按日期倒序）
+    GET /api/async/outbounds/<id>                                                 销售单及明细
+"""
+import re
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app.models import Medicine, StockLot, Warehouse, Purchase, PurchaseDetail, Sale, SaleDetail, Supplier
+from app.services.async_db import async_db
+
+PREFIX = '/api/async'
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    """处理函数的参数：查询参数（同名取最后一个）、路径参数、当前用户"""
+
+    def __init__(self, path, params, path_params, user_id):
+        self.path = path
+        self.params = params
+        self.path_params = path_params
+        self.user_id = user_id
+
+    def int_param(self, name, default=None, maximum=None):
+        value = self.params.get(name, '')
+        if value == '':
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise HTTPError(400, f'参数 {name} 应为整数')
+        if value < 0:
+            raise HTTPError(400, f'参数 {name} 不能小于 0')
+        return min(value, maximum) if maximum is not None else value
+
+    def date_param(self, name):
+        value = self.params.get(name, '')
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise HTTPError(400, f'参数 {name} 应为 YYYY-MM-DD 格式的日期')
+
+    @property
+    def cache_key(self):
+        return self.path, tuple(sorted(self.params.items()))
+
+
+class Router:
+    """最小的路由：路径模式中的 <name> 匹配一段路径，<int:name> 匹配整数；只支持 GET"""
+
+    def __init__(self):
+        self.routes = []
+
+    def get(self, pattern):
+        integers = re.findall(r'<int:(\w+)>', pattern)
+        regex = re.sub(r'<(int:)?(\w+)>',
+                       lambda m: f'(?P<{m.group(2)}>\\d+)' if m.group(1) else f'(?P<{m.group(2)}>[^/]+)', pattern)
+
+        def decorator(handler):
+            self.routes.append((re.compile(f'^{regex}$'), integers, handler))
+            return handler
+        return decorator
+
+    def match(self, path):
+        """返回 (处理函数, 路径参数)，没有匹配的路由时返回 (None, None)"""
+        for regex, integers, handler in self.routes:
+            matched = regex.match(path)
+            if matched:
+                params = matched.groupdict()
+                return handler, {name: int(value) if name in integers else value for name, value in params.items()}
+        return None, None
+
+
+router = Router()
+
+
+def _cached(request, loader):
+    """相同路径和参数的查询在缓存期内复用结果"""
+    return async_db.cached(request.cache_key, loader)
+
+
+# ---------------------------- 药品、库存 ----------------------------
+@router.get('/medicines')
+async def list_medicines(request):
+    limit = request.int_param('limit', 100, async_db.max_rows)
+    offset = request.int_param('offset', 0)
+    stmt = select(Medicine.id, Medicine.name, Medicine.specification, Medicine.is_prescription,
+                  Medicine.stock, Medicine.min_stock, Medicine.retail_price)
+    keyword = request.params.get('keyword', '').strip()
+    if keyword:
+        stmt = stmt.where(Medicine.name.like(f'%{keyword}%'))
+    category_id = request.int_param('category_id')
+    if category_id is not None:
+        stmt = stmt.where(Medicine.category_id == category_id)
+    if request.params.get('low_stock') == '1':
+        stmt = stmt.where(Medicine.stock <= Medicine.min_stock)
+    stmt = stmt.order_by(Medicine.id).limit(limit).offset(offset)
+    return await _cached(request, lambda: async_db.fetch_all(stmt))
+
+
+@router.get('/medicines/<int:medicine_id>')
+async def medicine_detail(request):
+    medicine_id = request.path_params['medicine_id']
+
+    async def load():
+        medicine = await async_db.fetch_one(
+            select(Medicine.id, Medicine.name, Medicine.generic_name, Medicine.specification, Medicine.dosage_form,
+                   Medicine.manufacturer, Medicine.is_prescription, Medicine.stock, Medicine.min_stock,
+                   Medicine.retail_price).where(Medicine.id == medicine_id)
+        )
+        if medicine is None:
+            return None
+        medicine['lots'] = await async_db.fetch_all(
+            select(StockLot.id, StockLot.warehouse_id, Warehouse.name.label('warehouse_name'),
+                   StockLot.production_batch, StockLot.expiry_date, StockLot.remaining)
+            .outerjoin(Warehouse, StockLot.warehouse_id == Warehouse.id)
+            .where(StockLot.medicine_id == medicine_id, StockLot.remaining > 0)
+            .order_by(StockLot.expiry_date, StockLot.id).limit(async_db.max_rows)
+        )
+        return medicine
+
+    medicine = await _cached(request, load)
+    if medicine is None:
+        raise HTTPError(404, '药品不存在')
+    return medicine
+
+
+@router.get('/stock')
+async def stock_summary(request):
+    stmt = select(
+        StockLot.medicine_id, StockLot.warehouse_id,
+        func.sum(StockLot.remaining).label('quantity'),
+        func.count(StockLot.id).label('lot_count'),
+        func.min(StockLot.expiry_date).label('earliest_expiry'),
+    ).where(StockLot.remaining > 0)
+    medicine_id = request.int_param('medicine_id')
+    if medicine_id is not None:
+        stmt = stmt.where(StockLot.medicine_id == medicine_id)
+    warehouse_id = request.int_param('warehouse_id')
+    if warehouse_id is not None:
+        stmt = stmt.where(StockLot.warehouse_id == warehouse_id)
+    stmt = stmt.group_by(StockLot.medicine_id, StockLot.warehouse_id)\
+        .order_by(StockLot.medicine_id, StockLot.warehouse_id).limit(async_db.max_rows)
+    return await _cached(request, lambda: async_db.fetch_all(stmt))
+
+
+# ---------------------------- 单据 ----------------------------
+ORDERS = {
+    'inbounds': (Purchase, PurchaseDetail, Purchase.purchase_id, Purchase.purchase_date, PurchaseDetail.purchase_id,
+                 [Purchase.supplier_id, Supplier.name.label('supplier_name')]),
+    'outbounds': (Sale, SaleDetail, Sale.sale_id, Sale.sale_date, SaleDetail.sale_id,
+                  [Sale.customer_name, Sale.customer_phone]),
+}
+
+
+def _order_columns(kind):
+    header, _, key, day, _, extra = ORDERS[kind]
+    return [key.label('order_id'), day.label('order_date'), header.warehouse_id, *extra, header.audit_status,
+            header.line_count, header.total_quantity, header.total_amount, header.version, header.remark]
+
+
+def _order_select(kind):
+    stmt = select(*_order_columns(kind))
+    if kind == 'inbounds':
+        stmt = stmt.outerjoin(Supplier, Purchase.supplier_id == Supplier.id)
+    return stmt
+
+
+async def _list_orders(request, kind):
+    header, _, _, day, _, _ = ORDERS[kind]
+    stmt = _order_select(kind)
+    start, end = request.date_param('start_date'), request.date_param('end_date')
+    if start:
+        stmt = stmt.where(day >= start)
+    if end:
+        stmt = stmt.where(day <= end)
+    audit_status = request.int_param('audit_status')
+    if audit_status is not None:
+        stmt = stmt.where(header.audit_status == audit_status)
+    stmt = stmt.order_by(day.desc(), ORDERS[kind][2].desc()).limit(request.int_param('limit', 50, async_db.max_rows))
+    return await _cached(request, lambda: async_db.fetch_all(stmt))
+
+
+async def _order_detail(request, kind):
+    _, detail, key, _, detail_key, _ = ORDERS[kind]
+    order_id = request.path_params['order_id']
+
+    async def load():
+        order = await async_db.fetch_one(_order_select(kind).where(key == order_id))
+        if order is None:
+            return None
+        order['details'] = await async_db.fetch_all(
+            select(detail.medicine_id, Medicine.name.label('medicine_name'), Medicine.specification,
+                   detail.quantity, detail.unit_price, detail.amount)
+            .outerjoin(Medicine, detail.medicine_id == Medicine.id)
+            .where(detail_key == order_id).order_by(detail.id)
+        )
+        return order
+
+    order = await _cached(request, load)
+    if order is None:
+        raise HTTPError(404, '单据不存在')
+    return order
+
+
+@router.get('/inbounds')
+async def list_inbounds(request):
+    return await _list_orders(request, 'inbounds')
+
+
+@router.get('/inbounds/<order_id>')
+async def inbound_detail(request):
+    return await _order_detail(request, 'inbounds')
+
+
+@router.get('/outbounds')
+async def list_outbounds(request):
+    return await _list_orders(request, 'outbounds')
+
+
+@router.get('/outbounds/<order_id>')
+async def outbound_detail(request):
+    return await _order_detail(request, 'outbounds')
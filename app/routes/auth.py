@@ -1,3 +1,4 @@
+import click
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from app import db
 from app.models import User
@@ -78,26 +79,41 @@ def logout():
 @auth_bp.route('/init_admin')
 def init_admin():
     """初始化管理员账户（仅用于首次安装）"""
-    # 检查是否已有管理员
-    admin = User.query.filter_by(username='admin').first()
-    if admin:
+    if not create_admin('admin123'):  # 默认密码：admin123
         flash('管理员账户已存在，无需重复创建', 'error')
         return redirect(url_for('auth.login'))
 
-    # 创建默认管理员账户
+    flash('管理员账户创建成功！用户名：admin，密码：admin123（请尽快修改密码）', 'success')
+    return redirect(url_for('auth.login'))
+
+
+def create_admin(password):
+    """创建默认管理员账户 admin（已存在时不做改动），返回是否新建"""
+    # 检查是否已有管理员
+    if User.query.filter_by(username='admin').first():
+        return False
+
     admin = User(
         username='admin',
         real_name='系统管理员',
         role='admin',
         is_active=1
     )
-    admin.set_password('admin123')  # 默认密码：admin123
+    admin.set_password(password)
 
     db.session.add(admin)
     db.session.commit()
+    return True
 
-    flash('管理员账户创建成功！用户名：admin，密码：admin123（请尽快修改密码）', 'success')
-    return redirect(url_for('auth.login'))
+
+@auth_bp.cli.command('init-admin')
+@click.option('--password', default='admin123', show_default=True, help='管理员初始密码')
+def init_admin_command(password):
+    """创建默认管理员账户（首次部署执行一次：flask --app run auth init-admin）"""
+    if create_admin(password):
+        click.echo('管理员账户创建成功，用户名：admin（请尽快修改密码）')
+    else:
+        click.echo('管理员账户已存在，无需重复创建')
 
 
 @auth_bp.route('/change_password', methods=['GET', 'POST'])
@@ -1,25 +1,26 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session, current_app, Response
 import subprocess
 import os
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import tempfile
 import glob
+import zipfile
+from app.services.jobs import jobs
+from app.services import backup  # 登记导出/导入任务
+from app.services.backup_store import SNAPSHOT_SUFFIX
 
 database_bp = Blueprint('database', __name__, url_prefix='/database')
 
-# 数据库配置（从 run.py 中获取）
-DB_HOST = 'localhost'
-DB_USER = 'root'
-DB_PASSWORD = 'root'
-DB_NAME = 'pharmacy_db'
+# 备份文件下载类型（按后缀）
+BACKUP_MIMETYPES = {'.sql': 'application/sql', '.gz': 'application/gzip', '.zst': 'application/zstd'}
 
-# 备份文件存储目录
-BACKUP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'backups')
 
-# 确保备份目录存在
-if not os.path.exists(BACKUP_DIR):
-    os.makedirs(BACKUP_DIR)
+def backup_dir():
+    """备份文件存储目录（BACKUP_DIR 配置，不存在时创建）"""
+    directory = current_app.config['BACKUP_DIR']
+    os.makedirs(directory, exist_ok=True)
+    return directory
 
 
 def find_mysql_bin():
@@ -78,21 +79,8 @@ def get_mysql_command(command_name):
 @database_bp.route('/manage')
 def database_manage():
     """数据库管理主页"""
-    # 获取已有的备份文件列表
-    backups = []
-    if os.path.exists(BACKUP_DIR):
-        for filename in os.listdir(BACKUP_DIR):
-            if filename.endswith('.sql'):
-                filepath = os.path.join(BACKUP_DIR, filename)
-                file_size = os.path.getsize(filepath) / 1024  # KB
-                file_time = datetime.fromtimestamp(os.path.getmtime(filepath))
-                backups.append({
-                    'filename': filename,
-                    'size': f"{file_size:.2f} KB",
-                    'time': file_time.strftime('%Y-%m-%d %H:%M:%S')
-                })
-    # 按时间倒序排列
-    backups.sort(key=lambda x: x['time'], reverse=True)
+    # 获取已有的备份列表（普通文件和去重快照，按时间倒序）
+    backups = backup.list_backups(backup_dir())
 
     # 检测 MySQL 安装路径
     mysql_bin = find_mysql_bin()
@@ -108,108 +96,15 @@ def database_manage():
 
 @database_bp.route('/export')
 def database_export():
-    """导出数据库（使用纯 Python 方案）"""
-    try:
-        from app import db
-        import pymysql
-
-        # 生成备份文件名（包含时间戳）
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_filename = f"pharmacy_db_backup_{timestamp}.sql"
-        backup_path = os.path.join(BACKUP_DIR, backup_filename)
-
-        # 连接数据库
-        connection = pymysql.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-            charset='utf8mb4'
-        )
-
-        with open(backup_path, 'w', encoding='utf8') as f:
-            cursor = connection.cursor()
-
-            # 写入 SQL 文件头部
-            f.write(f"-- MySQL Database Backup\n")
-            f.write(f"-- Database: {DB_NAME}\n")
-            f.write(f"-- Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"-- Generated by Pharmacy Management System\n\n")
-            f.write("SET NAMES utf8mb4;\n")
-            f.write("SET FOREIGN_KEY_CHECKS = 0;\n\n")
-
-            # 获取所有表名
-            cursor.execute("SHOW TABLES")
-            tables = [table[0] for table in cursor.fetchall()]
-
-            for table in tables:
-                # 写入表结构
-                f.write(f"-- ----------------------------\n")
-                f.write(f"-- Table structure for {table}\n")
-                f.write(f"-- ----------------------------\n")
-                f.write(f"DROP TABLE IF EXISTS `{table}`;\n")
-
-                cursor.execute(f"SHOW CREATE TABLE `{table}`")
-                create_table = cursor.fetchone()[1]
-                f.write(f"{create_table};\n\n")
-
-                # 写入表数据
-                cursor.execute(f"SELECT * FROM `{table}`")
-                rows = cursor.fetchall()
-
-                if rows:
-                    f.write(f"-- ----------------------------\n")
-                    f.write(f"-- Records of {table}\n")
-                    f.write(f"-- ----------------------------\n")
-
-                    # 获取列信息
-                    cursor.execute(f"SHOW COLUMNS FROM `{table}`")
-                    columns = [col[0] for col in cursor.fetchall()]
-
-                    for row in rows:
-                        values = []
-                        for value in row:
-                            if value is None:
-                                values.append('NULL')
-                            elif isinstance(value, (int, float)):
-                                values.append(str(value))
-                            elif isinstance(value, datetime):
-                                values.append(f"'{value.strftime('%Y-%m-%d %H:%M:%S')}'")
-                            else:
-                                # 转义特殊字符
-                                value_str = str(value).replace('\\', '\\\\').replace("'", "\\'")
-                                values.append(f"'{value_str}'")
-
-                        f.write(f"INSERT INTO `{table}` VALUES ({', '.join(values)});\n")
-
-                    f.write("\n")
-
-            # 写入文件尾部
-            f.write("SET FOREIGN_KEY_CHECKS = 1;\n")
-
-        cursor.close()
-        connection.close()
-
-        flash(f'数据库导出成功：{backup_filename}', 'success')
-        # 直接下载文件
-        return send_file(
-            backup_path,
-            as_attachment=True,
-            download_name=backup_filename,
-            mimetype='application/sql'
-        )
-
-    except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        flash(f'导出数据库时发生错误：{str(e)}', 'error')
-        print(f"导出错误详情：\n{error_detail}")  # 在控制台输出详细错误
-        return redirect(url_for('database.database_manage'))
+    """导出数据库（提交后台任务，完成后在任务页下载）"""
+    job_id = jobs.submit('database_export', user_id=session.get('user_id'))
+    flash('数据库导出已开始，完成后可在本页下载', 'success')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
 
 
 @database_bp.route('/import', methods=['POST'])
 def database_import():
-    """导入数据库（使用纯 Python 方案）"""
+    """导入数据库（上传文件保存后提交后台任务执行）"""
     if 'sql_file' not in request.files:
         flash('请选择要导入的SQL文件', 'error')
         return redirect(url_for('database.database_manage'))
@@ -219,71 +114,17 @@ def database_import():
         flash('未选择文件', 'error')
         return redirect(url_for('database.database_manage'))
 
-    if not file.filename.endswith('.sql'):
-        flash('只能导入 .sql 文件', 'error')
+    if not file.filename.endswith(backup.BACKUP_SUFFIXES):
+        flash('只能导入 .sql 文件（或 .sql.gz / .sql.zst 压缩文件）', 'error')
         return redirect(url_for('database.database_manage'))
 
-    try:
-        import pymysql
-
-        # 保存上传的文件到临时目录
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(tempfile.gettempdir(), filename)
-        file.save(temp_path)
-
-        # 读取 SQL 文件内容
-        with open(temp_path, 'r', encoding='utf8') as f:
-            sql_content = f.read()
-
-        # 连接数据库
-        connection = pymysql.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-            charset='utf8mb4'
-        )
-
-        cursor = connection.cursor()
-
-        # 分割并执行 SQL 语句
-        # 移除注释行
-        sql_lines = []
-        for line in sql_content.split('\n'):
-            line = line.strip()
-            if line and not line.startswith('--'):
-                sql_lines.append(line)
-
-        sql_content = ' '.join(sql_lines)
-
-        # 按分号分割 SQL 语句
-        statements = sql_content.split(';')
-
-        for statement in statements:
-            statement = statement.strip()
-            if statement:
-                try:
-                    cursor.execute(statement)
-                except Exception as e:
-                    # 某些语句可能失败，但继续执行
-                    print(f"执行 SQL 语句时出错（继续）: {str(e)}")
-
-        connection.commit()
-        cursor.close()
-        connection.close()
-
-        # 删除临时文件
-        os.remove(temp_path)
-
-        flash('数据库导入成功', 'success')
-
-    except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        flash(f'导入数据库时发生错误：{str(e)}', 'error')
-        print(f"导入错误详情：\n{error_detail}")
-
-    return redirect(url_for('database.database_manage'))
+    # 保存上传的文件到临时目录（文件名加随机前缀，避免并发导入互相覆盖），任务结束后删除
+    fd, temp_path = tempfile.mkstemp(prefix='import_', suffix=f'_{secure_filename(file.filename)}')
+    os.close(fd)
+    file.save(temp_path)
+    job_id = jobs.submit('database_import', user_id=session.get('user_id'), path=temp_path)
+    flash('数据库导入已开始', 'success')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
 
 
 @database_bp.route('/download/<filename>')
@@ -292,7 +133,31 @@ def database_download(filename):
     try:
         # 安全检查：确保文件名不包含路径遍历字符
         filename = secure_filename(filename)
-        filepath = os.path.join(BACKUP_DIR, filename)
+        filepath = os.path.join(backup_dir(), filename)
+
+        # 按表备份目录打包为 zip（数据文件已压缩，打包时不再压缩）
+        if filename.endswith(backup.TABLES_SUFFIX):
+            if not os.path.isdir(filepath):
+                flash('备份文件不存在', 'error')
+                return redirect(url_for('database.database_manage'))
+            archive = tempfile.TemporaryFile()
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+                for name in sorted(os.listdir(filepath)):
+                    zf.write(os.path.join(filepath, name), f'{filename}/{name}')
+            archive.seek(0)
+            return send_file(archive, as_attachment=True, download_name=f'{filename}.zip', mimetype='application/zip')
+
+        # 去重快照按清单逐块拼接，边读边发送
+        if filename.endswith(SNAPSHOT_SUFFIX):
+            store = backup.chunk_store(backup_dir())
+            if filename not in store.snapshots():
+                flash('备份文件不存在', 'error')
+                return redirect(url_for('database.database_manage'))
+            return Response(
+                store.iter_bytes(filename),
+                mimetype='application/sql',
+                headers={'Content-Disposition': f'attachment; filename={filename[:-len(SNAPSHOT_SUFFIX)]}.sql'}
+            )
 
         if not os.path.exists(filepath):
             flash('备份文件不存在', 'error')
@@ -302,7 +167,7 @@ def database_download(filename):
             filepath,
             as_attachment=True,
             download_name=filename,
-            mimetype='application/sql'
+            mimetype=BACKUP_MIMETYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
         )
     except Exception as e:
         flash(f'下载文件时发生错误：{str(e)}', 'error')
@@ -315,10 +180,8 @@ def database_delete(filename):
     try:
         # 安全检查
         filename = secure_filename(filename)
-        filepath = os.path.join(BACKUP_DIR, filename)
 
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if backup.delete_backup(backup_dir(), filename):
             flash(f'备份文件 {filename} 已删除', 'success')
         else:
             flash('备份文件不存在', 'error')
@@ -326,3 +189,26 @@ def database_delete(filename):
         flash(f'删除文件时发生错误：{str(e)}', 'error')
 
     return redirect(url_for('database.database_manage'))
+
+
+@database_bp.route('/restore/<filename>', methods=['POST'])
+def database_restore(filename):
+    """从备份列表中的备份恢复（提交后台任务，去重快照先拼接还原，按表备份并行导入）"""
+    filename = secure_filename(filename)
+    if not any(b['filename'] == filename for b in backup.list_backups(backup_dir())):
+        flash('备份文件不存在', 'error')
+        return redirect(url_for('database.database_manage'))
+    job_id = jobs.submit('database_restore', user_id=session.get('user_id'), filename=filename)
+    flash(f'正在从 {filename} 恢复数据库', 'success')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
+
+
+@database_bp.route('/analytics_export', methods=['POST'])
+def analytics_export():
+    """导出销售/采购历史为列式文件（默认增量：从上次导出的月份开始），提交后台任务执行"""
+    from app.services import analytics_export as exporter  # 登记导出任务
+
+    incremental = request.form.get('mode', 'incremental') != 'full'
+    job_id = jobs.submit('analytics_export', user_id=session.get('user_id'), incremental=incremental)
+    flash(f"分析数据{'增量' if incremental else '全量'}导出已开始", 'success')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
\ No newline at end of file
@@ -1,15 +1,25 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from app import db
 from app.models import Inbound, InboundDetail, Supplier, Warehouse, Material, MaterialCategory, Unit
+from app.services import fefo, export, order_totals
+from app.services.oplog import oplog
+from app.services.concurrency import check_version, CONFLICT_ERRORS
+from app.services.replica import read_replica
 from datetime import datetime
 
 inbound_bp = Blueprint('inbound', __name__, url_prefix='/inbound')
 
 
-# 1. 入库单列表页（带搜索）
-@inbound_bp.route('/list')
-def inbound_list():
-    keyword = request.args.get('keyword', '').strip()
+def _parse_date(value):
+    """解析表单日期（YYYY-MM-DD），空值或格式错误返回 None"""
+    try:
+        return datetime.strptime(value.strip(), '%Y-%m-%d').date()
+    except (AttributeError, ValueError):
+        return None
+
+
+def _inbound_query(keyword):
+    """入库单列表查询（列表页和导出共用）"""
     # 关联供应商和仓库，支持多字段搜索
     query = Inbound.query.join(Supplier).join(Warehouse)
     if keyword:
@@ -20,10 +30,52 @@ def inbound_list():
                 Warehouse.name.like(f'%{keyword}%')       # 仓库名称
             )
         )
-    inbounds = query.order_by(Inbound.inbound_date.desc()).all()  # 按日期倒序
+    return query
+
+
+def _edit_conflict(inbound_id):
+    """保存时发现单据已被其他用户修改：回滚本次修改，展示最新数据（409）"""
+    db.session.rollback()
+    flash('该采购单已被其他用户修改并保存，以下为最新数据，请核对后重新修改并保存', 'error')
+    return render_template(
+        'inbound_edit.html',
+        inbound=Inbound.query.get_or_404(inbound_id),
+        materials=Material.query.all(),
+        details=InboundDetail.query.filter_by(purchase_id=inbound_id).all(),
+        suppliers=Supplier.query.all(),
+        warehouses=Warehouse.query.all(),
+        today=datetime.now().strftime('%Y-%m-%d')
+    ), 409
+
+
+# 1. 入库单列表页（带搜索）
+@inbound_bp.route('/list')
+@read_replica
+def inbound_list():
+    keyword = request.args.get('keyword', '').strip()
+    inbounds = _inbound_query(keyword).order_by(Inbound.inbound_date.desc()).all()  # 按日期倒序
     return render_template('inbound_list.html', inbounds=inbounds, keyword=keyword)
 
 
+# 导出入库单（按明细行，CSV/XLSX，搜索条件与列表页相同）
+@inbound_bp.route('/export')
+def inbound_export():
+    query = _inbound_query(request.args.get('keyword', '').strip())\
+        .outerjoin(InboundDetail, InboundDetail.purchase_id == Inbound.purchase_id)\
+        .outerjoin(Material, InboundDetail.medicine_id == Material.id)\
+        .order_by(Inbound.inbound_date.desc(), Inbound.purchase_id, InboundDetail.id)\
+        .with_entities(Inbound.purchase_id, Inbound.purchase_date, Supplier.name, Warehouse.name,
+                       Inbound.audit_status, Material.name, Material.specification, InboundDetail.production_batch,
+                       InboundDetail.expiry_date, InboundDetail.quantity, InboundDetail.unit_price, InboundDetail.amount)
+    return export.export_response(
+        '入库单',
+        ['入库单号', '入库日期', '供应商', '仓库', '审核状态', '药品名称', '规格', '批号', '有效期至',
+         '数量', '单价', '金额'],
+        query, fmt=request.args.get('format', 'csv'),
+        row=lambda r: list(r[:4]) + [export.AUDIT_STATUS.get(r[4], '')] + list(r[5:])
+    )
+
+
 # 2. 新增入库单
 @inbound_bp.route('/add', methods=['GET', 'POST'])
 def inbound_add():
@@ -69,6 +121,7 @@ def inbound_add():
         try:
             db.session.add(new_inbound)
             db.session.commit()
+            oplog.log('新增入库单', f'入库单 {inbound_id}')
             flash('入库单创建成功，请添加明细', 'success')
             return redirect(url_for('inbound.inbound_edit', inbound_id=inbound_id))
         except Exception as e:
@@ -104,6 +157,12 @@ def inbound_edit(inbound_id):
 
     # POST提交处理
     else:
+        # 乐观锁：锁定单据并比较打开编辑页时的版本号（表单填写期间不加锁）
+        try:
+            check_version(inbound, request.form.get('version'))
+        except CONFLICT_ERRORS:
+            return _edit_conflict(inbound_id)
+
         # 处理入库日期（核心：确保有效）
         inbound_date_str = request.form.get('inbound_date', '').strip()
         try:
@@ -130,6 +189,8 @@ def inbound_edit(inbound_id):
         inbound.remark = request.form.get('remark')
         new_audit_status = int(request.form.get('audit_status', 0))
         inbound.audit_status = new_audit_status
+        if new_audit_status == 1 and old_audit_status != 1:
+            inbound.audit_time = datetime.now()
 
         # 处理明细（先删旧明细，再添新明细）
         InboundDetail.query.filter_by(purchase_id=inbound_id).delete()  # 修正：使用purchase_id
@@ -140,6 +201,9 @@ def inbound_edit(inbound_id):
         material_specs = request.form.getlist('material_specification[]')
         quantities = request.form.getlist('quantity[]')
         prices = request.form.getlist('unit_price[]')
+        batches = request.form.getlist('production_batch[]')
+        expiry_dates = request.form.getlist('expiry_date[]')
+        new_details = []
 
         for i, (qty, price) in enumerate(zip(quantities, prices)):
             if not qty or not price:
@@ -190,21 +254,32 @@ def inbound_edit(inbound_id):
             detail = InboundDetail(
                 purchase_id=inbound_id,  # 修正：使用purchase_id
                 medicine_id=mat.id,  # 修正：使用medicine_id
+                production_batch=(batches[i].strip() or None) if i < len(batches) else None,  # 生产批次
+                expiry_date=_parse_date(expiry_dates[i]) if i < len(expiry_dates) else None,  # 有效期
                 quantity=qty,
                 unit_price=price,
                 amount=qty * price  # 计算金额
             )
             db.session.add(detail)
+            new_details.append(detail)
 
             # 如果新状态是已审核，则增加库存
             if new_audit_status == 1:
                 mat.stock += qty
 
+        # 主表汇总字段随明细一起提交
+        order_totals.apply(inbound, new_details)
+
         # 保存更新
         try:
+            # 审核状态变化时生成或撤销批次（用于近效期先出；批次已出库时不能撤销审核或修改明细）
+            fefo.sync_purchase(inbound, old_audit_status, new_details)
             db.session.commit()
+            oplog.log('编辑入库单', f'入库单 {inbound_id}，审核状态 {new_audit_status}，明细 {len(new_details)} 条')
             flash('入库单更新成功', 'success')
             return redirect(url_for('inbound.inbound_list'))
+        except CONFLICT_ERRORS:
+            return _edit_conflict(inbound_id)
         except Exception as e:
             db.session.rollback()
             flash(f'更新失败：{str(e)}', 'error')
@@ -240,11 +315,13 @@ def inbound_delete(inbound_id):
                 mat = Material.query.get(detail.medicine_id)
                 if mat:
                     mat.stock -= detail.quantity
+            fefo.reverse_purchase(inbound_id)
 
         # 先删明细，再删主单
         InboundDetail.query.filter_by(purchase_id=inbound_id).delete()
         db.session.delete(inbound)
         db.session.commit()
+        oplog.log('删除入库单', f'入库单 {inbound_id}')
         flash('入库单已删除', 'success')
     except Exception as e:
         db.session.rollback()
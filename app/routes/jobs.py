@@ -0,0 +1,66 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, abort
+import os
+from app.models import Job
+from app.services.jobs import jobs, job_dict
+
+# 后台任务蓝图，路由前缀：/jobs
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+JOB_KINDS = {
+    'database_export': '数据库导出',
+    'database_import': '数据库导入',
+    'database_backup': '定时备份',
+    'database_restore': '从备份恢复',
+    'analytics_export': '分析数据导出',
+    'report_inbound': '入库统计报表',
+    'report_stock_summary': '库存汇总报表',
+    'sales_reconcile': '销售日汇总重建',
+    'order_totals_backfill': '单据汇总字段回填',
+}
+JOB_STATUS = {'pending': '排队中', 'running': '运行中', 'succeeded': '已完成', 'failed': '失败', 'cancelled': '已取消'}
+
+
+def _wants_json():
+    return request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json'
+
+
+# 1. 任务列表（最近提交的任务）
+@jobs_bp.route('/')
+def job_list():
+    recent = Job.query.order_by(Job.created_time.desc()).limit(100).all()
+    if _wants_json():
+        return jsonify([job_dict(job) for job in recent])
+    return render_template('job_list.html', jobs=recent, kinds=JOB_KINDS, statuses=JOB_STATUS)
+
+
+# 2. 任务详情（页面每2秒轮询 ?format=json，完成后跳转 next 或提供结果下载）
+@jobs_bp.route('/<string:job_id>')
+def job_detail(job_id):
+    job = Job.query.get_or_404(job_id)
+    if _wants_json():
+        return jsonify(job_dict(job))
+    # 完成后跳转的地址只接受站内路径
+    next_url = request.args.get('next', '')
+    if not next_url.startswith('/') or next_url.startswith('//'):
+        next_url = ''
+    return render_template('job_detail.html', job=job, kinds=JOB_KINDS, statuses=JOB_STATUS, next_url=next_url)
+
+
+# 3. 取消任务
+@jobs_bp.route('/<string:job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    Job.query.get_or_404(job_id)
+    cancelled = jobs.cancel(job_id)
+    if _wants_json():
+        return jsonify({'status': 'success' if cancelled else 'error'}), 200 if cancelled else 409
+    flash('已请求取消任务' if cancelled else '任务已结束，无法取消', 'success' if cancelled else 'error')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
+
+
+# 4. 下载结果文件
+@jobs_bp.route('/<string:job_id>/download')
+def job_download(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.status != 'succeeded' or not job.result_file or not os.path.exists(job.result_file):
+        abort(404)
+    return send_file(job.result_file, as_attachment=True, download_name=os.path.basename(job.result_file))
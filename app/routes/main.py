@@ -1,4 +1,5 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, jsonify
+from app.services.dashboard import dashboard
 
 # 蓝图名称为'main'，总导航页为根路径
 main_bp = Blueprint('main', __name__)
@@ -6,4 +7,9 @@ main_bp = Blueprint('main', __name__)
 # 访问 http://127.0.0.1:5000 时显示总导航页
 @main_bp.route('/')
 def index():
-    return render_template('index.html')  # 对应上面的总导航模板
\ No newline at end of file
+    return render_template('index.html')  # 对应上面的总导航模板
+
+# 首页 KPI（JSON，页面加载后一次请求获取；结果缓存，单据改动后刷新）
+@main_bp.route('/dashboard/kpi')
+def dashboard_kpi():
+    return jsonify(dashboard.kpis())
\ No newline at end of file
@@ -1,15 +1,16 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, send_from_directory
+from werkzeug.utils import secure_filename
 from app import db  # 你的数据库实例
-from app.models import Material, MaterialCategory  # 导入分类模型用于关联查询
+from app.models import Material, MaterialCategory, Unit  # 导入分类模型用于关联查询
+from app.services import catalog_import, export
 from sqlalchemy.exc import IntegrityError, DataError  # 导入异常
+import time
 
 # 物资模块蓝图，路由前缀：/material
 material_bp = Blueprint('material', __name__, url_prefix='/material')
 
-# 1. 物资列表页（支持多字段搜索）
-@material_bp.route('/list')
-def material_list():
-    keyword = request.args.get('keyword', '').strip()
+def _material_query(keyword):
+    """药品列表查询（列表页和导出共用）"""
     query = Material.query.join(MaterialCategory, Material.category_id == MaterialCategory.id)  # 关联分类表
     if keyword:
         # 支持搜索：物资名称、规格、分类名称
@@ -20,9 +21,33 @@ def material_list():
                 MaterialCategory.name.like(f'%{keyword}%')
             )
         )
-    materials = query.all()
+    return query
+
+# 1. 物资列表页（支持多字段搜索）
+@material_bp.route('/list')
+def material_list():
+    keyword = request.args.get('keyword', '').strip()
+    materials = _material_query(keyword).all()
     return render_template('material_list.html', materials=materials, keyword=keyword)
 
+# 导出药品列表（CSV/XLSX，搜索条件与列表页相同）
+@material_bp.route('/export')
+def material_export():
+    query = _material_query(request.args.get('keyword', '').strip())\
+        .outerjoin(Unit, Material.unit_id == Unit.id)\
+        .order_by(Material.id)\
+        .with_entities(Material.id, Material.name, Material.specification, MaterialCategory.name, Unit.name,
+                       Material.generic_name, Material.approval_number, Material.dosage_form, Material.manufacturer,
+                       Material.is_prescription, Material.stock, Material.min_stock, Material.retail_price,
+                       Material.remark)
+    return export.export_response(
+        '药品列表',
+        ['ID', '药品名称', '规格', '分类', '单位', '通用名称', '批准文号', '剂型', '生产厂家',
+         '处方药', '当前库存', '最低库存', '零售价', '备注'],
+        query, fmt=request.args.get('format', 'csv'),
+        row=lambda r: list(r[:9]) + ['是' if r[9] else '否'] + list(r[10:])
+    )
+
 # 2. 新增物资页面（保持不变，仅确保表单字段正确）
 @material_bp.route('/add', methods=['GET', 'POST'])
 def material_add():
@@ -168,4 +193,39 @@ def material_delete(id):
     db.session.delete(mat)
     db.session.commit()
     flash('删除成功', 'success')
-    return redirect(url_for('material.material_list'))
\ No newline at end of file
+    return redirect(url_for('material.material_list'))
+
+# 5. 批量导入药品目录（CSV，按 名称+规格 新增或更新）
+@material_bp.route('/import', methods=['GET', 'POST'])
+def material_import():
+    if request.method == 'POST':
+        upload = request.files.get('catalog_file')
+        if not upload or not upload.filename:
+            flash('请选择目录文件', 'error')
+            return redirect(url_for('material.material_import'))
+
+        importer = catalog_import.CatalogImporter(
+            batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+            create_missing=bool(request.form.get('create_missing'))
+        )
+        started = time.time()
+        try:
+            result = importer.run(upload.stream)
+        except catalog_import.CatalogImportError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('material.material_import'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'导入失败：{str(e)}', 'error')
+            return redirect(url_for('material.material_import'))
+
+        result['seconds'] = round(time.time() - started, 2)
+        result['report'] = importer.write_error_report(current_app.config['IMPORT_REPORT_DIR'])
+        return render_template('material_import.html', result=result)
+
+    return render_template('material_import.html', result=None)
+
+# 6. 下载导入错误报告
+@material_bp.route('/import/report/<filename>')
+def material_import_report(filename):
+    return send_from_directory(current_app.config['IMPORT_REPORT_DIR'], secure_filename(filename), as_attachment=True)
\ No newline at end of file
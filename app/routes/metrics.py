@@ -0,0 +1,38 @@
+import os
+
+from flask import Blueprint, jsonify
+from app import db
+from app.services.db_pool import pool_status
+from app.services.oplog import oplog
+from app.services.jobs import jobs
+from app.services.replica import replica_router, REPLICA_BIND
+from app.services.report_cache import report_cache
+from app.services.dashboard import dashboard
+from app.services.idempotency import idempotency
+from app.services.ratelimit import rate_limiter
+from app.services.async_db import async_db
+from app.services.scheduler import scheduler
+from app.services import warmup
+
+# 运行指标蓝图，路由前缀：/metrics
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/metrics')
+
+
+@metrics_bp.route('/')
+def metrics_index():
+    """运行指标（JSON）：当前 worker、数据库连接池状态、只读副本、报表缓存、首页 KPI、操作日志写入队列、后台任务、接口幂等键、限流、异步只读接口"""
+    metrics = {
+        'worker': {'pid': os.getpid(), 'scheduler': scheduler.role(), 'warmup': warmup.stats},
+        'db_pool': pool_status(db.engine),
+        'replica': replica_router.status(),
+        'report_cache': report_cache.status(),
+        'dashboard': dashboard.status(),
+        'oplog': oplog.status(),
+        'jobs': jobs.status(),
+        'idempotency': idempotency.status(),
+        'rate_limit': rate_limiter.status(),
+        'async_api': async_db.status(),  # 只有通过 asgi.py 运行时才有查询
+    }
+    if replica_router.enabled:
+        metrics['replica']['db_pool'] = pool_status(db.engines[REPLICA_BIND])
+    return jsonify(metrics)
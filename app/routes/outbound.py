@@ -1,16 +1,18 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from app import db
 from app.models import Outbound, OutboundDetail, Warehouse, Material
+from app.services import fefo, rollup, export, order_totals
+from app.services.oplog import oplog
+from app.services.concurrency import check_version, CONFLICT_ERRORS
+from app.services.replica import read_replica
 from datetime import datetime
 
 # 预设部门列表
 DEPARTMENTS = ['采购部', '销售部', '财务部', '技术部', '仓储部', '人事部', '行政部', '市场部']
 outbound_bp = Blueprint('outbound', __name__, url_prefix='/outbound')
 
-# 出库单列表（带搜索）
-@outbound_bp.route('/list')
-def outbound_list():
-    keyword = request.args.get('keyword', '').strip()
+def _outbound_query(keyword):
+    """出库单列表查询（列表页和导出共用）"""
     query = Outbound.query.join(Warehouse)  # 关联仓库表
     if keyword:
         query = query.filter(
@@ -20,9 +22,46 @@ def outbound_list():
                 Warehouse.name.like(f'%{keyword}%') # 按仓库名称搜索
             )
         )
-    outbounds = query.order_by(Outbound.outbound_date.desc()).all()  # 按日期倒序
+    return query
+
+def _edit_conflict(outbound_id):
+    """保存时发现单据已被其他用户修改：回滚本次修改，展示最新数据（409）"""
+    db.session.rollback()
+    flash('该销售单已被其他用户修改并保存，以下为最新数据，请核对后重新修改并保存', 'error')
+    return render_template(
+        'outbound_edit.html',
+        outbound=Outbound.query.get_or_404(outbound_id),
+        materials=Material.query.all(),
+        details=OutboundDetail.query.filter_by(sale_id=outbound_id).all(),
+        warehouses=Warehouse.query.all(),
+        departments=DEPARTMENTS
+    ), 409
+
+# 出库单列表（带搜索）
+@outbound_bp.route('/list')
+@read_replica
+def outbound_list():
+    keyword = request.args.get('keyword', '').strip()
+    outbounds = _outbound_query(keyword).order_by(Outbound.outbound_date.desc()).all()  # 按日期倒序
     return render_template('outbound_list.html', outbounds=outbounds, keyword=keyword)
 
+# 导出出库单（按明细行，CSV/XLSX，搜索条件与列表页相同）
+@outbound_bp.route('/export')
+def outbound_export():
+    query = _outbound_query(request.args.get('keyword', '').strip())\
+        .outerjoin(OutboundDetail, OutboundDetail.sale_id == Outbound.sale_id)\
+        .outerjoin(Material, OutboundDetail.medicine_id == Material.id)\
+        .order_by(Outbound.outbound_date.desc(), Outbound.sale_id, OutboundDetail.id)\
+        .with_entities(Outbound.sale_id, Outbound.sale_date, Warehouse.name, Outbound.customer_name,
+                       Outbound.audit_status, Material.name, Material.specification,
+                       OutboundDetail.quantity, OutboundDetail.unit_price, OutboundDetail.amount)
+    return export.export_response(
+        '出库单',
+        ['出库单号', '出库日期', '仓库', '客户/部门', '审核状态', '药品名称', '规格', '数量', '单价', '金额'],
+        query, fmt=request.args.get('format', 'csv'),
+        row=lambda r: list(r[:4]) + [export.AUDIT_STATUS.get(r[4], '')] + list(r[5:])
+    )
+
 # 新增出库单（自动填充日期+物资下拉框）
 @outbound_bp.route('/add', methods=['GET', 'POST'])
 def outbound_add():
@@ -47,9 +86,9 @@ def outbound_add():
             audit_status=0  # 默认为未审核
         )
         db.session.add(new_outbound)
-        db.session.commit()
         
         # 添加明细（简化：直接从表单获取并添加，实际可跳转编辑页）
+        new_details = []
         material_id = request.form.get('material_id')
         quantity = request.form.get('quantity')
         if material_id and quantity:
@@ -64,8 +103,12 @@ def outbound_add():
                     amount=int(quantity) * medicine.retail_price  # 计算金额
                 )
                 db.session.add(detail)
-                db.session.commit()
+                new_details.append(detail)
+        # 主单、明细、汇总字段在同一事务中提交
+        order_totals.apply(new_outbound, new_details)
+        db.session.commit()
         
+        oplog.log('新增出库单', f'出库单 {outbound_id}')
         flash('出库单创建成功', 'success')
         # 跳转到编辑页（使用outbound_id作为参数，与路由匹配）
         return redirect(url_for('outbound.outbound_edit', outbound_id=new_outbound.outbound_id))
@@ -86,6 +129,12 @@ def outbound_edit(outbound_id):
     details = OutboundDetail.query.filter_by(sale_id=outbound_id).all()  # 修正：使用sale_id
 
     if request.method == 'POST':
+        # 乐观锁：锁定单据并比较打开编辑页时的版本号（表单填写期间不加锁）
+        try:
+            check_version(outbound, request.form.get('version'))
+        except CONFLICT_ERRORS:
+            return _edit_conflict(outbound_id)
+
         # 保存旧的审核状态和明细（用于库存回退）
         old_audit_status = outbound.audit_status
         old_details = OutboundDetail.query.filter_by(sale_id=outbound_id).all()
@@ -96,6 +145,8 @@ def outbound_edit(outbound_id):
                 mat = Material.query.get(old_detail.medicine_id)
                 if mat:
                     mat.stock += old_detail.quantity
+            # 同时从销售日汇总中移出（批次分配在保存明细后由 fefo.sync_sale 归还并重新分配）
+            rollup.apply_sale(outbound.outbound_date, outbound.warehouse_id, old_details, -1)
 
         # 更新出库单主信息
         outbound.warehouse_id = request.form.get('warehouse_id')
@@ -104,6 +155,8 @@ def outbound_edit(outbound_id):
         outbound.remark = request.form.get('remark')
         new_audit_status = int(request.form.get('audit_status', 0))
         outbound.audit_status = new_audit_status
+        if new_audit_status == 1 and old_audit_status != 1:
+            outbound.audit_time = datetime.now()
 
         # 先删除旧明细
         OutboundDetail.query.filter_by(sale_id=outbound_id).delete()  # 修正：使用sale_id
@@ -149,6 +202,8 @@ def outbound_edit(outbound_id):
                     return redirect(url_for('outbound.outbound_edit', outbound_id=outbound_id))
 
         # 添加新明细
+        sold_items = []
+        new_details = []
         for i, qty in enumerate(quantities):
             if not qty:
                 continue
@@ -182,12 +237,26 @@ def outbound_edit(outbound_id):
                 amount=qty * mat.retail_price  # 计算金额
             )
             db.session.add(detail)
+            new_details.append(detail)
 
             # 如果新状态是已审核，则扣减库存
             if new_audit_status == 1:
                 mat.stock -= qty
+                sold_items.append((mat.id, qty))
 
-        db.session.commit()
+        # 主表汇总字段随明细一起提交
+        order_totals.apply(outbound, new_details)
+
+        # 归还原批次分配，审核通过时按近效期先出（FEFO）消耗本仓库批次，并计入销售日汇总
+        fefo.sync_sale(outbound, old_audit_status, sold_items)
+        if new_audit_status == 1:
+            rollup.apply_sale(outbound.outbound_date, outbound.warehouse_id, new_details, 1)
+
+        try:
+            db.session.commit()
+        except CONFLICT_ERRORS:
+            return _edit_conflict(outbound_id)
+        oplog.log('编辑出库单', f'出库单 {outbound_id}，审核状态 {new_audit_status}，明细 {len(new_details)} 条')
         flash('出库单更新成功', 'success')
         return redirect(url_for('outbound.outbound_list'))
 
@@ -221,12 +290,15 @@ def outbound_delete(outbound_id):
                 mat = Material.query.get(detail.medicine_id)
                 if mat:
                     mat.stock += detail.quantity
+            fefo.release_sale(outbound_id)
+            rollup.apply_sale(outbound.outbound_date, outbound.warehouse_id, details, -1)
 
         # 先删除关联的明细
         OutboundDetail.query.filter_by(sale_id=outbound_id).delete()
         # 再删除主单
         db.session.delete(outbound)
         db.session.commit()
+        oplog.log('删除出库单', f'出库单 {outbound_id}')
         flash('出库单已删除', 'success')
     except Exception as e:
         db.session.rollback()
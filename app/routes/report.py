@@ -1,11 +1,121 @@
-from flask import Blueprint, render_template, request
+import json
+from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for, session
 from app import db
-from app.models import Inbound, InboundDetail, Outbound, OutboundDetail, Stock, Material, Supplier, Warehouse
+from app.models import Inbound, InboundDetail, Outbound, OutboundDetail, Material, Supplier, Warehouse, StockLot, Job
+from app.services import rollup
+from app.services import order_totals  # noqa: F401  登记 order_totals_backfill 任务
+from app.services.jobs import jobs
+from app.services.replica import read_replica
+from app.services.report_cache import report_cache
 from datetime import datetime, timedelta
 
 report_bp = Blueprint("report", __name__)
 
-# 入库统计报表
+def _job_result(job_id, kind):
+    """读取已完成的报表任务结果；任务未完成时返回 None"""
+    job = Job.query.get_or_404(job_id)
+    if job.kind != kind or job.status != "succeeded":
+        return None
+    return json.loads(job.result)
+
+
+def _submit_report(kind, endpoint, **params):
+    """提交报表任务，跳转到任务页轮询，完成后回到报表页展示结果"""
+    job_id = jobs.submit(kind, user_id=session.get("user_id"), **params)
+    return redirect(url_for("jobs.job_detail", job_id=job_id,
+                            next=url_for(endpoint, job=job_id, **params)))
+
+
+@jobs.register("report_inbound")
+@read_replica
+def inbound_report_job(ctx, start_date, end_date):
+    """入库统计：已审核采购单按供应商汇总（只读主表汇总字段，一次分组查询），结果写入报表缓存"""
+    epoch = report_cache.epoch
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    ctx.progress(10, "正在汇总入库数据")
+    rows = db.session.query(
+        Supplier.name,
+        db.func.count(Inbound.purchase_id),
+        db.func.coalesce(db.func.sum(Inbound.total_quantity), 0),
+        db.func.coalesce(db.func.sum(Inbound.total_amount), 0)
+    ).join(Inbound, Inbound.supplier_id == Supplier.id)\
+        .filter(Inbound.inbound_date.between(start, end), Inbound.audit_status == 1)\
+        .group_by(Supplier.id, Supplier.name).all()
+    result = [{
+        "name": name,
+        "count": count,  # 入库单数
+        "total_quantity": int(total_quantity),  # 总入库量
+        "total_amount": round(float(total_amount), 2)  # 总金额
+    } for name, count, total_quantity, total_amount in rows]
+    report_cache.put("report_inbound", result, ("purchase",), start, end, epoch,
+                     start_date=start_date, end_date=end_date)
+    return result
+
+
+@jobs.register("report_stock_summary")
+@read_replica
+def stock_summary_job(ctx):
+    """库存汇总：按仓库汇总批次库存（库存价值按药品平均采购单价估算），结果写入报表缓存
+
+    批次随采购单审核生成，系统上线前的历史库存没有批次（药品总库存仍以 Medicine.stock 为准），
+    药品总库存超出其批次剩余合计的部分单独汇总为"未分批"一行，合计与药品总库存一致。
+    """
+    epoch = report_cache.epoch
+    ctx.progress(10, "正在汇总库存数据")
+    avg_price = db.session.query(
+        InboundDetail.medicine_id.label("medicine_id"),
+        db.func.avg(InboundDetail.unit_price).label("unit_price")
+    ).group_by(InboundDetail.medicine_id).subquery()
+    rows = db.session.query(
+        Warehouse.name,
+        db.func.count(db.distinct(StockLot.medicine_id)),
+        db.func.coalesce(db.func.sum(StockLot.remaining), 0),
+        db.func.coalesce(db.func.sum(StockLot.remaining * avg_price.c.unit_price), 0)
+    ).outerjoin(StockLot, db.and_(StockLot.warehouse_id == Warehouse.id, StockLot.remaining > 0))\
+        .outerjoin(avg_price, avg_price.c.medicine_id == StockLot.medicine_id)\
+        .group_by(Warehouse.id, Warehouse.name).all()
+    result = [{
+        "name": name,
+        "material_count": material_count,  # 物资种类数
+        "total_stock": int(total_stock),  # 总库存数量
+        "total_value": round(float(total_value), 2)  # 库存总价值
+    } for name, material_count, total_stock, total_value in rows]
+
+    ctx.progress(60, "正在汇总未分批库存")
+    lot_stock = db.session.query(
+        StockLot.medicine_id.label("medicine_id"),
+        db.func.sum(StockLot.remaining).label("remaining")
+    ).filter(StockLot.remaining > 0).group_by(StockLot.medicine_id).subquery()
+    unbatched = Material.stock - db.func.coalesce(lot_stock.c.remaining, 0)
+    material_count, total_stock, total_value = db.session.query(
+        db.func.count(Material.id),
+        db.func.coalesce(db.func.sum(unbatched), 0),
+        db.func.coalesce(db.func.sum(unbatched * avg_price.c.unit_price), 0)
+    ).outerjoin(lot_stock, lot_stock.c.medicine_id == Material.id)\
+        .outerjoin(avg_price, avg_price.c.medicine_id == Material.id)\
+        .filter(unbatched > 0).one()
+    if material_count:
+        result.append({
+            "name": "未分批",
+            "material_count": material_count,
+            "total_stock": int(total_stock),
+            "total_value": round(float(total_value), 2)
+        })
+    # 批次库存随采购单审核生成、随销售单审核消耗，不限日期（盘点等直接修改药品库存的改动最长在缓存过期后体现）
+    report_cache.put("report_stock_summary", result, ("purchase", "sale"), epoch=epoch)
+    return result
+
+
+@jobs.register("sales_reconcile")
+def sales_reconcile_job(ctx, start_date, end_date):
+    ctx.progress(10, f"正在重建 {start_date} 至 {end_date} 的销售日汇总")
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    return {"rows": rollup.reconcile(start, end)}
+
+
+# 入库统计报表（命中缓存时直接展示；否则后台任务计算，完成后带 job 参数回到本页展示）
 @report_bp.route("/inbound")
 def inbound_report():
     # 按日期范围查询（默认近30天）
@@ -16,45 +126,75 @@ def inbound_report():
     if not end_date:
         end_date = datetime.now().strftime("%Y-%m-%d")
 
-    # 转换日期格式
-    start = datetime.strptime(start_date, "%Y-%m-%d").date()
-    end = datetime.strptime(end_date, "%Y-%m-%d").date()
-
-    # 查询该时间段内已审核的入库单
-    inbounds = Inbound.query.filter(Inbound.inbound_date.between(start, end), Inbound.audit_status == 1).all()
-    # 统计数据：按供应商分组
-    supplier_stats = {}
-    for inbound in inbounds:
-        supplier = Supplier.query.get(inbound.supplier_id)
-        details = InboundDetail.query.filter_by(purchase_id=inbound.purchase_id).all()  # 修正：使用purchase_id
-        total_amount = sum(d.quantity * d.unit_price for d in details)
-        if supplier.id not in supplier_stats:  # 修正：使用id
-            supplier_stats[supplier.id] = {
-                "name": supplier.name,  # 修正：使用name
-                "count": 0,  # 入库单数
-                "total_quantity": 0,  # 总入库量
-                "total_amount": 0.00  # 总金额
-            }
-        supplier_stats[supplier.id]["count"] += 1
-        supplier_stats[supplier.id]["total_quantity"] += sum(d.quantity for d in details)
-        supplier_stats[supplier.id]["total_amount"] += total_amount
-
-    return render_template("report_inbound.html", supplier_stats=supplier_stats.values(), start_date=start_date, end_date=end_date)
+    job_id = request.args.get("job")
+    supplier_stats = report_cache.get("report_inbound", start_date=start_date, end_date=end_date)
+    if supplier_stats is None and job_id:
+        supplier_stats = _job_result(job_id, "report_inbound")
+    if supplier_stats is None:
+        return _submit_report("report_inbound", "report.inbound_report", start_date=start_date, end_date=end_date)
+    return render_template("report_inbound.html", supplier_stats=supplier_stats, start_date=start_date, end_date=end_date)
 
 # 库存汇总报表
 @report_bp.route("/stock_summary")
 def stock_summary():
-    # 按仓库汇总库存
-    warehouses = Warehouse.query.all()
-    stock_summary = []
-    for warehouse in warehouses:
-        stocks = Stock.query.filter_by(warehouse_id=warehouse.id).join(Material).all()
-        total_value = sum(s.current_stock * (InboundDetail.query.filter_by(medicine_id=s.medicine_id).first().unit_price if InboundDetail.query.filter_by(medicine_id=s.medicine_id).first() else 0) for s in stocks)  # 修正：使用medicine_id
-        stock_summary.append({
-            "name": warehouse.name,
-            "material_count": len(stocks),  # 物资种类数
-            "total_stock": sum(s.current_stock for s in stocks),  # 总库存数量
-            "total_value": round(total_value, 2)  # 库存总价值
-        })
+    job_id = request.args.get("job")
+    stock_summary = report_cache.get("report_stock_summary")
+    if stock_summary is None and job_id:
+        stock_summary = _job_result(job_id, "report_stock_summary")
+    if stock_summary is None:
+        return _submit_report("report_stock_summary", "report.stock_summary")
+    return render_template("report_stock.html", stock_summary=stock_summary)
+
+# 销售汇总（读取销售日汇总表，按 日期/药品/仓库/分类 分组）
+@report_bp.route("/sales/summary")
+@read_replica
+def sales_summary():
+    dimension = request.args.get("dim", "day")
+    if dimension not in rollup.DIMENSIONS:
+        return jsonify({"status": "error", "message": f"不支持的维度：{dimension}"}), 400
+    try:
+        end = datetime.strptime(request.args.get("end_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        end = datetime.now().date()
+    try:
+        start = datetime.strptime(request.args.get("start_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        start = end - timedelta(days=30)
+    # 返回行数有上限，避免一次拉取过多数据
+    limit = min(request.args.get("limit", 100, type=int), current_app.config["REPORT_MAX_ROWS"])
+
+    rows = rollup.sales_summary(
+        dimension, start, end,
+        warehouse_id=request.args.get("warehouse_id", type=int),
+        category_id=request.args.get("category_id", type=int),
+        limit=limit
+    )
+    return jsonify({
+        "dimension": dimension,
+        "start_date": start.strftime("%Y-%m-%d"),
+        "end_date": end.strftime("%Y-%m-%d"),
+        "rows": rows
+    })
+
+# 重建销售日汇总（默认最近30天，平时由定时任务每晚对账；提交后台任务，轮询 /jobs/<id> 查看结果）
+@report_bp.route("/sales/reconcile", methods=["POST"])
+def sales_reconcile():
+    try:
+        end = datetime.strptime(request.form.get("end_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        end = datetime.now().date()
+    try:
+        start = datetime.strptime(request.form.get("start_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        start = end - timedelta(days=29)
+    job_id = jobs.submit("sales_reconcile", user_id=session.get("user_id"),
+                         start_date=start.strftime("%Y-%m-%d"), end_date=end.strftime("%Y-%m-%d"))
+    return jsonify({"status": "accepted", "job_id": job_id,
+                    "poll": url_for("jobs.job_detail", job_id=job_id, format="json")}), 202
 
-    return render_template("report_stock.html", stock_summary=stock_summary)
\ No newline at end of file
+# 按明细重算采购单、销售单主表的汇总字段（总金额、明细行数、总数量；平时随明细同事务维护，用于修正历史数据）
+@report_bp.route("/order_totals/backfill", methods=["POST"])
+def order_totals_backfill():
+    job_id = jobs.submit("order_totals_backfill", user_id=session.get("user_id"))
+    return jsonify({"status": "accepted", "job_id": job_id,
+                    "poll": url_for("jobs.job_detail", job_id=job_id, format="json")}), 202
\ No newline at end of file
@@ -1,19 +1,17 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app
 from app import db
 # 只导入你模型中存在的类（移除InboundItem/OutboundItem等）
-from app.models import Material, MaterialCategory, Unit
+from app.models import Material, MaterialCategory, Unit, Warehouse, ReorderSuggestion, StockCheck, StockCheckDetail
+from app.services import expiry, stock_take, export
+from app.services.oplog import oplog
+from app.services.replica import read_replica
+from datetime import datetime
 
 # 定义蓝图（保持stock_bp名称不变）
 stock_bp = Blueprint('stock', __name__, url_prefix='/stock')
 
-# 1. 库存列表页（仅依赖现有模型）
-@stock_bp.route('/list')
-def stock_list():
-    keyword = request.args.get('keyword', '').strip()
-    category_id = request.args.get('category_id', '').strip()
-    sort_by = request.args.get('sort_by', 'stock')
-    order = request.args.get('order', 'asc')
-
+def _stock_query(keyword, category_id, sort_by, order):
+    """库存列表查询（列表页和导出共用同一套筛选、排序）"""
     # 仅关联现有模型：物资、分类、单位
     query = Material.query.join(MaterialCategory).join(Unit)
 
@@ -36,8 +34,18 @@ def stock_list():
         query = query.order_by(Material.stock.asc() if order == 'asc' else Material.stock.desc())
     elif sort_by == 'name':
         query = query.order_by(Material.name.asc() if order == 'asc' else Material.name.desc())
+    return query
 
-    stocks = query.all()
+# 1. 库存列表页（仅依赖现有模型）
+@stock_bp.route('/list')
+@read_replica
+def stock_list():
+    keyword = request.args.get('keyword', '').strip()
+    category_id = request.args.get('category_id', '').strip()
+    sort_by = request.args.get('sort_by', 'stock')
+    order = request.args.get('order', 'asc')
+
+    stocks = _stock_query(keyword, category_id, sort_by, order).all()
     categories = MaterialCategory.query.all()  # 所有分类用于筛选
 
     return render_template(
@@ -50,18 +58,159 @@ def stock_list():
         order=order
     )
 
+# 导出库存列表（CSV/XLSX，筛选参数与列表页相同）
+@stock_bp.route('/export')
+def stock_export():
+    query = _stock_query(
+        request.args.get('keyword', '').strip(),
+        request.args.get('category_id', '').strip(),
+        request.args.get('sort_by', 'stock'),
+        request.args.get('order', 'asc')
+    ).with_entities(Material.id, Material.name, Material.specification, MaterialCategory.name,
+                    Unit.name, Material.stock, Material.min_stock)
+    return export.export_response(
+        '库存列表', ['ID', '药品名称', '规格', '分类', '单位', '当前库存', '最低库存'],
+        query, fmt=request.args.get('format', 'csv')
+    )
+
 # 2. 库存详情页（仅显示物资基本信息，不依赖入库/出库记录）
 @stock_bp.route('/detail/<int:material_id>')
 def stock_detail(material_id):
     material = Material.query.get_or_404(material_id)
     return render_template('stock_detail.html', material=material)
 
-# 3. 低库存预警页（仅依赖物资模型）
+# 3. 低库存预警页（库存 ≤ 最低库存；未设置最低库存的药品使用默认阈值）
 @stock_bp.route('/warning')
 def stock_warning():
-    threshold = 10  # 可自定义阈值
+    threshold = current_app.config['LOW_STOCK_THRESHOLD']
+    warn_level = db.case((Material.min_stock > 0, Material.min_stock), else_=threshold)
     low_stocks = Material.query.join(MaterialCategory).join(Unit)\
-        .filter(Material.stock <= threshold)\
+        .filter(Material.stock <= warn_level)\
         .order_by(Material.stock.asc())\
         .all()
-    return render_template('stock_warning.html', low_stocks=low_stocks, threshold=threshold)
\ No newline at end of file
+    return render_template('stock_warning.html', low_stocks=low_stocks, threshold=threshold)
+
+# 4. 近效期/过期库存检查（读取效期分组汇总，不扫描采购明细）
+@stock_bp.route('/expiry')
+def stock_expiry():
+    warehouse_id = request.args.get('warehouse_id', '').strip()
+    bucket = request.args.get('bucket', 'expired')
+    if bucket not in expiry.BUCKET_NAMES:
+        bucket = 'expired'
+    selected_warehouse = int(warehouse_id) if warehouse_id.isdigit() else None
+
+    warehouses = Warehouse.query.all()
+    summary = expiry.bucket_summary()
+    lots = expiry.bucket_lots(bucket, selected_warehouse)
+    return render_template(
+        'stock_expiry.html',
+        warehouses=warehouses,
+        warehouse_names={w.id: w.name for w in warehouses},
+        summary=summary,
+        buckets=expiry.BUCKETS,
+        bucket=bucket,
+        lots=lots,
+        selected_warehouse=warehouse_id
+    )
+
+# 5. 立即执行效期扫描（平时由定时任务每日执行）
+@stock_bp.route('/expiry/scan', methods=['POST'])
+def stock_expiry_scan():
+    try:
+        expiry.scan_expiry()
+        flash('效期扫描完成', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'效期扫描失败：{str(e)}', 'error')
+    return redirect(url_for('stock.stock_expiry'))
+
+# 6. 补货建议页（读取补货计算任务的结果）
+@stock_bp.route('/reorder')
+def stock_reorder():
+    suggestions = ReorderSuggestion.query.join(Material)\
+        .order_by(ReorderSuggestion.days_of_cover.is_(None), ReorderSuggestion.days_of_cover.asc(),
+                  ReorderSuggestion.reorder_qty.desc())\
+        .limit(1000)\
+        .all()
+    compute_time = suggestions[0].compute_time if suggestions else None
+    return render_template('stock_reorder.html', suggestions=suggestions, compute_time=compute_time)
+
+# 7. 立即重新计算补货建议（平时由定时任务每日执行）
+@stock_bp.route('/reorder/run', methods=['POST'])
+def stock_reorder_run():
+    from app.services import replenish
+    try:
+        count = replenish.compute_suggestions(current_app.config)
+        flash(f'补货建议已更新，共 {count} 种药品需要补货', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'补货建议计算失败：{str(e)}', 'error')
+    return redirect(url_for('stock.stock_reorder'))
+
+# 8. 库存盘点：上传扫描结果 CSV（medicine_id,actual_stock），生成盘点单
+@stock_bp.route('/check', methods=['GET', 'POST'])
+def stock_check():
+    if request.method == 'POST':
+        upload = request.files.get('count_file')
+        checker = request.form.get('checker', '').strip()
+        if not upload or not upload.filename:
+            flash('请选择盘点文件', 'error')
+            return redirect(url_for('stock.stock_check'))
+        if not checker:
+            flash('请填写盘点人', 'error')
+            return redirect(url_for('stock.stock_check'))
+        try:
+            check_date = datetime.strptime(request.form.get('check_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            check_date = datetime.now().date()
+
+        try:
+            medicine_ids, counts, errors = stock_take.parse_counts(upload.stream)
+            check_id, stats = stock_take.create_check(
+                checker, check_date, medicine_ids, counts,
+                remark=request.form.get('remark'),
+                apply=bool(request.form.get('auto_adjust'))
+            )
+        except stock_take.StockTakeError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('stock.stock_check'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'盘点失败：{str(e)}', 'error')
+            return redirect(url_for('stock.stock_check'))
+
+        message = f"盘点单 {check_id} 已生成：{stats['lines']} 种药品，{stats['changed']} 种有差异"
+        if stats['applied']:
+            message += '，系统库存已按差异调整'
+        oplog.log('库存盘点', message)
+        flash(message, 'success')
+        if stats['unknown']:
+            flash(f"{stats['unknown']} 个药品ID不存在，已忽略：{stats['unknown_ids']}", 'error')
+        for line_no, reason in errors:
+            flash(f'第 {line_no} 行：{reason}', 'error')
+        return redirect(url_for('stock.stock_check_detail', check_id=check_id))
+
+    # 最近的盘点单及差异汇总（一次分组查询）
+    checks = db.session.query(
+        StockCheck,
+        db.func.count(StockCheckDetail.id),
+        db.func.coalesce(db.func.sum(db.case((StockCheckDetail.diff != 0, 1), else_=0)), 0)
+    ).outerjoin(StockCheckDetail, StockCheckDetail.check_id == StockCheck.check_id)\
+        .group_by(StockCheck.check_id)\
+        .order_by(StockCheck.create_time.desc())\
+        .limit(20)\
+        .all()
+    return render_template('stock_check.html', checks=checks, today=datetime.now().strftime('%Y-%m-%d'))
+
+# 9. 盘点单详情（默认只显示有差异的药品）
+@stock_bp.route('/check/<check_id>')
+def stock_check_detail(check_id):
+    check = StockCheck.query.get_or_404(check_id)
+    only_diff = request.args.get('only_diff', '1') == '1'
+    query = db.session.query(StockCheckDetail, Material)\
+        .join(Material, StockCheckDetail.medicine_id == Material.id)\
+        .filter(StockCheckDetail.check_id == check_id)
+    if only_diff:
+        query = query.filter(StockCheckDetail.diff != 0)
+    details = query.order_by(db.func.abs(StockCheckDetail.diff).desc()).limit(2000).all()
+    return render_template('stock_check_detail.html', check=check, details=details, only_diff=only_diff)
@@ -1,14 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from app import db
 from app.models import Supplier
+from app.services import export
 from sqlalchemy.exc import IntegrityError
 
 supplier_bp = Blueprint('supplier', __name__, url_prefix='/supplier')
 
-# 1. 供应商列表页（支持搜索）
-@supplier_bp.route('/list')
-def supplier_list():
-    keyword = request.args.get('keyword', '').strip()
+def _supplier_query(keyword):
+    """供应商列表查询（列表页和导出共用）"""
     query = Supplier.query
     if keyword:
         # 支持搜索：名称、联系人、电话
@@ -19,9 +18,27 @@ def supplier_list():
                 Supplier.phone.like(f'%{keyword}%')
             )
         )
-    suppliers = query.all()
+    return query
+
+# 1. 供应商列表页（支持搜索）
+@supplier_bp.route('/list')
+def supplier_list():
+    keyword = request.args.get('keyword', '').strip()
+    suppliers = _supplier_query(keyword).all()
     return render_template('supplier_list.html', suppliers=suppliers, keyword=keyword)
 
+# 导出供应商列表（CSV/XLSX，搜索条件与列表页相同）
+@supplier_bp.route('/export')
+def supplier_export():
+    query = _supplier_query(request.args.get('keyword', '').strip())\
+        .order_by(Supplier.id)\
+        .with_entities(Supplier.id, Supplier.name, Supplier.license_number, Supplier.contact,
+                       Supplier.phone, Supplier.address)
+    return export.export_response(
+        '供应商列表', ['ID', '供应商名称', '经营许可证号', '联系人', '电话', '地址'],
+        query, fmt=request.args.get('format', 'csv')
+    )
+
 # 2. 新增供应商
 @supplier_bp.route('/add', methods=['GET', 'POST'])
 def supplier_add():
@@ -1,79 +1,84 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from app import db
-from app.models import User, Role, OperationLog
-from datetime import datetime
+from app.models import User, OperationLog
+from app.services.oplog import oplog
+from datetime import datetime, timedelta
 
 system_bp = Blueprint("system", __name__)
 
+# 角色（用户表 role 字段取值）
+ROLES = {"admin": "管理员", "staff": "仓库员"}
+
 # 用户管理
 @system_bp.route("/user")
 def user_list():
-    users = User.query.join(Role, User.role_id == Role.role_id).all()
-    return render_template("system_user_list.html", users=users, Role=Role)
+    users = User.query.order_by(User.id).all()
+    return render_template("system_user_list.html", users=users, roles=ROLES)
 
 # 添加用户
 @system_bp.route("/user/add", methods=["GET", "POST"])
 def add_user():
-    roles = Role.query.all()
     if request.method == "POST":
         username = request.form.get("username")
         password = request.form.get("password")
         real_name = request.form.get("real_name")
-        role_id = request.form.get("role_id")
+        role = request.form.get("role")
 
         if not username or not password:
             flash("账号和密码不能为空！")
-            return render_template("system_user_add.html", roles=roles)
+            return render_template("system_user_add.html", roles=ROLES)
         if User.query.filter_by(username=username).first():
             flash("该账号已存在！")
-            return render_template("system_user_add.html", roles=roles)
+            return render_template("system_user_add.html", roles=ROLES)
 
-        new_user = User(username=username, real_name=real_name, role_id=role_id)
+        new_user = User(username=username, real_name=real_name, role=role if role in ROLES else "staff")
         new_user.set_password(password)  # 加密密码
         db.session.add(new_user)
         db.session.commit()
 
-        # 记录操作日志
-        log = OperationLog(
-            user_id=1,  # 当前操作人（管理员）
-            operation="添加用户",
-            detail=f"添加用户：{username}",
-            ip_address=request.remote_addr
-        )
-        db.session.add(log)
-        db.session.commit()
+        # 记录操作日志（异步批量写入，不再单独提交）
+        oplog.log("添加用户", f"添加用户：{username}")
 
         flash("用户添加成功！")
         return redirect(url_for("system.user_list"))
-    return render_template("system_user_add.html", roles=roles)
+    return render_template("system_user_add.html", roles=ROLES)
 
-# 角色管理
+# 角色列表（固定角色）
 @system_bp.route("/role")
 def role_list():
-    roles = Role.query.all()
-    return render_template("system_role_list.html", roles=roles)
-
-# 添加角色
-@system_bp.route("/role/add", methods=["GET", "POST"])
-def add_role():
-    if request.method == "POST":
-        role_name = request.form.get("role_name")
-        permissions = request.form.get("permissions")
-        if not role_name:
-            flash("角色名称不能为空！")
-            return render_template("system_role_add.html")
-        if Role.query.filter_by(role_name=role_name).first():
-            flash("该角色已存在！")
-            return render_template("system_role_add.html")
-        new_role = Role(role_name=role_name, permissions=permissions)
-        db.session.add(new_role)
-        db.session.commit()
-        flash("角色添加成功！")
-        return redirect(url_for("system.role_list"))
-    return render_template("system_role_add.html")
+    return render_template("system_role_list.html", roles=ROLES)
 
-# 操作日志
+# 操作日志（按日期范围分页，默认最近7天）
 @system_bp.route("/log")
 def log_list():
-    logs = OperationLog.query.join(User, OperationLog.user_id == User.user_id).order_by(OperationLog.operation_time.desc()).all()
-    return render_template("system_log_list.html", logs=logs, User=User)
\ No newline at end of file
+    try:
+        end = datetime.strptime(request.args.get("end_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        end = datetime.now().date()
+    try:
+        start = datetime.strptime(request.args.get("start_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        start = end - timedelta(days=6)
+    operation = request.args.get("operation", "").strip()
+    user_id = request.args.get("user_id", type=int)
+
+    # 先按 log_date 限定范围（MySQL 上只扫描相关月份分区），再按时间倒序分页
+    query = OperationLog.query.filter(OperationLog.log_date.between(start, end))
+    if operation:
+        query = query.filter(OperationLog.operation == operation)
+    if user_id:
+        query = query.filter(OperationLog.user_id == user_id)
+    pagination = query.order_by(OperationLog.operation_time.desc(), OperationLog.log_id.desc()).paginate(
+        page=request.args.get("page", 1, type=int),
+        per_page=current_app.config["LOG_PAGE_SIZE"],
+        error_out=False
+    )
+    return render_template(
+        "system_log_list.html",
+        pagination=pagination,
+        logs=pagination.items,
+        start_date=start.strftime("%Y-%m-%d"),
+        end_date=end.strftime("%Y-%m-%d"),
+        operation=operation,
+        user_id=user_id or ""
+    )
\ No newline at end of file
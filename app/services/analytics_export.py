@@ -0,0 +1,300 @@
+"""销售/采购历史的列式分析导出
+
+按月份分区、分块流式读取订单主表+明细，每列写成一个 NumPy .npy 文件，
+分析端可直接 np.load(..., mmap_mode='r') 内存映射，无需连接生产库。
+
+目录结构（每个数据集一个目录）：
+    <导出目录>/sale/manifest.json              导出清单（列类型、分区、上次导出日期）
+    <导出目录>/sale/dict/medicine_id.npy        字典：编码 i 对应的原始药品ID
+    <导出目录>/sale/month=2026-10/chunk-00000/<列名>.npy
+
+medicine_id、warehouse_id 做字典编码（int32，空值为 -1），字典只追加不重排，
+历史分区的编码始终有效。增量导出从上次导出日期所在月份开始重写分区，
+更早的分区视为已封存；上次导出开始后新建或修改（update_time）的单据落在封存月份时，同时重写这些月份。
+删除封存月份的单据需要做一次全量导出。
+
+同一导出目录同时只运行一个导出（定时任务与页面手动触发的后台任务之间也互斥），后到的等待前一个完成。
+"""
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows：只在进程内互斥
+    fcntl = None
+
+import numpy as np
+from sqlalchemy import select, func
+
+from app import db
+from app.models import Purchase, PurchaseDetail, Sale, SaleDetail
+from app.services.jobs import jobs
+
+MANIFEST = 'manifest.json'
+LOCK_FILE = '.export.lock'
+DICT_COLUMNS = ('medicine_id', 'warehouse_id')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_thread_lock = threading.Lock()
+
+
+def _dataset_columns(header, detail, order_key, date_col, extra=()):
+    """数据集的列定义：[(列名, dtype, SQL 表达式)]，顺序即查询列顺序"""
+    return [
+        ('detail_id', 'int64', detail.id),
+        ('order_id', 'S', getattr(header, order_key)),
+        ('date', 'datetime64[D]', date_col),
+        ('warehouse_id', 'int32', header.warehouse_id),
+        ('medicine_id', 'int32', detail.medicine_id),
+        ('quantity', 'int32', detail.quantity),
+        ('unit_price', 'float64', detail.unit_price),
+        ('amount', 'float64', detail.amount),
+        ('audit_status', 'int8', header.audit_status),
+    ] + list(extra)
+
+
+DATASETS = {
+    'sale': {
+        'columns': _dataset_columns(Sale, SaleDetail, 'sale_id', Sale.sale_date),
+        'join': (SaleDetail, Sale, SaleDetail.sale_id == Sale.sale_id),
+        'date': Sale.sale_date,
+        'changed': (Sale.update_time, Sale.create_time),
+    },
+    'purchase': {
+        'columns': _dataset_columns(Purchase, PurchaseDetail, 'purchase_id', Purchase.purchase_date,
+                                    extra=[('supplier_id', 'int32', Purchase.supplier_id)]),
+        'join': (PurchaseDetail, Purchase, PurchaseDetail.purchase_id == Purchase.purchase_id),
+        'date': Purchase.purchase_date,
+        'changed': (Purchase.update_time, Purchase.create_time),
+    },
+}
+
+
+class _Dictionary:
+    """只追加的 ID 字典：原始ID -> 连续编码"""
+
+    def __init__(self, path):
+        self.path = path
+        self.values = np.load(path).tolist() if os.path.exists(path) else []
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, ids):
+        codes = np.full(len(ids), -1, dtype=np.int32)
+        for i, value in enumerate(ids):
+            if value is None:
+                continue
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        return codes
+
+    def save(self):
+        np.save(self.path, np.array(self.values, dtype=np.int64))
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _to_array(values, dtype):
+    if dtype == 'S':
+        return np.array([(v or '').encode('ascii', 'replace') for v in values], dtype='S')
+    if dtype.startswith('datetime64'):
+        return np.array(values, dtype=dtype)
+    fill = 0 if dtype.startswith('int') else np.nan
+    return np.array([fill if v is None else v for v in values], dtype=dtype)
+
+
+def _write_chunk(chunk_dir, columns, rows, dictionaries):
+    os.makedirs(chunk_dir)
+    for i, (name, dtype, _) in enumerate(columns):
+        values = [row[i] for row in rows]
+        if name in dictionaries:
+            array = dictionaries[name].encode(values)
+        else:
+            array = _to_array(values, dtype)
+        np.save(os.path.join(chunk_dir, f'{name}.npy'), array)
+
+
+def _export_month(root, spec, month, dictionaries, chunk_rows):
+    """把一个月的数据按块写入临时目录后整体替换分区，返回行数"""
+    columns = spec['columns']
+    detail, header, onclause = spec['join']
+    query = (
+        select(*[expr for _, _, expr in columns])
+        .select_from(detail).join(header, onclause)
+        .where(spec['date'] >= month, spec['date'] < _next_month(month))
+        .order_by(spec['date'], detail.id)
+        .execution_options(yield_per=chunk_rows)
+    )
+
+    name = f"month={month.strftime('%Y-%m')}"
+    final_dir = os.path.join(root, name)
+    tmp_dir = final_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    rows_total = chunks = 0
+    for rows in db.session.execute(query).partitions(chunk_rows):
+        _write_chunk(os.path.join(tmp_dir, f'chunk-{chunks:05d}'), columns, rows, dictionaries)
+        rows_total += len(rows)
+        chunks += 1
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    if rows_total:
+        os.replace(tmp_dir, final_dir)
+    else:
+        shutil.rmtree(tmp_dir)
+    return rows_total, chunks
+
+
+def _load_manifest(root):
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@contextmanager
+def _export_lock(export_dir):
+    """导出目录的排他锁：进程内用线程锁，多进程（多 worker、命令行）之间用锁文件"""
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(export_dir, exist_ok=True)
+        fd = os.open(os.path.join(export_dir, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # 关闭即释放锁
+
+
+def _changed_months(spec, since, before):
+    """since 之后新建或修改、日期早于 before（已封存）的单据所在月份"""
+    header = spec['join'][1]
+    day = spec['date']
+    changed = [column >= since for column in spec['changed']]
+    days = db.session.execute(
+        select(day).select_from(header).where(day < before, changed[0] | changed[1]).distinct()
+    ).scalars()
+    return {_month_start(value) for value in days if value is not None}
+
+
+def export_dataset(dataset, export_dir, incremental=True, chunk_rows=50000, today=None):
+    """导出一个数据集，返回 {'dataset', 'months', 'rows'}"""
+    with _export_lock(export_dir):
+        return _export_dataset(dataset, export_dir, incremental, chunk_rows, today or date.today())
+
+
+def _export_dataset(dataset, export_dir, incremental, chunk_rows, today):
+    spec = DATASETS[dataset]
+    started = datetime.now()
+    root = os.path.join(export_dir, dataset)
+    os.makedirs(os.path.join(root, 'dict'), exist_ok=True)
+
+    manifest = _load_manifest(root)
+    if not manifest or not incremental:
+        manifest = {'partitions': {}}
+    dictionaries = {name: _Dictionary(os.path.join(root, 'dict', f'{name}.npy')) for name in DICT_COLUMNS}
+
+    first, last = db.session.execute(select(func.min(spec['date']), func.max(spec['date']))).one()
+    sealed = set()
+    if manifest.get('exported_through'):
+        first = datetime.strptime(manifest['exported_through'], '%Y-%m-%d').date()
+        # 上次导出开始后新建、审核的单据落在封存月份时重写这些月份（旧清单没有开始时间，用导出完成时间）
+        since = manifest.get('export_started') or manifest.get('export_time')
+        if since:
+            sealed = _changed_months(spec, datetime.strptime(since, TIME_FORMAT), _month_start(first))
+    elif not incremental:
+        # 全量导出：清理旧分区
+        for entry in os.listdir(root):
+            if entry.startswith('month='):
+                shutil.rmtree(os.path.join(root, entry))
+
+    pending = set(sealed)
+    if first is not None and last is not None:
+        month, end = _month_start(first), _month_start(max(last, first))
+        while month <= end:
+            pending.add(month)
+            month = _next_month(month)
+
+    months = rows = 0
+    for month in sorted(pending):
+        count, chunks = _export_month(root, spec, month, dictionaries, chunk_rows)
+        key = month.strftime('%Y-%m')
+        if count:
+            manifest['partitions'][key] = {'rows': count, 'chunks': chunks}
+        else:
+            manifest['partitions'].pop(key, None)
+        months += 1
+        rows += count
+
+    for dictionary in dictionaries.values():
+        dictionary.save()
+    manifest.update({
+        'dataset': dataset,
+        'format': 'npy',
+        'columns': {name: ('dict:int32' if name in DICT_COLUMNS else dtype) for name, dtype, _ in spec['columns']},
+        'exported_through': today.strftime('%Y-%m-%d'),
+        'export_started': started.strftime(TIME_FORMAT),
+        'export_time': datetime.now().strftime(TIME_FORMAT),
+    })
+    with open(os.path.join(root, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    return {'dataset': dataset, 'months': months, 'rows': rows}
+
+
+def export_all(config, incremental=True):
+    """导出全部数据集（定时任务入口）"""
+    return [
+        export_dataset(name, config['ANALYTICS_EXPORT_DIR'], incremental=incremental,
+                       chunk_rows=config['ANALYTICS_CHUNK_ROWS'])
+        for name in DATASETS
+    ]
+
+
+@jobs.register('analytics_export')
+def export_job(ctx, incremental=True):
+    """后台任务：逐个数据集导出（页面手动触发）"""
+    from flask import current_app
+
+    results = []
+    for index, name in enumerate(DATASETS):
+        ctx.progress(index * 100 / len(DATASETS), f'正在导出 {name}', force=True)
+        results.append(export_dataset(name, current_app.config['ANALYTICS_EXPORT_DIR'], incremental=incremental,
+                                      chunk_rows=current_app.config['ANALYTICS_CHUNK_ROWS']))
+    return results
+
+
+def iter_chunks(export_dir, dataset, months=None, mmap_mode='r'):
+    """分析端读取：逐块返回 {列名: ndarray}（默认内存映射，只读）"""
+    root = os.path.join(export_dir, dataset)
+    manifest = _load_manifest(root) or {'partitions': {}}
+    for key in sorted(manifest['partitions']):
+        if months and key not in months:
+            continue
+        part_dir = os.path.join(root, f'month={key}')
+        for chunk in sorted(os.listdir(part_dir)):
+            chunk_dir = os.path.join(part_dir, chunk)
+            yield {
+                name: np.load(os.path.join(chunk_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+                for name in manifest['columns']
+            }
+
+
+def load_dictionary(export_dir, dataset, column):
+    """字典数组：values[code] 为原始ID"""
+    return np.load(os.path.join(export_dir, dataset, 'dict', f'{column}.npy'))
@@ -0,0 +1,133 @@
+"""异步只读接口使用的数据库连接（SQLAlchemy asyncio + aiomysql，本地 SQLite 测试用 aiosqlite）
+
+连接地址默认由 DATABASE_URL 换成对应的异步驱动（mysql+pymysql → mysql+aiomysql，sqlite → sqlite+aiosqlite），
+也可以用 ASYNC_DATABASE_URL 单独指定（如指向只读副本）。引擎在第一次查询时创建（多进程部署时每个进程各自创建）。
+
+大量终端轮询同样的库存、药品数据：相同查询在 ASYNC_API_CACHE_SECONDS 秒内直接复用结果，
+缓存过期时并发到达的相同查询只执行一次，其余请求等待同一个结果，数据库压力与在线终端数无关。
+缓存的结果不直接交给调用方，每次返回一份副本，处理函数修改返回值不会影响其他请求。
+"""
+import asyncio
+import copy
+import time
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+
+from app.models import User
+
+ASYNC_DRIVERS = {'mysql': 'mysql+aiomysql', 'sqlite': 'sqlite+aiosqlite'}
+MAX_CACHE_ENTRIES = 1000  # 缓存条数超过该值时清理已过期的结果
+
+
+def async_url(url):
+    """同步连接地址换成异步驱动（已是异步驱动时原样返回）"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f'不支持的数据库：{url.get_backend_name()}（异步接口支持 MySQL、SQLite）')
+    if url.get_driver_name() in ('aiomysql', 'aiosqlite'):
+        return url
+    return url.set(drivername=driver)
+
+
+class AsyncDatabase:
+    def __init__(self):
+        self.engine = None
+        self.url = None
+        self.options = {}
+        self.cache_seconds = 1
+        self.user_cache_seconds = 30
+        self.max_rows = 500
+        self._cache = {}  # 查询 -> (过期时间, 结果)
+        self._inflight = {}  # 查询 -> 正在执行的 Future
+        self.stats = {'queries': 0, 'cache_hits': 0, 'coalesced': 0, 'errors': 0}
+
+    def init_app(self, app):
+        self.url = async_url(app.config['ASYNC_DATABASE_URL'] or app.config['SQLALCHEMY_DATABASE_URI'])
+        self.options = {'pool_pre_ping': True, 'pool_recycle': app.config['DB_POOL_RECYCLE']}
+        if self.url.get_backend_name() != 'sqlite':
+            self.options.update(pool_size=app.config['ASYNC_DB_POOL_SIZE'],
+                                max_overflow=app.config['ASYNC_DB_MAX_OVERFLOW'],
+                                pool_timeout=app.config['DB_POOL_TIMEOUT'])
+        self.cache_seconds = app.config['ASYNC_API_CACHE_SECONDS']
+        self.user_cache_seconds = app.config['ASYNC_API_USER_CACHE_SECONDS']
+        self.max_rows = app.config['ASYNC_API_MAX_ROWS']
+        self.engine = None
+
+    def _engine(self):
+        if self.engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            self.engine = create_async_engine(self.url, **self.options)
+        return self.engine
+
+    async def fetch_all(self, statement):
+        """执行查询，返回 [dict]"""
+        try:
+            async with self._engine().connect() as conn:
+                result = await conn.execute(statement)
+                rows = [dict(row) for row in result.mappings()]
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+        self.stats['queries'] += 1
+        return rows
+
+    async def fetch_one(self, statement):
+        rows = await self.fetch_all(statement.limit(1))
+        return rows[0] if rows else None
+
+    async def cached(self, key, loader, seconds=None):
+        """按 key 复用 seconds（默认 cache_seconds）秒内的结果，返回副本；并发的相同查询只执行一次 loader()"""
+        seconds = self.cache_seconds if seconds is None else seconds
+        if seconds <= 0:
+            return await loader()
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            self.stats['cache_hits'] += 1
+            return copy.deepcopy(entry[1])
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            return copy.deepcopy(await asyncio.shield(pending))
+
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[key] = pending
+        try:
+            result = await loader()
+        except BaseException as exc:
+            # 执行查询的请求被取消时，等待同一结果的请求也随之取消，不会一直等待
+            if isinstance(exc, asyncio.CancelledError):
+                pending.cancel()
+            else:
+                pending.set_exception(exc)
+                pending.exception()  # 没有其他请求等待时不再提示异常未读取
+            raise
+        else:
+            pending.set_result(result)
+            if len(self._cache) >= MAX_CACHE_ENTRIES:
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+            self._cache[key] = (time.monotonic() + seconds, result)
+        finally:
+            del self._inflight[key]
+        return copy.deepcopy(result)
+
+    async def active_user(self, user_id):
+        """会话中的用户仍存在且已启用（结果缓存 user_cache_seconds 秒，禁用用户最迟在该时间后失效）"""
+        user = await self.cached(('user', user_id), lambda: self.fetch_one(
+            select(User.id).where(User.id == user_id, User.is_active == 1)
+        ), seconds=self.user_cache_seconds)
+        return user is not None
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    def status(self):
+        return dict(self.stats, driver=self.url.drivername if self.url else None, started=self.engine is not None,
+                    cached=len(self._cache), cache_seconds=self.cache_seconds)
+
+
+async_db = AsyncDatabase()
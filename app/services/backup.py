@@ -0,0 +1,449 @@
+"""数据库备份导出与导入（纯 Python，通过共享连接池的原生连接执行，不依赖 mysqldump / mysql 命令）
+
+导出按表逐批读取（PyMySQL 下使用流式游标），边读边写 SQL 文件，不把整表数据读入内存；
+导入按分号拆分语句逐条执行。两者都接受 progress(percent, message) 回调，在后台任务中上报进度。
+
+备份文件按 BACKUP_COMPRESSION 边导出边压缩（zstd 需安装 zstandard，未安装时退回 gzip），
+每次备份（含失败）记录在备份目录的 manifest.json 中：文件名、触发方式、大小、SHA-256、各表行数。
+BACKUP_STORAGE = 'dedup' 时备份写入去重存储（见 backup_store），列表中以 .dedup 结尾，下载、恢复时按快照拼接。
+BACKUP_STORAGE = 'tables' 时每次备份是一个按表分文件的目录（见 backup_tables），列表中以 .tables 结尾，
+恢复时多连接并行导入、最后重建索引，并按备份时记录的行数和校验和核对。
+定时备份（BACKUP_CRON）完成后按 BACKUP_KEEP_DAILY / BACKUP_KEEP_WEEKLY 清理旧的定时备份，手动备份不自动删除。
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.services.backup_store import ChunkStore, SNAPSHOT_SUFFIX
+from app.services.jobs import jobs
+
+FETCH_SIZE = 1000  # 导出时每批读取的行数
+MANIFEST = 'manifest.json'
+MANIFEST_MAX_ENTRIES = 500  # 清单最多保留的记录数（已删除、失败的旧记录先淘汰）
+BACKUP_SUFFIXES = ('.sql', '.sql.gz', '.sql.zst')
+COMPRESSION_SUFFIX = {'none': '.sql', 'gzip': '.sql.gz', 'zstd': '.sql.zst'}
+TABLES_SUFFIX = '.tables'  # 按表备份目录（见 backup_tables）
+
+_manifest_lock = threading.Lock()
+
+
+def resolve_compression(name):
+    """配置的压缩方式；zstd 未安装 zstandard 时退回 gzip"""
+    if name == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            return 'gzip'
+    return name if name in COMPRESSION_SUFFIX else 'gzip'
+
+
+def _compression_of(filename):
+    for name, suffix in COMPRESSION_SUFFIX.items():
+        if suffix != '.sql' and filename.endswith(suffix):
+            return name
+    return 'none'
+
+
+def open_backup(path, mode='r', compression=None):
+    """以文本方式打开（可能压缩的）备份文件，compression 默认按文件名后缀判断"""
+    compression = compression or _compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf8')
+    if compression == 'zstd':
+        import zstandard
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+        return io.TextIOWrapper(stream, encoding='utf8')
+    return open(path, mode, encoding='utf8')
+
+
+def _noop(percent, message=None):
+    pass
+
+
+def _server_cursor(connection):
+    # PyMySQL 默认游标会把整个结果集读入客户端，导出大表时改用流式游标
+    if db.engine.dialect.driver == 'pymysql':
+        from pymysql.cursors import SSCursor
+        return connection.cursor(SSCursor)
+    return connection.cursor()
+
+
+def _sql_value(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, datetime):
+        return f"'{value.strftime('%Y-%m-%d %H:%M:%S')}'"
+    # 转义特殊字符（换行也转义，保证每条语句只占一行）
+    value_str = str(value).replace('\\', '\\\\').replace("'", "\\'").replace('\n', '\\n').replace('\r', '\\r')
+    return f"'{value_str}'"
+
+
+def export_database(path, progress=_noop, compression=None):
+    """把全部表结构和数据导出为 SQL 文件（path 也可以是可写的文本流），
+    返回 {'tables': 表数, 'rows': 行数, 'table_rows': {表名: 行数}}"""
+    # 从共享连接池获取原生连接（close 时归还连接池）
+    connection = db.engine.raw_connection()
+    table_counts = {}
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SHOW TABLES")
+        tables = [table[0] for table in cursor.fetchall()]
+
+        with open_backup(path, 'w', compression) if isinstance(path, str) else path as f:
+            # 写入 SQL 文件头部
+            f.write(f"-- MySQL Database Backup\n")
+            f.write(f"-- Database: {db.engine.url.database}\n")
+            f.write(f"-- Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"-- Generated by Pharmacy Management System\n\n")
+            f.write("SET NAMES utf8mb4;\n")
+            f.write("SET FOREIGN_KEY_CHECKS = 0;\n\n")
+
+            for index, table in enumerate(tables):
+                progress(index * 100 / len(tables), f'正在导出 {table}（{index + 1}/{len(tables)}）')
+
+                # 写入表结构
+                f.write(f"-- ----------------------------\n")
+                f.write(f"-- Table structure for {table}\n")
+                f.write(f"-- ----------------------------\n")
+                f.write(f"DROP TABLE IF EXISTS `{table}`;\n")
+                cursor.execute(f"SHOW CREATE TABLE `{table}`")
+                f.write(f"{cursor.fetchone()[1]};\n\n")
+
+                # 写入表数据（流式游标需读完结果集后才能执行下一条语句）
+                data_cursor = _server_cursor(connection)
+                data_cursor.execute(f"SELECT * FROM `{table}`")
+                table_rows = 0
+                while True:
+                    rows = data_cursor.fetchmany(FETCH_SIZE)
+                    if not rows:
+                        break
+                    if table_rows == 0:
+                        f.write(f"-- ----------------------------\n")
+                        f.write(f"-- Records of {table}\n")
+                        f.write(f"-- ----------------------------\n")
+                    f.writelines(
+                        f"INSERT INTO `{table}` VALUES ({', '.join(_sql_value(v) for v in row)});\n" for row in rows
+                    )
+                    table_rows += len(rows)
+                    progress(index * 100 / len(tables), f'正在导出 {table}（{index + 1}/{len(tables)}），已写入 {table_rows} 行')
+                data_cursor.close()
+                if table_rows:
+                    f.write("\n")
+                table_counts[table] = table_rows
+
+            # 写入文件尾部
+            f.write("SET FOREIGN_KEY_CHECKS = 1;\n")
+        cursor.close()
+    finally:
+        connection.close()
+    return {'tables': len(tables), 'rows': sum(table_counts.values()), 'table_rows': table_counts}
+
+
+def split_statements(sql_content):
+    """去掉注释行后按分号拆分 SQL 语句"""
+    sql_lines = []
+    for line in sql_content.split('\n'):
+        line = line.strip()
+        if line and not line.startswith('--'):
+            sql_lines.append(line)
+    return [s.strip() for s in ' '.join(sql_lines).split(';') if s.strip()]
+
+
+def import_database(path, progress=_noop):
+    """执行 SQL 文件中的语句（单条失败继续执行），返回 {'statements': 总数, 'failed': 失败数}"""
+    with open_backup(path) as f:
+        statements = split_statements(f.read())
+
+    # 从共享连接池获取原生连接（close 时归还连接池）
+    connection = db.engine.raw_connection()
+    failed = 0
+    try:
+        cursor = connection.cursor()
+        for index, statement in enumerate(statements):
+            progress(index * 100 / len(statements), f'正在执行第 {index + 1}/{len(statements)} 条语句')
+            try:
+                cursor.execute(statement)
+            except Exception as e:
+                # 某些语句可能失败，但继续执行
+                failed += 1
+                print(f"执行 SQL 语句时出错（继续）: {str(e)}")
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    return {'statements': len(statements), 'failed': failed}
+
+
+def load_manifest(backup_dir):
+    path = os.path.join(backup_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'backups': []}
+    with open(path, encoding='utf8') as f:
+        return json.load(f)
+
+
+def _save_manifest(backup_dir, manifest):
+    # 先写临时文件再替换，避免写到一半时进程退出留下损坏的清单
+    entries = manifest['backups']
+    while len(entries) > MANIFEST_MAX_ENTRIES:
+        stale = next((e for e in entries if e['status'] != 'ok'), entries[0])
+        entries.remove(stale)
+    path = os.path.join(backup_dir, MANIFEST)
+    with open(path + '.tmp', 'w', encoding='utf8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _update_manifest(backup_dir, func):
+    with _manifest_lock:
+        manifest = load_manifest(backup_dir)
+        result = func(manifest['backups'])
+        _save_manifest(backup_dir, manifest)
+        return result
+
+
+def forget_backup(backup_dir, filename, reason='manual'):
+    """备份文件被删除后在清单中标记"""
+    def mark(entries):
+        for entry in entries:
+            if entry['filename'] == filename and entry['status'] == 'ok':
+                entry.update(status='deleted', deleted=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), reason=reason)
+    _update_manifest(backup_dir, mark)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_store(backup_dir, compression='gzip'):
+    """备份目录下的去重存储"""
+    return ChunkStore(os.path.join(backup_dir, 'store'), resolve_compression(compression))
+
+
+def _export_dedup(backup_dir, filename, compression, progress):
+    store = chunk_store(backup_dir, compression)
+    writer = store.writer()
+    try:
+        result = export_database(writer, progress)
+        store.save_snapshot(filename, writer, **result)
+    finally:
+        store.release(writer)
+    return dict(result, size=writer.size, sha256=writer.sha256, chunks=len(writer.chunks),
+                new_chunks=writer.new_chunks, stored_bytes=writer.new_bytes)
+
+
+def _export_tables(path, compression, progress):
+    from app.services import backup_tables
+
+    result = backup_tables.export_tables(path, compression, progress)
+    return dict(result, size=backup_tables.backup_size(path))
+
+
+def create_backup(backup_dir, compression='gzip', trigger='manual', progress=_noop, storage='file'):
+    """导出一份（压缩的）备份并记入清单，返回清单记录；导出失败时记录失败原因后重新抛出
+
+    storage='dedup' 时写入去重存储，记录中的 size 为原始 SQL 长度，stored_bytes 为本次新增占用；
+    storage='tables' 时导出为按表分文件的目录，size 为目录内文件总大小。
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    compression = resolve_compression(compression)
+    now = datetime.now()
+    base = f"pharmacy_db_backup_{now.strftime('%Y%m%d_%H%M%S')}"
+    filename = base + {'dedup': SNAPSHOT_SUFFIX, 'tables': TABLES_SUFFIX}.get(storage, COMPRESSION_SUFFIX[compression])
+    path = os.path.join(backup_dir, filename)
+    entry = {'filename': filename, 'created': now.strftime('%Y-%m-%d %H:%M:%S'), 'trigger': trigger,
+             'compression': compression, 'storage': storage}
+    started = time.monotonic()
+    try:
+        if storage == 'dedup':
+            result = _export_dedup(backup_dir, filename, compression, progress)
+        elif storage == 'tables':
+            result = _export_tables(path, compression, progress)
+        else:
+            # 写到临时文件，完成后改名，备份列表中不会出现不完整的文件
+            result = export_database(path + '.part', progress, compression)
+            os.replace(path + '.part', path)
+            result.update(size=os.path.getsize(path), sha256=_sha256(path))
+    except BaseException as e:
+        if os.path.exists(path + '.part'):
+            os.remove(path + '.part')
+        entry.update(status='failed', error=str(e) or e.__class__.__name__)
+        _update_manifest(backup_dir, lambda entries: entries.append(entry))
+        raise
+    entry.update(status='ok', seconds=round(time.monotonic() - started, 1), **result)
+    _update_manifest(backup_dir, lambda entries: entries.append(entry))
+    return entry
+
+
+def delete_backup(backup_dir, filename, reason='manual'):
+    """删除备份（普通文件、按表备份目录或去重快照，快照删除后清理不再引用的块），返回是否存在"""
+    if filename.endswith(TABLES_SUFFIX):
+        path = os.path.join(backup_dir, filename)
+        if not os.path.isdir(path):
+            return False
+        shutil.rmtree(path)
+    elif filename.endswith(SNAPSHOT_SUFFIX):
+        store = chunk_store(backup_dir)
+        if filename not in store.snapshots():
+            return False
+        store.delete_snapshot(filename)
+        store.gc()
+    else:
+        path = os.path.join(backup_dir, filename)
+        if not os.path.exists(path):
+            return False
+        os.remove(path)
+    forget_backup(backup_dir, filename, reason)
+    return True
+
+
+def list_backups(backup_dir):
+    """备份列表（普通文件、按表备份目录和去重快照），按时间倒序；备份方式取自清单，早期手工导出的文件没有记录"""
+    entries = {e['filename']: e for e in load_manifest(backup_dir)['backups'] if e['status'] == 'ok'}
+    backups = []
+    for filename in os.listdir(backup_dir):
+        path = os.path.join(backup_dir, filename)
+        if filename.endswith(BACKUP_SUFFIXES):
+            backups.append((filename, os.path.getsize(path), datetime.fromtimestamp(os.path.getmtime(path))))
+        elif filename.endswith(TABLES_SUFFIX) and os.path.isdir(path):
+            size = entries.get(filename, {}).get('size', 0)
+            backups.append((filename, size, datetime.fromtimestamp(os.path.getmtime(path))))
+    if os.path.isdir(os.path.join(backup_dir, 'store')):
+        store = chunk_store(backup_dir)
+        for name in store.snapshots():
+            entry = entries.get(name, {})
+            created = datetime.strptime(entry['created'], '%Y-%m-%d %H:%M:%S') if entry else datetime.now()
+            backups.append((name, store.load_snapshot(name)['size'], created))
+    backups.sort(key=lambda b: b[2], reverse=True)
+    return [{
+        'filename': filename,
+        'size': f"{size / 1024:.2f} KB",
+        'time': created.strftime('%Y-%m-%d %H:%M:%S'),
+        'trigger': {'scheduled': '定时', 'manual': '手动'}.get(entries.get(filename, {}).get('trigger'), '手动'),
+        'dedup': filename.endswith(SNAPSHOT_SUFFIX),
+        'tables': filename.endswith(TABLES_SUFFIX),
+    } for filename, size, created in backups]
+
+
+def materialize(backup_dir, filename):
+    """备份对应的 SQL 文件路径：去重快照先还原为临时文件（调用方负责删除），返回 (路径, 是否临时文件)"""
+    if not filename.endswith(SNAPSHOT_SUFFIX):
+        return os.path.join(backup_dir, filename), False
+    fd, path = tempfile.mkstemp(prefix='restore_', suffix='.sql')
+    os.close(fd)
+    try:
+        chunk_store(backup_dir).restore_to(filename, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, True
+
+
+def select_expired(entries, keep_daily, keep_weekly):
+    """按 每天最新一份保留最近 keep_daily 天、每周最新一份保留最近 keep_weekly 周 选出要删除的备份"""
+    ordered = sorted(entries, key=lambda e: e['created'], reverse=True)
+    keep, days, weeks = set(), [], []
+    for entry in ordered:
+        created = datetime.strptime(entry['created'], '%Y-%m-%d %H:%M:%S')
+        day, week = created.date(), created.isocalendar()[:2]
+        if day not in days and len(days) < keep_daily:
+            days.append(day)
+            keep.add(entry['filename'])
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.append(week)
+            keep.add(entry['filename'])
+    return [entry for entry in ordered if entry['filename'] not in keep]
+
+
+def apply_retention(backup_dir, keep_daily, keep_weekly):
+    """删除超出保留策略的定时备份，返回删除的文件名"""
+    def expire(entries):
+        scheduled = [e for e in entries if e['status'] == 'ok' and e['trigger'] == 'scheduled']
+        removed = []
+        for entry in select_expired(scheduled, keep_daily, keep_weekly):
+            if entry['filename'].endswith(SNAPSHOT_SUFFIX):
+                chunk_store(backup_dir).delete_snapshot(entry['filename'])
+            elif entry['filename'].endswith(TABLES_SUFFIX):
+                shutil.rmtree(os.path.join(backup_dir, entry['filename']), ignore_errors=True)
+            else:
+                path = os.path.join(backup_dir, entry['filename'])
+                if os.path.exists(path):
+                    os.remove(path)
+            entry.update(status='deleted', deleted=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), reason='retention')
+            removed.append(entry['filename'])
+        return removed
+    removed = _update_manifest(backup_dir, expire)
+    if any(name.endswith(SNAPSHOT_SUFFIX) for name in removed):
+        chunk_store(backup_dir).gc()
+    return removed
+
+
+@jobs.register('database_backup')
+def backup_job(ctx):
+    """后台任务：定时备份（压缩、记入清单、按保留策略清理）"""
+    config = current_app.config
+    entry = create_backup(config['BACKUP_DIR'], config['BACKUP_COMPRESSION'], 'scheduled', ctx.progress,
+                          storage=config['BACKUP_STORAGE'])
+    removed = apply_retention(config['BACKUP_DIR'], config['BACKUP_KEEP_DAILY'], config['BACKUP_KEEP_WEEKLY'])
+    return {'filename': entry['filename'], 'size': entry['size'], 'stored_bytes': entry.get('stored_bytes'),
+            'rows': entry['rows'], 'removed': removed}
+
+
+@jobs.register('database_export')
+def export_job(ctx):
+    """后台任务：手动导出数据库到备份目录（不参与自动清理）"""
+    config = current_app.config
+    entry = create_backup(config['BACKUP_DIR'], config['BACKUP_COMPRESSION'], 'manual', ctx.progress,
+                          storage=config['BACKUP_STORAGE'])
+    result = {'filename': entry['filename'], 'size': entry['size'], 'tables': entry['tables'], 'rows': entry['rows']}
+    # 去重快照、按表备份目录没有单独的文件，在数据库管理页下载（按快照拼接或打包）
+    if entry['storage'] == 'dedup':
+        return dict(result, stored_bytes=entry['stored_bytes'], new_chunks=entry['new_chunks'])
+    if entry['storage'] == 'tables':
+        return dict(result, size=entry['size'])  # 目录内文件总大小
+    return result, os.path.join(config['BACKUP_DIR'], entry['filename'])
+
+
+@jobs.register('database_import')
+def import_job(ctx, path):
+    """后台任务：导入上传的 SQL 文件（已执行的语句在取消时不会回滚，DDL 会自动提交）"""
+    try:
+        return import_database(path, ctx.progress)
+    finally:
+        os.remove(path)
+
+
+@jobs.register('database_restore')
+def restore_job(ctx, filename):
+    """后台任务：从备份目录中的备份恢复（去重快照先按清单拼接还原，按表备份并行导入并核对）"""
+    config = current_app.config
+    if filename.endswith(TABLES_SUFFIX):
+        from app.services import backup_tables
+        return backup_tables.restore_tables(os.path.join(config['BACKUP_DIR'], filename),
+                                            config['BACKUP_RESTORE_WORKERS'], ctx.progress)
+    ctx.progress(0, f'正在准备 {filename}', force=True)
+    path, temporary = materialize(config['BACKUP_DIR'], filename)
+    try:
+        return import_database(path, ctx.progress)
+    finally:
+        if temporary:
+            os.remove(path)
@@ -0,0 +1,272 @@
+"""去重备份存储（BACKUP_STORAGE = 'dedup'）
+
+每次备份的 SQL 文本按内容切块：逐行累积，块长度达到 CHUNK_MIN_BYTES 后遇到 crc32(行) 低位为 0 的行即切分，
+超过 CHUNK_MAX_BYTES 强制切分，每张表的 DROP TABLE 语句前也切分。切分点只取决于行内容，
+插入、修改少量记录只影响附近的块，其余块与上次备份相同。
+
+块按 SHA-256 存放（压缩保存，已存在的块不再写入），每次备份保存一份快照清单（块ID列表），
+恢复时按清单依次拼接。删除快照后由 gc() 清理不再被任何快照引用的块。
+
+目录结构：
+    <BACKUP_DIR>/store/chunks/ab/<sha256>.zst     数据块
+    <BACKUP_DIR>/store/snapshots/<名称>.json       快照清单
+    <BACKUP_DIR>/store/store.lock                  写入与清理互斥的锁文件
+
+多 worker 部署时备份与删除、保留清理可能在不同进程中执行：写入中的备份对 store.lock 持有共享锁直到结束，
+gc() 以非阻塞方式获取排他锁，拿不到（有备份正在写入）时跳过本次清理，不会删掉尚未登记到快照的块。
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支持多进程部署，只在进程内互斥
+    fcntl = None
+
+CHUNK_MIN_BYTES = 64 * 1024        # 最小块长度
+CHUNK_MAX_BYTES = 4 * 1024 * 1024  # 最大块长度
+BOUNDARY_MASK = 0xFF               # 满足 crc32 & MASK == 0 的行作为切分点（约每 256 行一个）
+SNAPSHOT_SUFFIX = '.dedup'         # 快照在备份列表中的后缀
+CHUNK_SUFFIX = {'zstd': '.zst', 'gzip': '.gz', 'none': ''}
+LOCK_FILE = 'store.lock'
+
+# 同一进程内写快照与清理块互斥；有备份正在写入时跳过清理，避免删掉它刚生成、尚未登记到快照的块
+_store_lock = threading.Lock()
+_active_writers = 0
+
+
+def _compress(data, compression):
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().compress(data)
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+
+def _decompress(data, suffix):
+    if suffix == '.zst':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    if suffix == '.gz':
+        return gzip.decompress(data)
+    return data
+
+
+class ChunkWriter(io.TextIOBase):
+    """文本写入流：边写边切块、入库，关闭后 chunks 为本次备份的块列表"""
+
+    def __init__(self, store):
+        self._store = store
+        self._pending = ''
+        self._lines = []
+        self._size = 0
+        self._digest = hashlib.sha256()
+        self.chunks = []  # [[块ID, 原始长度], ...]
+        self.lock_fd = None  # store.lock 的共享锁（写入期间持有）
+        self.size = 0  # 原始总长度
+        self.new_chunks = 0  # 新写入的块数
+        self.new_bytes = 0  # 新写入的块（压缩后）字节数
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        lines = (self._pending + text).split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self._add_line((line + '\n').encode('utf8'))
+        return len(text)
+
+    def _add_line(self, line):
+        # 每张表从新块开始，表之间互不影响
+        if self._lines and line.startswith(b'DROP TABLE IF EXISTS '):
+            self._cut()
+        self._lines.append(line)
+        self._size += len(line)
+        if self._size >= CHUNK_MAX_BYTES or (self._size >= CHUNK_MIN_BYTES and zlib.crc32(line) & BOUNDARY_MASK == 0):
+            self._cut()
+
+    def _cut(self):
+        data = b''.join(self._lines)
+        self._lines, self._size = [], 0
+        chunk_id, written = self._store.put(data)
+        if written:
+            self.new_chunks += 1
+            self.new_bytes += written
+        self.chunks.append([chunk_id, len(data)])
+        self.size += len(data)
+        self._digest.update(data)
+
+    def close(self):
+        if not self.closed:
+            if self._pending:
+                self._add_line(self._pending.encode('utf8'))
+                self._pending = ''
+            if self._lines:
+                self._cut()
+        super().close()
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+
+class ChunkStore:
+    def __init__(self, root, compression='gzip'):
+        self.root = root
+        self.compression = compression
+        self.chunk_dir = os.path.join(root, 'chunks')
+        self.snapshot_dir = os.path.join(root, 'snapshots')
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self._known = None
+
+    def _scan(self):
+        """已有块 {块ID: 文件路径}"""
+        chunks = {}
+        for prefix in os.scandir(self.chunk_dir):
+            if prefix.is_dir():
+                for entry in os.scandir(prefix.path):
+                    if not entry.name.endswith('.tmp'):
+                        chunks[entry.name.split('.', 1)[0]] = entry.path
+        return chunks
+
+    def _chunk_path(self, chunk_id):
+        if self._known is None:
+            self._known = self._scan()
+        return self._known.get(chunk_id)
+
+    def put(self, data):
+        """保存一个块，返回 (块ID, 新写入的字节数)；块已存在时不重复写入"""
+        chunk_id = hashlib.sha256(data).hexdigest()
+        if self._chunk_path(chunk_id):
+            return chunk_id, 0
+        directory = os.path.join(self.chunk_dir, chunk_id[:2])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, chunk_id + CHUNK_SUFFIX[self.compression])
+        payload = _compress(data, self.compression)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(payload)
+        os.replace(path + '.tmp', path)
+        self._known[chunk_id] = path
+        return chunk_id, len(payload)
+
+    def get(self, chunk_id):
+        path = self._chunk_path(chunk_id)
+        if path is None:
+            raise FileNotFoundError(f'备份数据块缺失：{chunk_id}')
+        with open(path, 'rb') as f:
+            data = _decompress(f.read(), os.path.splitext(path)[1])
+        if hashlib.sha256(data).hexdigest() != chunk_id:
+            raise ValueError(f'备份数据块校验失败：{chunk_id}')
+        return data
+
+    def _open_lock(self):
+        return os.open(os.path.join(self.root, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def writer(self):
+        global _active_writers
+        writer = ChunkWriter(self)
+        if fcntl is not None:
+            # 共享锁：多个备份可以同时写入，其他进程的 gc() 在此期间跳过（gc 执行中时等它结束）
+            writer.lock_fd = self._open_lock()
+            fcntl.flock(writer.lock_fd, fcntl.LOCK_SH)
+        with _store_lock:
+            _active_writers += 1
+        return writer
+
+    def release(self, writer):
+        """写入结束（快照已保存或备份失败放弃）"""
+        global _active_writers
+        with _store_lock:
+            _active_writers -= 1
+        if writer.lock_fd is not None:
+            os.close(writer.lock_fd)  # 关闭即释放锁
+            writer.lock_fd = None
+
+    def _snapshot_path(self, name):
+        return os.path.join(self.snapshot_dir, f'{name}.json')
+
+    def save_snapshot(self, name, writer, **info):
+        """保存快照清单（写入完成后调用）"""
+        snapshot = dict(info, name=name, size=writer.size, sha256=writer.sha256, chunks=writer.chunks)
+        path = self._snapshot_path(name)
+        with _store_lock:
+            with open(path + '.tmp', 'w', encoding='utf8') as f:
+                json.dump(snapshot, f)
+            os.replace(path + '.tmp', path)
+        return snapshot
+
+    def load_snapshot(self, name):
+        with open(self._snapshot_path(name), encoding='utf8') as f:
+            return json.load(f)
+
+    def snapshots(self):
+        return sorted(entry[:-len('.json')] for entry in os.listdir(self.snapshot_dir) if entry.endswith('.json'))
+
+    def iter_bytes(self, name):
+        """按快照清单依次返回各块内容（恢复、下载时拼接）"""
+        for chunk_id, _ in self.load_snapshot(name)['chunks']:
+            yield self.get(chunk_id)
+
+    def restore_to(self, name, path):
+        """把快照还原为完整的 SQL 文件，校验整体 SHA-256"""
+        snapshot = self.load_snapshot(name)
+        digest = hashlib.sha256()
+        with open(path, 'wb') as f:
+            for data in self.iter_bytes(name):
+                digest.update(data)
+                f.write(data)
+        if digest.hexdigest() != snapshot['sha256']:
+            raise ValueError(f'备份 {name} 还原后校验失败')
+        return path
+
+    def delete_snapshot(self, name):
+        path = self._snapshot_path(name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def gc(self):
+        """删除不再被任何快照引用的块，返回 (删除块数, 释放字节数)；有备份正在写入（任一进程）时跳过"""
+        if fcntl is None:
+            return self._gc()
+        fd = self._open_lock()
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0, 0
+            return self._gc()
+        finally:
+            os.close(fd)
+
+    def _gc(self):
+        with _store_lock:
+            if _active_writers:
+                return 0, 0
+            referenced = set()
+            for name in self.snapshots():
+                referenced.update(chunk_id for chunk_id, _ in self.load_snapshot(name)['chunks'])
+            removed = freed = 0
+            for chunk_id, path in self._scan().items():
+                if chunk_id not in referenced:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+            self._known = None
+        return removed, freed
+
+    def usage(self):
+        """存储占用：块数、块文件总字节数、快照数"""
+        chunks = self._scan()
+        return {
+            'chunks': len(chunks),
+            'bytes': sum(os.path.getsize(path) for path in chunks.values()),
+            'snapshots': len(self.snapshots()),
+        }
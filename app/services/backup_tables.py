@@ -0,0 +1,297 @@
+"""按表备份与并行恢复（BACKUP_STORAGE = 'tables'，仅支持 MySQL）
+
+备份是一个目录 <名称>.tables/：每张表一个数据文件（压缩，每行一条多行 INSERT 语句），
+manifest.json 记录各表的建表语句、行数和校验和。所有表在同一个一致性快照事务中导出。
+
+恢复分四步：
+  1. 按建表语句重建各表，只保留主键（以及自增列所在的索引），其余索引和外键放到最后
+  2. 多个连接并行导入各表数据（会话内关闭 FOREIGN_KEY_CHECKS / UNIQUE_CHECKS），每批提交一次
+  3. 每张表一条 ALTER TABLE 重建二级索引，之后再补回外键（外键依赖被引用表上的索引）
+  4. 并行核对每张表的行数和校验和，与备份时记录的不一致则任务失败
+
+校验和与行的顺序无关：每行各列按导出时的 SQL 字面量拼接后取 8 字节 BLAKE2b，再按 2^64 取模累加。
+导出和核对都在 Python 中计算（与 MySQL 版本、字符集设置无关），只需在同一驱动下读取。
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from datetime import datetime
+
+from app import db
+from app.services.backup import FETCH_SIZE, open_backup, _noop, _server_cursor, _sql_value
+
+TABLE_MANIFEST = 'manifest.json'
+COMMIT_EVERY = 20  # 导入时每执行多少条 INSERT（每条 FETCH_SIZE 行）提交一次
+CHECKSUM_MASK = (1 << 64) - 1
+DATA_SUFFIX = {'zstd': '.sql.zst', 'gzip': '.sql.gz', 'none': '.sql'}
+
+# 建表语句中推迟到数据导入之后再创建的定义（外键单独一组，在索引之后添加）
+_DEFERRED_KEY = re.compile(r'^(UNIQUE KEY|KEY|FULLTEXT KEY|SPATIAL KEY) ')
+_FOREIGN_KEY = re.compile(r'^CONSTRAINT `[^`]+` FOREIGN KEY ')
+_AUTO_INCREMENT_COLUMN = re.compile(r'^`([^`]+)` .*\bAUTO_INCREMENT\b')
+_KEY_FIRST_COLUMN = re.compile(r'\(`([^`]+)`')
+
+
+class RestoreVerificationError(Exception):
+    """恢复后的行数或校验和与备份记录不一致"""
+
+
+def split_create_table(create_sql):
+    """把 SHOW CREATE TABLE 的结果拆成 (只含主键的建表语句, [索引子句], [外键子句])
+
+    自增列必须有索引，首列为自增列的索引保留在建表语句中。
+    """
+    lines = create_sql.split('\n')
+    head, body, tail = lines[0], [], []
+    for index, line in enumerate(lines[1:], 1):
+        if line.startswith(')'):
+            tail = lines[index:]
+            break
+        body.append(line.strip().rstrip(','))
+    auto_columns = {m.group(1) for m in map(_AUTO_INCREMENT_COLUMN.match, body) if m}
+    kept, keys, foreign_keys = [], [], []
+    for line in body:
+        if _FOREIGN_KEY.match(line):
+            foreign_keys.append(f'ADD {line}')
+        elif _DEFERRED_KEY.match(line):
+            first_column = _KEY_FIRST_COLUMN.search(line)
+            if first_column and first_column.group(1) in auto_columns:
+                kept.append(line)
+            else:
+                keys.append(f'ADD {line}')
+        else:
+            kept.append(line)
+    stripped = '\n'.join([head, ',\n'.join(f'  {line}' for line in kept)] + tail)
+    return stripped, keys, foreign_keys
+
+
+def row_checksum(rows, total=0):
+    """累加一批行的校验和（与行顺序无关），返回新的累计值"""
+    for row in rows:
+        text = '\x1f'.join(_sql_value(v) for v in row)
+        digest = hashlib.blake2b(text.encode('utf8'), digest_size=8).digest()
+        total = (total + int.from_bytes(digest, 'big')) & CHECKSUM_MASK
+    return total
+
+
+def _format_checksum(total):
+    return f'{total:016x}'
+
+
+def load_table_manifest(path):
+    with open(os.path.join(path, TABLE_MANIFEST), encoding='utf8') as f:
+        return json.load(f)
+
+
+def backup_size(path):
+    """备份目录中数据文件的总字节数"""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def export_tables(path, compression='gzip', progress=_noop):
+    """按表导出到目录 path（先写 path.part，完成后改名），返回 {'tables', 'rows', 'table_rows'}"""
+    part = path + '.part'
+    os.makedirs(part, exist_ok=True)
+    connection = db.engine.raw_connection()
+    tables = {}
+    try:
+        cursor = connection.cursor()
+        # 所有表读自同一个快照，备份内各表之间保持一致
+        cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        cursor.execute("SHOW TABLES")
+        names = [table[0] for table in cursor.fetchall()]
+        for index, table in enumerate(names):
+            progress(index * 100 / len(names), f'正在导出 {table}（{index + 1}/{len(names)}）')
+            cursor.execute(f"SHOW CREATE TABLE `{table}`")
+            create_sql = cursor.fetchone()[1]
+            filename = table + DATA_SUFFIX[compression]
+            rows = batches = checksum = 0
+            data_cursor = _server_cursor(connection)
+            data_cursor.execute(f"SELECT * FROM `{table}`")
+            with open_backup(os.path.join(part, filename), 'w', compression) as f:
+                while True:
+                    batch = data_cursor.fetchmany(FETCH_SIZE)
+                    if not batch:
+                        break
+                    values = ','.join(f"({', '.join(_sql_value(v) for v in row)})" for row in batch)
+                    f.write(f"INSERT INTO `{table}` VALUES {values};\n")
+                    checksum = row_checksum(batch, checksum)
+                    rows += len(batch)
+                    batches += 1
+                    progress(index * 100 / len(names), f'正在导出 {table}（{index + 1}/{len(names)}），已写入 {rows} 行')
+            data_cursor.close()
+            tables[table] = {'file': filename, 'create': create_sql, 'rows': rows, 'batches': batches,
+                             'checksum': _format_checksum(checksum)}
+        connection.commit()
+        cursor.close()
+    except BaseException:
+        shutil.rmtree(part, ignore_errors=True)
+        raise
+    finally:
+        connection.close()
+
+    manifest = {'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'database': db.engine.url.database,
+                'compression': compression, 'tables': tables}
+    with open(os.path.join(part, TABLE_MANIFEST), 'w', encoding='utf8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(part, path)
+    table_rows = {table: info['rows'] for table, info in tables.items()}
+    return {'tables': len(tables), 'rows': sum(table_rows.values()), 'table_rows': table_rows}
+
+
+class _ParallelRestore:
+    """一次恢复：各阶段的并行执行、进度计数和取消标记"""
+
+    def __init__(self, path, workers, progress):
+        self.path = path
+        self.manifest = load_table_manifest(path)
+        self.tables = self.manifest['tables']
+        self.workers = max(1, workers)
+        self.progress = progress
+        self.engine = db.engine  # 工作线程没有应用上下文，直接使用引擎
+        self.stop = threading.Event()
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = self.engine.raw_connection()
+        cursor = connection.cursor()
+        cursor.execute("SET SESSION FOREIGN_KEY_CHECKS = 0, UNIQUE_CHECKS = 0")
+        return connection, cursor
+
+    def _release(self, connection, cursor):
+        # 连接会归还连接池，先恢复会话设置
+        try:
+            cursor.execute("SET SESSION FOREIGN_KEY_CHECKS = 1, UNIQUE_CHECKS = 1")
+            cursor.close()
+        finally:
+            connection.close()
+
+    def _advance(self, count=1):
+        with self._lock:
+            self.done += count
+
+    def _run_stage(self, func, items, start, end, label):
+        """并行执行 func(item)，按完成量把进度从 start 推进到 end；取消或出错时通知其他线程停止"""
+        self.done = 0
+        total = sum(weight for _, weight in items) or 1
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='restore') as executor:
+            futures = [executor.submit(func, item) for item, _ in items]
+            try:
+                while True:
+                    finished, pending = wait(futures, timeout=1, return_when=FIRST_EXCEPTION)
+                    for future in finished:
+                        future.result()  # 有线程出错时立即抛出
+                    if not pending:
+                        break
+                    self.progress(start + (end - start) * min(self.done, total) / total,
+                                  f'{label}（{len(finished)}/{len(futures)} 张表完成）')
+            except BaseException:
+                self.stop.set()
+                raise
+
+    def create_tables(self):
+        connection, cursor = self._connect()
+        try:
+            for table, info in self.tables.items():
+                cursor.execute(f"DROP TABLE IF EXISTS `{table}`")
+                cursor.execute(split_create_table(info['create'])[0])
+            connection.commit()
+        finally:
+            self._release(connection, cursor)
+
+    def load_table(self, table):
+        info = self.tables[table]
+        connection, cursor = self._connect()
+        try:
+            with open_backup(os.path.join(self.path, info['file'])) as f:
+                for count, line in enumerate(f, 1):
+                    if self.stop.is_set():
+                        return
+                    cursor.execute(line.rstrip('\n').rstrip(';'))
+                    if count % COMMIT_EVERY == 0:
+                        connection.commit()
+                    self._advance()
+            connection.commit()
+        finally:
+            self._release(connection, cursor)
+
+    def alter_table(self, item):
+        table, clauses = item
+        if self.stop.is_set():
+            return
+        connection, cursor = self._connect()
+        try:
+            cursor.execute(f"ALTER TABLE `{table}` {', '.join(clauses)}")
+            self._advance()
+        finally:
+            self._release(connection, cursor)
+
+    def verify_table(self, table):
+        info = self.tables[table]
+        connection = self.engine.raw_connection()
+        try:
+            cursor = _server_cursor(connection)
+            cursor.execute(f"SELECT * FROM `{table}`")
+            rows = checksum = 0
+            while not self.stop.is_set():
+                batch = cursor.fetchmany(FETCH_SIZE)
+                if not batch:
+                    break
+                checksum = row_checksum(batch, checksum)
+                rows += len(batch)
+                self._advance()
+            cursor.close()
+        finally:
+            connection.close()
+        if self.stop.is_set():
+            return None
+        return table, rows, _format_checksum(checksum)
+
+    def verify(self, start, end):
+        """核对各表行数和校验和，返回不一致的表列表"""
+        mismatched = []
+
+        def check(table):
+            outcome = self.verify_table(table)
+            if outcome:
+                _, rows, checksum = outcome
+                expected = self.tables[table]
+                if rows != expected['rows'] or checksum != expected['checksum']:
+                    with self._lock:
+                        mismatched.append(f"{table}（行数 {rows}/{expected['rows']}）")
+
+        self._run_stage(check, [(t, i['batches'] or 1) for t, i in self.tables.items()], start, end, '正在核对数据')
+        return mismatched
+
+    def run(self):
+        self.progress(0, f'正在重建 {len(self.tables)} 张表', force=True)
+        self.create_tables()
+        self._run_stage(self.load_table, [(t, i['batches']) for t, i in self.tables.items()], 2, 75, '正在导入数据')
+
+        keys, foreign_keys = [], []
+        for table, info in self.tables.items():
+            _, table_keys, table_foreign_keys = split_create_table(info['create'])
+            if table_keys:
+                keys.append(((table, table_keys), 1))
+            if table_foreign_keys:
+                foreign_keys.append(((table, table_foreign_keys), 1))
+        self._run_stage(self.alter_table, keys, 75, 85, '正在重建索引')
+        self._run_stage(self.alter_table, foreign_keys, 85, 88, '正在添加外键')
+
+        mismatched = self.verify(88, 100)
+        if mismatched:
+            raise RestoreVerificationError(f"恢复后数据与备份不一致：{'、'.join(mismatched)}")
+        rows = sum(info['rows'] for info in self.tables.values())
+        return {'tables': len(self.tables), 'rows': rows, 'indexes': sum(len(c) for (_, c), _ in keys),
+                'foreign_keys': sum(len(c) for (_, c), _ in foreign_keys), 'verified': True}
+
+
+def restore_tables(path, workers=4, progress=_noop):
+    """从按表备份目录并行恢复并核对，返回 {'tables', 'rows', 'indexes', 'foreign_keys', 'verified'}"""
+    return _ParallelRestore(path, workers, progress).run()
@@ -0,0 +1,252 @@
+"""药品目录批量导入（CSV）
+
+按块流式解析供应商目录，规范化 (名称, 规格) 后与库中药品按规范化的键匹配，再按 uq_medicine_name_spec
+唯一约束批量 upsert：已存在的药品更新文件中出现的列，不存在的新增（库存为 0）。
+分类/单位名称通过缓存字典解析，错误行写入可下载的错误报告。
+"""
+import csv
+import io
+import os
+import re
+import unicodedata
+from datetime import datetime
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Medicine, MedicineCategory, Unit
+
+# 目录列：字段名 -> 可接受的表头
+COLUMNS = {
+    'name': ('name', '药品名称'),
+    'specification': ('specification', '规格'),
+    'category': ('category', '分类'),
+    'unit': ('unit', '单位'),
+    'generic_name': ('generic_name', '通用名称'),
+    'approval_number': ('approval_number', '批准文号'),
+    'dosage_form': ('dosage_form', '剂型'),
+    'manufacturer': ('manufacturer', '生产厂家'),
+    'is_prescription': ('is_prescription', '处方药'),
+    'min_stock': ('min_stock', '最低库存'),
+    'retail_price': ('retail_price', '零售价'),
+    'remark': ('remark', '备注'),
+}
+# 直接写入 medicine 表的列（分类/单位另行解析为ID）
+PLAIN_COLUMNS = ('generic_name', 'approval_number', 'dosage_form', 'manufacturer',
+                 'is_prescription', 'min_stock', 'retail_price', 'remark')
+PRESCRIPTION_VALUES = {'1': 1, '是': 1, '处方': 1, '处方药': 1, 'rx': 1,
+                       '0': 0, '否': 0, '非处方': 0, 'otc': 0, '': 0}
+
+
+class CatalogImportError(Exception):
+    """目录文件无法导入（缺少必填列等）"""
+
+
+def normalize_name(value):
+    """名称：全角转半角、去首尾空白、合并连续空白"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', value or '')).strip()
+
+
+def normalize_spec(value):
+    """规格：全角转半角、去掉全部空白（“10 mg * 24片” 与 “10mg*24片” 视为同一规格）"""
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', value or ''))
+
+
+class _Lookup:
+    """分类/单位名称 -> ID 的缓存，可选自动创建不存在的名称"""
+
+    def __init__(self, model, create_missing):
+        self.model = model
+        self.create_missing = create_missing
+        self.ids = {name: id_ for id_, name in db.session.execute(select(model.id, model.name)).all()}
+
+    def resolve(self, name):
+        name = normalize_name(name)
+        if not name:
+            return None
+        if name not in self.ids:
+            if not self.create_missing:
+                raise ValueError(f'{name} 不存在')
+            obj = self.model(name=name)
+            db.session.add(obj)
+            db.session.commit()  # 立即提交，后续批次回滚时缓存的ID仍然有效
+            self.ids[name] = obj.id
+        return self.ids[name]
+
+
+def _upsert_statement(columns):
+    """按数据库方言生成基于 (name, specification) 唯一约束的 upsert 语句"""
+    table = Medicine.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        new = stmt.inserted
+    elif dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        new = stmt.excluded
+    else:
+        raise CatalogImportError(f'不支持的数据库：{dialect}')
+
+    values = {col: new[col] for col in columns if col in PLAIN_COLUMNS}
+    # 空的分类/单位不覆盖原值
+    for col in ('category_id', 'unit_id'):
+        values[col] = func.coalesce(new[col], table.c[col])
+    if dialect == 'mysql':
+        return stmt.on_duplicate_key_update(**values)
+    return stmt.on_conflict_do_update(index_elements=['name', 'specification'], set_=values)
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=1000, create_missing=False):
+        self.batch_size = batch_size
+        self.categories = _Lookup(MedicineCategory, create_missing)
+        self.units = _Lookup(Unit, create_missing)
+        self.errors = []  # [(行号, 名称, 规格, 原因)]
+        self.inserted = self.updated = 0
+        self.keys = None  # 规范化的 (名称, 规格) -> 库中原值，第一批导入前加载
+
+    def _parse_row(self, raw):
+        row = {'name': normalize_name(raw.get('name')), 'specification': normalize_spec(raw.get('specification'))}
+        if not row['name'] or not row['specification']:
+            raise ValueError('药品名称和规格不能为空')
+        try:
+            row['category_id'] = self.categories.resolve(raw.get('category'))
+        except ValueError as e:
+            raise ValueError(f'分类{e}')
+        try:
+            row['unit_id'] = self.units.resolve(raw.get('unit'))
+        except ValueError as e:
+            raise ValueError(f'单位{e}')
+
+        for col in ('generic_name', 'dosage_form', 'manufacturer', 'remark'):
+            row[col] = normalize_name(raw.get(col)) or None
+        row['approval_number'] = normalize_spec(raw.get('approval_number')) or None
+        try:
+            row['min_stock'] = int(raw.get('min_stock') or 0)
+            row['retail_price'] = float(raw.get('retail_price') or 0)
+        except ValueError:
+            raise ValueError('最低库存或零售价格式错误')
+        flag = (raw.get('is_prescription') or '').strip().lower()
+        if flag not in PRESCRIPTION_VALUES:
+            raise ValueError('处方药列只能填 是/否')
+        row['is_prescription'] = PRESCRIPTION_VALUES[flag]
+        return row
+
+    def _load_keys(self):
+        """全部已有药品：规范化的 (名称, 规格) -> 库中原值
+
+        库中名称可能未规范化（药品维护页录入的全角字符、连续空格），按规范化后的名称
+        用 IN 查询找不到这些药品，upsert 又命中不了唯一约束，会插入重复药品，
+        因此导入开始时一次取出全部 (名称, 规格) 在内存中按规范化的键匹配。
+        """
+        keys = {}
+        for name, spec in db.session.execute(select(Medicine.name, Medicine.specification)):
+            keys.setdefault((normalize_name(name), normalize_spec(spec)), (name, spec))
+        return keys
+
+    def _existing(self, rows):
+        """本批次涉及的已有药品：规范化的 (名称, 规格) -> 库中原值，以及批准文号 -> (名称, 规格)"""
+        if self.keys is None:
+            self.keys = self._load_keys()
+        approvals = list({r['approval_number'] for r in rows if r['approval_number']})
+        owners = {}
+        if approvals:
+            for number, name, spec in db.session.execute(
+                    select(Medicine.approval_number, Medicine.name, Medicine.specification)
+                    .where(Medicine.approval_number.in_(approvals))):
+                owners[number] = (normalize_name(name), normalize_spec(spec))
+        return self.keys, owners
+
+    def _flush_batch(self, batch, columns):
+        # 同一文件中重复的 (名称, 规格) 以最后一行为准
+        merged = {}
+        for line_no, row in batch:
+            merged[(row['name'], row['specification'])] = (line_no, row)
+        keys, owners = self._existing([row for _, row in merged.values()])
+
+        rows, seen_approvals = [], {}
+        for key, (line_no, row) in merged.items():
+            number = row['approval_number']
+            owner = owners.get(number) or seen_approvals.get(number)
+            if number and owner and owner != key:
+                self.errors.append((line_no, row['name'], row['specification'], f'批准文号 {number} 已被其他药品使用'))
+                continue
+            if number:
+                seen_approvals[number] = key
+            if key in keys:
+                # 库中已有写法不同的同一药品时沿用原值，保证命中唯一约束
+                row['name'], row['specification'] = keys[key]
+            row['stock'] = 0
+            rows.append((line_no, key in keys, row))
+        if not rows:
+            return
+
+        stmt = _upsert_statement(columns)
+        try:
+            db.session.execute(stmt, [row for _, _, row in rows])
+            db.session.commit()
+        except IntegrityError:
+            # 整批失败时逐行重试，定位出错的行
+            db.session.rollback()
+            ok = []
+            for item in rows:
+                line_no, _, row = item
+                try:
+                    db.session.execute(stmt, [row])
+                    db.session.commit()
+                    ok.append(item)
+                except IntegrityError as e:
+                    db.session.rollback()
+                    self.errors.append((line_no, row['name'], row['specification'], f'违反唯一约束：{e.orig}'))
+            rows = ok
+        for _, exists, row in rows:
+            if not exists:  # 新增的药品按规范化的值写入，后续批次据此判断已存在
+                keys[(row['name'], row['specification'])] = (row['name'], row['specification'])
+        existed = sum(1 for _, exists, _ in rows if exists)
+        self.updated += existed
+        self.inserted += len(rows) - existed
+
+    def run(self, stream, encoding='utf-8-sig'):
+        reader = csv.reader(io.TextIOWrapper(stream, encoding=encoding, newline=''))
+        header = [h.strip() for h in next(reader, [])]
+        index = {}
+        for field, names in COLUMNS.items():
+            for name in names:
+                if name in header:
+                    index[field] = header.index(name)
+                    break
+        if 'name' not in index or 'specification' not in index:
+            raise CatalogImportError('CSV 缺少必填列：药品名称(name)、规格(specification)')
+        # 更新已有药品时只覆盖文件中出现的列
+        columns = [field for field in index if field in PLAIN_COLUMNS]
+
+        batch = []
+        for line_no, cells in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in cells):
+                continue
+            raw = {field: (cells[i] if i < len(cells) else '') for field, i in index.items()}
+            try:
+                batch.append((line_no, self._parse_row(raw)))
+            except ValueError as e:
+                self.errors.append((line_no, raw.get('name', ''), raw.get('specification', ''), str(e)))
+            if len(batch) >= self.batch_size:
+                self._flush_batch(batch, columns)
+                batch = []
+        if batch:
+            self._flush_batch(batch, columns)
+        db.session.commit()  # 提交自动创建的分类/单位
+        return {'inserted': self.inserted, 'updated': self.updated, 'errors': len(self.errors)}
+
+    def write_error_report(self, report_dir):
+        """错误行写入 CSV（Excel 可直接打开），返回文件名；没有错误时返回 None"""
+        if not self.errors:
+            return None
+        os.makedirs(report_dir, exist_ok=True)
+        filename = f"catalog_errors_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        with open(os.path.join(report_dir, filename), 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['行号', '药品名称', '规格', '错误原因'])
+            writer.writerows(sorted(self.errors))
+        return filename
@@ -0,0 +1,40 @@
+"""单据乐观锁：采购单、销售单的 version 列（mapper 的 version_id_col）
+
+编辑页表单带上打开页面时的版本号，填写表单期间不持有任何锁。保存时：
+  1. check_version() 锁定单据行（SELECT ... FOR UPDATE）并比较版本号，不一致说明其他人已保存过，
+     抛出 VersionConflict，路由回滚并展示最新数据；
+  2. 版本号加一，提交时 UPDATE ... SET version = :v + 1 WHERE version = :v（version_id_col，
+     不支持行锁的数据库也能检查出冲突，此时抛出 StaleDataError，路由按冲突处理）。
+"""
+from sqlalchemy.orm.exc import StaleDataError
+
+from app import db
+
+
+class VersionConflict(Exception):
+    def __init__(self, current, submitted):
+        super().__init__(f'单据已被其他用户修改（当前版本 {current}，提交的版本 {submitted}）')
+        self.current = current
+        self.submitted = submitted
+
+
+def check_version(order, submitted):
+    """保存单据前调用（在修改单据之前）：锁定单据行并重新读取，版本号与表单提交的不一致时抛出 VersionConflict
+
+    submitted 为空（旧页面、未传版本号的接口调用）时不比较，只保证本次提交与并发提交不互相覆盖；
+    不是整数时同样按冲突处理（无法确认提交的是哪个版本）。
+    """
+    db.session.refresh(order, with_for_update=True)
+    if submitted not in (None, ''):
+        try:
+            version = int(submitted)
+        except (TypeError, ValueError):
+            raise VersionConflict(order.version, submitted)
+        if version != order.version:
+            raise VersionConflict(order.version, version)
+    # 每次保存版本号加一（主表字段没有变化时也会 UPDATE），其他人打开的旧页面保存时才能发现冲突
+    order.version += 1
+
+
+# 路由中按冲突处理的异常
+CONFLICT_ERRORS = (VersionConflict, StaleDataError)
@@ -0,0 +1,131 @@
+"""首页 KPI：今日销售、待审核单据、低库存药品、近效期批次
+
+指标由三条汇总查询计算（读取销售日汇总表、效期分组汇总表，不扫描单据明细），结果缓存在进程内：
+  - 缓存 DASHBOARD_TTL 秒后过期
+  - 会话提交了单据、药品库存、批次或汇总表的改动后标记为过期，下一次请求重新计算
+    （距上次计算不足 DASHBOARD_MIN_REFRESH_SECONDS 秒时仍返回缓存，避免频繁写入时每个请求都重算）
+  - 跨过零点后“今日”变化，立即重新计算
+"""
+import threading
+import time
+from datetime import date, datetime
+
+from sqlalchemy import event, func, select
+
+from app import db
+from app.models import (
+    Purchase, Sale, Medicine, StockLot, ExpiryBucketStat, SalesDailyRollup, PurchaseDetail, SaleDetail
+)
+from app.services.expiry import BUCKETS
+from app.services.replica import RoutingSession
+
+# 这些表有改动时首页指标需要刷新
+WATCHED = (Purchase, PurchaseDetail, Sale, SaleDetail, Medicine, StockLot, ExpiryBucketStat, SalesDailyRollup)
+
+
+class Dashboard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._computed_at = 0.0
+        self._stale = True
+        self.ttl = 60
+        self.min_refresh = 2
+        self.low_stock_threshold = 10
+        self.stats = {'hits': 0, 'refreshes': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.ttl = app.config['DASHBOARD_TTL']
+        self.min_refresh = app.config['DASHBOARD_MIN_REFRESH_SECONDS']
+        self.low_stock_threshold = app.config['LOW_STOCK_THRESHOLD']
+
+    def _fresh(self):
+        if self._value is None or self._value['today']['date'] != date.today().isoformat():
+            return False
+        age = time.monotonic() - self._computed_at
+        return age < self.ttl and (not self._stale or age < self.min_refresh)
+
+    def kpis(self):
+        """首页指标（缓存），同一时间只有一个请求在重新计算"""
+        if self._fresh():
+            self.stats['hits'] += 1
+            return self._value
+        with self._lock:
+            if not self._fresh():
+                self._stale = False  # 计算期间提交的改动会再次标记为过期
+                self._value = self.compute()
+                self._computed_at = time.monotonic()
+                self.stats['refreshes'] += 1
+            else:
+                self.stats['hits'] += 1
+        return self._value
+
+    def invalidate(self):
+        self._stale = True
+        self.stats['invalidations'] += 1
+
+    def compute(self):
+        today = date.today()
+        warn_level = db.case((Medicine.min_stock > 0, Medicine.min_stock), else_=self.low_stock_threshold)
+        counts = db.session.execute(select(
+            select(func.count()).where(Sale.sale_date == today, Sale.audit_status == 1).scalar_subquery(),
+            select(func.count()).where(Purchase.audit_status == 0).scalar_subquery(),
+            select(func.count()).where(Sale.audit_status == 0).scalar_subquery(),
+            select(func.count()).where(Medicine.stock <= warn_level).scalar_subquery(),
+        )).one()
+        sold = db.session.execute(
+            select(func.sum(SalesDailyRollup.quantity), func.sum(SalesDailyRollup.amount))
+            .where(SalesDailyRollup.sale_date == today)
+        ).one()
+        expiring = {code: {'lot_count': 0, 'quantity': 0} for code, _, _ in BUCKETS}
+        for bucket, lot_count, quantity in db.session.execute(
+            select(ExpiryBucketStat.bucket, func.sum(ExpiryBucketStat.lot_count), func.sum(ExpiryBucketStat.quantity))
+            .group_by(ExpiryBucketStat.bucket)
+        ):
+            if bucket in expiring:
+                expiring[bucket] = {'lot_count': int(lot_count or 0), 'quantity': int(quantity or 0)}
+        return {
+            'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'today': {
+                'date': today.isoformat(),
+                'sales': counts[0],  # 今日已审核销售单数
+                'quantity': int(sold[0] or 0),
+                'amount': round(float(sold[1] or 0), 2),
+            },
+            'pending_audits': {'purchase': counts[1], 'sale': counts[2]},
+            'low_stock': counts[3],
+            'expiring': expiring,
+        }
+
+    def status(self):
+        return dict(self.stats, stale=self._stale, ttl=self.ttl,
+                    age_seconds=round(time.monotonic() - self._computed_at, 1) if self._value else None)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_changes(session, flush_context):
+    if any(isinstance(obj, WATCHED) for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        session.info['dashboard_changed'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_bulk_changes(orm_execute_state):
+    # 汇总表、效期统计通过 update()/insert() 语句增量更新，不经过 flush
+    if orm_execute_state.is_select or orm_execute_state.bind_mapper is None:
+        return
+    if issubclass(orm_execute_state.bind_mapper.class_, WATCHED):
+        orm_execute_state.session.info['dashboard_changed'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _refresh(session):
+    if session.info.pop('dashboard_changed', False):
+        dashboard.invalidate()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard(session):
+    session.info.pop('dashboard_changed', None)
+
+
+dashboard = Dashboard()
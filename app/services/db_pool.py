@@ -0,0 +1,103 @@
+"""数据库连接池监控：统计连接等待时间、占用数和溢出次数，用于按数据库容量规划 worker 数"""
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """连接池计数器（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0            # 累计取连接次数
+        self.total_wait = 0.0         # 累计等待时间（秒）
+        self.max_wait = 0.0           # 最长单次等待时间（秒）
+        self.overflow_events = 0      # 超出 pool_size 新建连接的次数
+        self.timeouts = 0             # 等待超时次数
+
+    def record_checkout(self, wait):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+
+    def record_overflow(self):
+        with self._lock:
+            self.overflow_events += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            avg_wait = self.total_wait / self.checkouts if self.checkouts else 0.0
+            return {
+                'checkouts': self.checkouts,
+                'avg_wait_ms': round(avg_wait * 1000, 3),
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """带监控的 QueuePool：在取连接和创建溢出连接时记录统计"""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record_checkout(time.perf_counter() - start)
+        return record
+
+    def _inc_overflow(self):
+        created = super()._inc_overflow()
+        # _overflow 从 -pool_size 开始计数，大于 0 说明本次新建的是溢出连接
+        if created and self._overflow > 0:
+            self.stats.record_overflow()
+        return created
+
+
+# QueuePool 才有的参数（StaticPool 不接受）
+POOL_SIZING_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+def init_pool(app):
+    """在 db.init_app 之前调用：为文件型数据库启用带监控的连接池"""
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    # SQLite 内存库使用 StaticPool，去掉连接池大小等参数
+    if uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/') == 'sqlite:'):
+        for key in POOL_SIZING_OPTIONS:
+            options.pop(key, None)
+    else:
+        options.setdefault('poolclass', InstrumentedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def pool_status(engine):
+    """返回连接池当前状态和累计统计"""
+    pool = engine.pool
+    status = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'pool_size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),   # 当前占用连接数
+            'overflow': max(pool.overflow(), 0),  # 当前溢出连接数
+        })
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
@@ -0,0 +1,165 @@
+"""近效期/过期库存扫描
+
+每个有剩余数量的批次按有效期归入效期分组（已过期、30/60/90天内到期），
+分组写在 stock_lot.expiry_bucket 上并在 expiry_bucket_stat 中按仓库汇总。
+批次入库、出库时增量更新（计入时用数据库的 upsert，并发审核同一仓库、同一分组的单据不会因唯一约束冲突而失败）；
+日期推移导致的分组变化由每日扫描统一刷新。
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app import db
+from app.models import StockLot, ExpiryBucketStat
+
+# 效期分组（代码, 名称, 距今天数上限）
+BUCKETS = [
+    ('expired', '已过期', 0),
+    ('d30', '30天内到期', 30),
+    ('d60', '60天内到期', 60),
+    ('d90', '90天内到期', 90),
+]
+BUCKET_NAMES = {code: name for code, name, _ in BUCKETS}
+
+
+def bucket_for(expiry_date, today=None):
+    """计算有效期所属分组，90天以外或无有效期返回 None"""
+    if expiry_date is None:
+        return None
+    today = today or date.today()
+    if expiry_date < today:
+        return 'expired'
+    days = (expiry_date - today).days
+    for code, _, limit in BUCKETS[1:]:
+        if days <= limit:
+            return code
+    return None
+
+
+def _upsert_statement():
+    """按数据库方言生成基于 uq_expiry_bucket_warehouse 的累加 upsert 语句，不支持的数据库返回 None"""
+    table = ExpiryBucketStat.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        new = stmt.inserted
+    elif dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        new = stmt.excluded
+    else:
+        return None
+
+    values = {col: table.c[col] + new[col] for col in ('lot_count', 'quantity')}
+    values['update_time'] = new.update_time
+    if dialect == 'mysql':
+        return stmt.on_duplicate_key_update(**values)
+    return stmt.on_conflict_do_update(index_elements=['warehouse_id', 'bucket'], set_=values)
+
+
+def _adjust_stat(warehouse_id, bucket, lot_delta, qty_delta):
+    """原子增减某仓库某分组的汇总：计入时不存在则插入，扣除时只更新已有的行"""
+    warehouse_id = warehouse_id or 0
+    upsert = _upsert_statement() if lot_delta > 0 else None
+    if upsert is not None:
+        db.session.execute(upsert.values(
+            warehouse_id=warehouse_id, bucket=bucket,
+            lot_count=lot_delta, quantity=qty_delta, update_time=datetime.now()
+        ))
+        return
+    result = db.session.execute(
+        update(ExpiryBucketStat)
+        .where(ExpiryBucketStat.warehouse_id == warehouse_id, ExpiryBucketStat.bucket == bucket)
+        .values(
+            lot_count=ExpiryBucketStat.lot_count + lot_delta,
+            quantity=ExpiryBucketStat.quantity + qty_delta,
+            update_time=datetime.now()
+        )
+    )
+    if result.rowcount == 0 and lot_delta > 0:
+        db.session.add(ExpiryBucketStat(
+            warehouse_id=warehouse_id, bucket=bucket,
+            lot_count=lot_delta, quantity=qty_delta
+        ))
+
+
+def untrack(lot):
+    """批次数量变动或删除前调用：从汇总中扣除该批次当前的贡献"""
+    if lot.expiry_bucket:
+        _adjust_stat(lot.warehouse_id, lot.expiry_bucket, -1, -lot.remaining)
+
+
+def track(lot, today=None):
+    """批次数量变动或新建后调用：重新计算分组并计入汇总"""
+    lot.expiry_bucket = bucket_for(lot.expiry_date, today) if lot.remaining > 0 else None
+    if lot.expiry_bucket:
+        _adjust_stat(lot.warehouse_id, lot.expiry_bucket, 1, lot.remaining)
+
+
+def scan_expiry(today=None):
+    """每日扫描：按当天日期重新划分所有批次的效期分组并重建汇总，返回各分组批次数"""
+    today = today or date.today()
+    horizon = today + timedelta(days=BUCKETS[-1][2])
+
+    bucket_expr = case(
+        (StockLot.expiry_date < today, 'expired'),
+        *[(StockLot.expiry_date <= today + timedelta(days=limit), code) for code, _, limit in BUCKETS[1:]],
+        else_=None
+    )
+    # 只更新可能变化的批次：90天内到期的，或原来已有分组的
+    db.session.execute(
+        update(StockLot)
+        .where(
+            StockLot.remaining > 0,
+            StockLot.expiry_date.isnot(None),
+            db.or_(StockLot.expiry_date <= horizon, StockLot.expiry_bucket.isnot(None))
+        )
+        .values(expiry_bucket=bucket_expr),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        update(StockLot)
+        .where(StockLot.remaining <= 0, StockLot.expiry_bucket.isnot(None))
+        .values(expiry_bucket=None),
+        execution_options={'synchronize_session': False}
+    )
+
+    # 重建汇总表
+    db.session.execute(ExpiryBucketStat.__table__.delete())
+    db.session.execute(
+        insert(ExpiryBucketStat).from_select(
+            ['warehouse_id', 'bucket', 'lot_count', 'quantity', 'update_time'],
+            select(
+                func.coalesce(StockLot.warehouse_id, 0),
+                StockLot.expiry_bucket,
+                func.count(StockLot.id),
+                func.sum(StockLot.remaining),
+                db.literal(datetime.now())
+            ).where(StockLot.expiry_bucket.isnot(None))
+            .group_by(func.coalesce(StockLot.warehouse_id, 0), StockLot.expiry_bucket)
+        )
+    )
+    db.session.commit()
+    return bucket_summary()
+
+
+def bucket_summary(warehouse_id=None):
+    """读取汇总表：{仓库ID: {分组: {'lot_count', 'quantity'}}}"""
+    query = ExpiryBucketStat.query.filter(ExpiryBucketStat.lot_count > 0)
+    if warehouse_id is not None:
+        query = query.filter(ExpiryBucketStat.warehouse_id == warehouse_id)
+    summary = {}
+    for stat in query:
+        summary.setdefault(stat.warehouse_id, {})[stat.bucket] = {
+            'lot_count': stat.lot_count,
+            'quantity': stat.quantity
+        }
+    return summary
+
+
+def bucket_lots(bucket, warehouse_id=None, limit=500):
+    """按 仓库+分组 读取批次明细（走 idx_lot_warehouse_bucket 索引）"""
+    query = StockLot.query.filter(StockLot.expiry_bucket == bucket)
+    if warehouse_id is not None:
+        query = query.filter(StockLot.warehouse_id == warehouse_id)
+    return query.order_by(StockLot.expiry_date.asc()).limit(limit).all()
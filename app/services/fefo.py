@@ -0,0 +1,175 @@
+"""批次库存与近效期先出（FEFO）分配
+
+采购单审核通过时按明细生成批次；销售单审核通过时按有效期从早到晚消耗本仓库的批次，
+并记录分配结果，撤销审核或删除单据时按分配记录归还。
+页面编辑和 API 保存单据时都通过 sync_purchase() / sync_sale() 按审核状态的变化维护批次。
+"""
+from collections import OrderedDict
+from datetime import date
+
+from app import db
+from app.models import StockLot, SaleLotAllocation
+from app.services import expiry
+
+
+class LotsConsumed(Exception):
+    """采购单生成的批次已被消耗（销售出库等），不能撤销审核或修改明细"""
+
+
+def receive_purchase(purchase, details):
+    """采购单审核通过：为每条明细生成一个批次，返回新批次列表"""
+    lots = []
+    for detail in details:
+        if not detail.quantity:
+            continue
+        lot = StockLot(
+            medicine_id=detail.medicine_id,
+            warehouse_id=purchase.warehouse_id,
+            purchase_id=purchase.purchase_id,
+            production_batch=detail.production_batch,
+            production_date=detail.production_date,
+            expiry_date=detail.expiry_date,
+            quantity=detail.quantity,
+            remaining=detail.quantity
+        )
+        db.session.add(lot)
+        expiry.track(lot)
+        lots.append(lot)
+    db.session.flush()
+    return lots
+
+
+def reverse_purchase(purchase_id):
+    """采购单撤销审核或删除：删除该单生成的批次
+
+    已被销售消耗的部分仅删除分配记录，对应销售数量视为未追踪批次的库存。
+    """
+    lot_ids = [lot_id for (lot_id,) in db.session.query(StockLot.id).filter_by(purchase_id=purchase_id)]
+    if not lot_ids:
+        return []
+    lots = StockLot.query.filter(StockLot.id.in_(lot_ids)).all()
+    SaleLotAllocation.query.filter(SaleLotAllocation.lot_id.in_(lot_ids)).delete(synchronize_session=False)
+    for lot in lots:
+        expiry.untrack(lot)
+        db.session.delete(lot)
+    db.session.flush()
+    return lots
+
+
+def purchase_consumed(purchase_id):
+    """采购单的批次是否已被消耗（剩余数量小于入库数量）"""
+    return db.session.query(StockLot.id).filter(
+        StockLot.purchase_id == purchase_id, StockLot.remaining < StockLot.quantity
+    ).first() is not None
+
+
+def _lot_signature(warehouse_id, medicine_id, batch, production_date, expiry_date, quantity):
+    return (int(warehouse_id) if warehouse_id not in (None, '') else None, int(medicine_id), batch or None,
+            production_date, expiry_date, int(quantity))
+
+
+def _lots_match(purchase, details):
+    """现有批次是否与明细一致（仓库、药品、批号、生产日期、有效期、数量）"""
+    lots = StockLot.query.filter_by(purchase_id=purchase.purchase_id).all()
+    existing = sorted(_lot_signature(lot.warehouse_id, lot.medicine_id, lot.production_batch, lot.production_date,
+                                     lot.expiry_date, lot.quantity) for lot in lots)
+    wanted = sorted(_lot_signature(purchase.warehouse_id, d.medicine_id, d.production_batch, d.production_date,
+                                   d.expiry_date, d.quantity) for d in details if d.quantity)
+    return existing == wanted
+
+
+def sync_purchase(purchase, old_status, details):
+    """采购单保存时按审核状态变化维护批次（页面编辑、API 共用），old_status 为保存前的审核状态（新建传 None）
+
+    变为已审核时生成批次，从已审核变为其他状态时撤销批次。已审核单据重新保存且明细未变时保留原批次
+    （含已销售消耗的数量）；批次已被消耗时不能撤销审核或修改明细，抛出 LotsConsumed。
+    """
+    was_audited, audited = old_status == 1, int(purchase.audit_status or 0) == 1
+    if was_audited and audited and _lots_match(purchase, details):
+        return []
+    if was_audited:
+        if purchase_consumed(purchase.purchase_id):
+            raise LotsConsumed(f'采购单 {purchase.purchase_id} 的批次已有出库，不能撤销审核或修改明细、仓库')
+        reverse_purchase(purchase.purchase_id)
+    if audited:
+        return receive_purchase(purchase, details)
+    return []
+
+
+def _fefo_key(lot):
+    """排序规则：有效期早的优先，无有效期的排最后"""
+    return (lot.expiry_date is None, lot.expiry_date, lot.id)
+
+
+def allocate_sale(sale_id, warehouse_id, items):
+    """销售单审核通过：按 FEFO 消耗批次
+
+    items 为 (medicine_id, quantity) 序列。只消耗销售单所在仓库的批次，所有药品的可用批次通过
+    idx_lot_medicine_expiry 一次范围读取并加行锁。批次不足的部分（系统上线前的
+    历史库存）不分配，总库存仍以 Medicine.stock 为准。返回新增的分配记录。
+    """
+    warehouse_id = int(warehouse_id) if warehouse_id not in (None, '') else None
+    demand = OrderedDict()
+    for medicine_id, quantity in items:
+        if quantity:
+            demand[int(medicine_id)] = demand.get(int(medicine_id), 0) + int(quantity)
+    if not demand:
+        return []
+
+    # 已过期批次不参与销售分配，等待效期检查后下架处理
+    lots = StockLot.query.filter(
+        StockLot.medicine_id.in_(list(demand.keys())),
+        StockLot.remaining > 0,
+        StockLot.warehouse_id == warehouse_id if warehouse_id is not None else StockLot.warehouse_id.is_(None),
+        db.or_(StockLot.expiry_date.is_(None), StockLot.expiry_date >= date.today())
+    ).order_by(StockLot.medicine_id, StockLot.expiry_date).with_for_update().all()
+
+    lots_by_medicine = {}
+    for lot in lots:
+        lots_by_medicine.setdefault(lot.medicine_id, []).append(lot)
+
+    allocations = []
+    for medicine_id, needed in demand.items():
+        for lot in sorted(lots_by_medicine.get(medicine_id, []), key=_fefo_key):
+            if needed <= 0:
+                break
+            take = min(lot.remaining, needed)
+            expiry.untrack(lot)
+            lot.remaining -= take
+            expiry.track(lot)
+            needed -= take
+            allocation = SaleLotAllocation(sale_id=sale_id, medicine_id=medicine_id, lot_id=lot.id, quantity=take)
+            db.session.add(allocation)
+            allocations.append(allocation)
+    db.session.flush()
+    return allocations
+
+
+def release_sale(sale_id):
+    """销售单撤销审核或删除：按分配记录把数量归还到原批次"""
+    allocations = SaleLotAllocation.query.filter_by(sale_id=sale_id).all()
+    if not allocations:
+        return []
+    lot_ids = {a.lot_id for a in allocations}
+    lots = {lot.id: lot for lot in StockLot.query.filter(StockLot.id.in_(lot_ids)).with_for_update()}
+    for allocation in allocations:
+        lot = lots.get(allocation.lot_id)
+        if lot:
+            expiry.untrack(lot)
+            lot.remaining += allocation.quantity
+            expiry.track(lot)
+        db.session.delete(allocation)
+    db.session.flush()
+    return allocations
+
+
+def sync_sale(sale, old_status, items):
+    """销售单保存时按审核状态变化维护批次分配（页面编辑、API 共用），old_status 为保存前的审核状态（新建传 None）
+
+    从已审核保存时先归还原分配，保存后为已审核时按 items（(medicine_id, quantity) 序列）重新分配。
+    """
+    if old_status == 1:
+        release_sale(sale.sale_id)
+    if int(sale.audit_status or 0) == 1:
+        return allocate_sale(sale.sale_id, sale.warehouse_id, items)
+    return []
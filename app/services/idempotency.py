@@ -0,0 +1,232 @@
+"""接口幂等键：POS 客户端超时重试新增采购单/销售单时，不重复建单、不重复增减库存
+
+请求带 Idempotency-Key 请求头时（不带则照常执行），按 (用户, 接口, 键) 记入 idempotency_key 表：
+  1. 首次请求先插入一条 processing 记录并提交（主键冲突说明另一个请求已占用该键），再执行视图；
+     视图在提交单据前调用 idempotency.record(response)，响应状态码和内容与单据在同一个事务中写入，
+     提交之后进程退出或抛出异常（如写操作日志失败）时，重试返回已保存的响应而不会重复建单；
+     视图的事务没有提交（抛出异常或返回错误）时删除记录，客户端修正后可用同一个键重试
+  2. 窗口期（IDEMPOTENCY_WINDOW_SECONDS）内的重试直接返回首次的响应（响应头 Idempotent-Replayed: true），不再执行视图
+  3. 首次请求仍在处理中时返回 409 和 Retry-After；同一个键用于内容不同的请求时返回 422
+
+已完成的结果同时缓存在进程内存中（LRU，IDEMPOTENCY_CACHE_SIZE 条），重试命中时不访问数据库。
+processing 记录超过 IDEMPOTENCY_LOCK_SECONDS 仍未完成（进程在执行中退出）时，重试可接管并重新执行。
+过期记录由每日定时任务清理。
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, g, jsonify, make_response, request, session
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _request_hash():
+    """请求体摘要：JSON 按键排序后计算，客户端重新序列化（键顺序、空白不同）不影响判断"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return hashlib.sha256(request.get_data()).hexdigest()
+    return _sha256(json.dumps(data, sort_keys=True, ensure_ascii=False))
+
+
+class IdempotencyStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key_hash -> (request_hash, 状态码, 响应内容, 首次请求时间)
+        self.window = 86400
+        self.lock_seconds = 60
+        self.max_entries = 2048
+        self.stats = {'executed': 0, 'replayed': 0, 'memory_hits': 0, 'in_progress': 0, 'mismatched': 0,
+                      'released': 0, 'taken_over': 0}
+
+    def init_app(self, app):
+        self.window = app.config['IDEMPOTENCY_WINDOW_SECONDS']
+        self.lock_seconds = app.config['IDEMPOTENCY_LOCK_SECONDS']
+        self.max_entries = app.config['IDEMPOTENCY_CACHE_SIZE']
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    # ---------------------------- 内存缓存（只缓存已完成的结果） ----------------------------
+    def _cached(self, key_hash):
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return None
+            if entry[3] < datetime.now() - timedelta(seconds=self.window):
+                del self._entries[key_hash]
+                return None
+            self._entries.move_to_end(key_hash)
+            self.stats['memory_hits'] += 1
+            return entry
+
+    def _remember(self, record):
+        with self._lock:
+            self._entries[record.key_hash] = (record.request_hash, record.response_code, record.response_body,
+                                              record.created_time)
+            self._entries.move_to_end(record.key_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # ---------------------------- 数据库记录 ----------------------------
+    def _reserve(self, key_hash, endpoint, request_hash):
+        """占用幂等键：成功返回 None，键已被占用（处理中或已完成）时返回已有记录"""
+        record = db.session.get(IdempotencyKey, key_hash)
+        if record is not None:
+            now = datetime.now()
+            expired = record.created_time < now - timedelta(seconds=self.window)
+            abandoned = record.status == 'processing' and record.created_time < now - timedelta(seconds=self.lock_seconds)
+            if not (expired or abandoned):
+                return record
+            # 过期或首次请求的进程已退出：按读到的时间删除后重新占用（并发接管时只有一个请求能删除成功）
+            taken = db.session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.key_hash == key_hash,
+                                             IdempotencyKey.created_time == record.created_time),
+                execution_options={'synchronize_session': False},
+            ).rowcount
+            db.session.expunge(record)
+            if not taken:
+                db.session.rollback()
+                return db.session.get(IdempotencyKey, key_hash)
+            if abandoned and not expired:
+                self._count('taken_over')
+        db.session.add(IdempotencyKey(key_hash=key_hash, endpoint=endpoint, user_id=session.get('user_id'),
+                                      request_hash=request_hash, status='processing', created_time=datetime.now()))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return db.session.get(IdempotencyKey, key_hash)  # 另一个请求刚刚占用
+        return None
+
+    def _release(self, key_hash):
+        """首次请求失败：删除占用记录，客户端可用同一个键重试"""
+        db.session.rollback()
+        db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.key_hash == key_hash, IdempotencyKey.status == 'processing'),
+            execution_options={'synchronize_session': False},
+        )
+        db.session.commit()
+        self._count('released')
+
+    def record(self, response):
+        """视图在提交单据前调用：把响应写入本请求的幂等键记录，与单据在同一个事务中提交，返回 response
+
+        请求没有带 Idempotency-Key 时不做任何事。
+        """
+        key_hash = g.get('idempotency_key')
+        if key_hash is None:
+            return response
+        response = make_response(response)
+        record = db.session.get(IdempotencyKey, key_hash)
+        record.status = 'completed'
+        record.response_code = response.status_code
+        record.response_body = response.get_data(as_text=True)
+        return response
+
+    def _completed(self, key_hash):
+        """视图执行后重新读取记录：响应已随视图的事务提交时返回记录，否则（事务已回滚或未提交）返回 None"""
+        db.session.rollback()
+        record = db.session.execute(
+            select(IdempotencyKey).where(IdempotencyKey.key_hash == key_hash,
+                                         IdempotencyKey.status == 'completed')
+        ).scalar()
+        if record is not None:
+            self._remember(record)
+        return record
+
+    # ---------------------------- 响应 ----------------------------
+    def _replay(self, request_hash, entry):
+        stored_hash, code, body = entry[:3]
+        if stored_hash != request_hash:
+            self._count('mismatched')
+            return jsonify({"status": "error", "message": f"{HEADER} 已用于内容不同的请求，请使用新的键"}), 422
+        self._count('replayed')
+        return Response(body, status=code, mimetype='application/json', headers={'Idempotent-Replayed': 'true'})
+
+    def _in_progress(self):
+        self._count('in_progress')
+        response = jsonify({"status": "error", "message": "相同的请求正在处理中，请稍后重试"})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+
+    def handle(self, view, *args, **kwargs):
+        key = request.headers.get(HEADER, '').strip()
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"status": "error", "message": f"{HEADER} 不能超过 {MAX_KEY_LENGTH} 个字符"}), 400
+
+        key_hash = _sha256(f'{session.get("user_id")}\n{request.endpoint}\n{key}')
+        request_hash = _request_hash()
+        entry = self._cached(key_hash)
+        if entry is not None:
+            return self._replay(request_hash, entry)
+
+        record = self._reserve(key_hash, request.endpoint, request_hash)
+        if record is not None:
+            if record.status != 'completed':
+                return self._in_progress()
+            self._remember(record)
+            return self._replay(request_hash, (record.request_hash, record.response_code, record.response_body))
+
+        g.idempotency_key = key_hash
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            # 单据已提交（之后的操作出错）时保留记录，重试返回已保存的响应；事务回滚时才释放键
+            if self._completed(key_hash) is None:
+                self._release(key_hash)
+            else:
+                self._count('executed')
+            raise
+        finally:
+            g.pop('idempotency_key', None)
+        if self._completed(key_hash) is None:
+            self._release(key_hash)
+        else:
+            self._count('executed')
+        return response
+
+    def cleanup(self):
+        """删除超过窗口期的幂等键，返回删除条数"""
+        cutoff = datetime.now() - timedelta(seconds=self.window)
+        deleted = db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.created_time < cutoff),
+            execution_options={'synchronize_session': False},
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+    def status(self):
+        with self._lock:
+            return dict(self.stats, cached=len(self._entries), max_entries=self.max_entries, window=self.window)
+
+
+idempotency = IdempotencyStore()
+
+
+def idempotent(func):
+    """装饰新增单据的接口：带 Idempotency-Key 请求头的重试返回首次结果，不重复执行
+
+    视图须在提交单据前用 idempotency.record(response) 登记响应（与单据同一事务写入）。
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return idempotency.handle(func, *args, **kwargs)
+    return wrapper
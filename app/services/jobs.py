@@ -0,0 +1,277 @@
+"""后台任务：把导出、导入、报表等耗时操作放到线程池中执行
+
+路由调用 jobs.submit(kind, **params) 登记任务并立即返回任务ID，页面轮询 /jobs/<id> 查看进度。
+任务状态保存在 job 表中（多 worker 部署时任一进程都能查询、取消），执行在提交任务的进程内完成。
+任务函数用 @jobs.register('kind') 登记，签名为 func(ctx, **params)：
+  - ctx.progress(percent, message) 更新进度，同时检查是否已被取消（已取消时抛出 JobCancelled）
+  - ctx.result_path(filename) 返回结果文件路径（位于 JOB_RESULT_DIR/<job_id>/）
+  - 返回值（可 JSON 序列化）保存为任务结果；返回 (结果, 文件路径) 时同时记录结果文件
+每个进程的心跳线程每 JOB_HEARTBEAT_SECONDS 秒更新本进程排队中、执行中任务的心跳（与进度上报无关，
+长时间不上报进度的任务也不会被误判）；进程退出时仍在运行的任务不会继续，心跳超过 JOB_STALE_SECONDS 的任务
+由定时任务（job_expire）标记为失败。worker 正常退出（平滑重启）前调用 shutdown()：不再开始排队中的任务，
+等待执行中的任务完成，超时仍未完成的和未开始的任务立即标记为失败。
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, update
+
+from app import db
+from app.models import Job
+
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """任务已被取消（由 ctx.progress 抛出，任务函数一般无需捕获）"""
+
+
+class JobContext:
+    """传给任务函数的上下文：进度上报、取消检查、结果文件路径"""
+
+    def __init__(self, runner, job_id):
+        self._runner = runner
+        self.job_id = job_id
+        self._last_update = 0.0
+
+    def progress(self, percent, message=None, force=False):
+        # 进度写库有节流，避免逐行上报时频繁更新
+        now = time.monotonic()
+        if not force and now - self._last_update < self._runner.progress_interval:
+            return
+        self._last_update = now
+        values = {'progress': max(0, min(100, int(percent))), 'heartbeat_time': datetime.now()}
+        if message is not None:
+            values['message'] = message[:255]
+        if self._runner._update(self.job_id, **values):
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        if self._runner._cancel_requested(self.job_id):
+            raise JobCancelled()
+
+    def result_path(self, filename):
+        directory = os.path.join(self._runner.result_dir, self.job_id)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+
+class JobRunner:
+    def __init__(self):
+        self._app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self.handlers = {}
+        self.workers = 2
+        self.result_dir = 'job_results'
+        self.stale_seconds = 900
+        self.heartbeat_seconds = 60
+        self.progress_interval = 1.0
+        self._live = {}  # 本进程排队中、执行中的任务：任务ID -> Future（心跳线程定期更新）
+        self._heartbeat_thread = None
+        self._stop = threading.Event()
+        self.stats = {'submitted': 0, 'succeeded': 0, 'failed': 0, 'cancelled': 0, 'running': 0}
+
+    def init_app(self, app):
+        self._app = app
+        self.workers = app.config['JOB_WORKERS']
+        self.result_dir = app.config['JOB_RESULT_DIR']
+        self.stale_seconds = app.config['JOB_STALE_SECONDS']
+        self.heartbeat_seconds = app.config['JOB_HEARTBEAT_SECONDS']
+
+    def register(self, kind):
+        """登记任务函数（装饰器）"""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def _ensure_executor(self):
+        # 线程池在第一次提交任务时创建（与操作日志写入线程一样，每个进程各自一份）
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+                    self._stop.clear()
+                    self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='job-heartbeat',
+                                                              daemon=True)
+                    self._heartbeat_thread.start()
+        return self._executor
+
+    def _heartbeat_loop(self):
+        """心跳线程：定期更新本进程排队中、执行中任务的心跳时间"""
+        while not self._stop.wait(self.heartbeat_seconds):
+            with self._lock:
+                live = list(self._live)
+            if not live:
+                continue
+            try:
+                with self._app.app_context(), db.engine.begin() as conn:
+                    conn.execute(
+                        update(Job).where(Job.job_id.in_(live), Job.status.in_(('pending', 'running')))
+                        .values(heartbeat_time=datetime.now())
+                    )
+            except Exception:
+                print(f"后台任务心跳更新失败：\n{traceback.format_exc()}")
+
+    def submit(self, kind, user_id=None, **params):
+        """登记并提交任务，返回任务ID"""
+        if kind not in self.handlers:
+            raise ValueError(f'未知的任务类型：{kind}')
+        job_id = uuid.uuid4().hex
+        with db.engine.begin() as conn:
+            conn.execute(insert(Job).values(
+                job_id=job_id, kind=kind, params=json.dumps(params, ensure_ascii=False, default=str),
+                status='pending', progress=0, cancel_requested=False, created_by=user_id,
+                created_time=datetime.now()
+            ))
+        self.stats['submitted'] += 1
+        with self._lock:
+            self._live[job_id] = None
+        future = self._ensure_executor().submit(self._run, job_id, kind, params)
+        with self._lock:
+            if job_id in self._live:  # 任务可能已经执行完
+                self._live[job_id] = future
+        return job_id
+
+    def _update(self, job_id, **values):
+        """更新任务字段（独立短事务，不影响任务函数自己的会话），返回是否已请求取消"""
+        with db.engine.begin() as conn:
+            conn.execute(update(Job).where(Job.job_id == job_id).values(**values))
+            return bool(conn.execute(select(Job.cancel_requested).where(Job.job_id == job_id)).scalar())
+
+    def _cancel_requested(self, job_id):
+        with db.engine.connect() as conn:
+            return bool(conn.execute(select(Job.cancel_requested).where(Job.job_id == job_id)).scalar())
+
+    def _run(self, job_id, kind, params):
+        try:
+            self._execute(job_id, kind, params)
+        finally:
+            with self._lock:
+                self._live.pop(job_id, None)
+
+    def _execute(self, job_id, kind, params):
+        with self._app.app_context():
+            ctx = JobContext(self, job_id)
+            now = datetime.now()
+            with db.engine.begin() as conn:
+                # 只启动仍在排队的任务（排队期间可能已被取消或判定超时）
+                started = conn.execute(
+                    update(Job).where(Job.job_id == job_id, Job.status == 'pending', Job.cancel_requested.is_(False))
+                    .values(status='running', started_time=now, heartbeat_time=now)
+                ).rowcount
+            if not started:
+                if self._cancel_requested(job_id):
+                    self._finish(job_id, 'cancelled', message='任务在开始前已取消')
+                return
+            self.stats['running'] += 1
+            try:
+                outcome = self.handlers[kind](ctx, **params)
+                result, result_file = outcome if isinstance(outcome, tuple) else (outcome, None)
+                self._finish(job_id, 'succeeded', progress=100, message='已完成',
+                             result=json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                             result_file=result_file)
+            except JobCancelled:
+                db.session.rollback()
+                self._finish(job_id, 'cancelled', message='任务已取消')
+            except Exception as e:
+                db.session.rollback()
+                error = traceback.format_exc()
+                print(f"后台任务 {kind}（{job_id}）执行失败：\n{error}")
+                self._finish(job_id, 'failed', message=str(e)[:255], error=error)
+            finally:
+                self.stats['running'] -= 1
+                db.session.remove()
+
+    def _finish(self, job_id, status, **values):
+        self.stats[status] += 1
+        now = datetime.now()
+        self._update(job_id, status=status, finished_time=now, heartbeat_time=now, **values)
+
+    def shutdown(self, timeout=25):
+        """进程退出前：取消排队中的任务，等待执行中的任务完成（最多 timeout 秒），返回标记为失败的任务数
+
+        仍未完成的和未开始的任务立即标记为失败（进程退出后无法继续），不必等到心跳超时。
+        """
+        if self._executor is None:
+            return 0
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            futures = [future for future in self._live.values() if future is not None]
+        wait(futures, timeout=timeout)
+        self._stop.set()
+        with self._lock:
+            left = list(self._live)
+        if not left:
+            return 0
+        with self._app.app_context(), db.engine.begin() as conn:
+            return conn.execute(
+                update(Job).where(Job.job_id.in_(left), Job.status.in_(('pending', 'running')))
+                .values(status='failed', message='执行任务的进程已重启或退出，请重新提交', finished_time=datetime.now())
+            ).rowcount
+
+    def cancel(self, job_id):
+        """请求取消任务（运行中的任务在下一次上报进度时停止），返回是否可以取消"""
+        with db.engine.begin() as conn:
+            changed = conn.execute(
+                update(Job).where(Job.job_id == job_id, Job.status.in_(('pending', 'running')))
+                .values(cancel_requested=True)
+            ).rowcount
+        return bool(changed)
+
+    def expire_stale(self):
+        """把心跳（没有心跳的按提交时间）超时的任务标记为失败（执行它的进程已退出或重启），返回标记的任务数
+
+        由定时任务 job_expire 定期执行，任务页轮询不再执行该更新。
+        """
+        cutoff = datetime.now() - timedelta(seconds=self.stale_seconds)
+        with db.engine.begin() as conn:
+            return conn.execute(
+                update(Job).where(Job.status.in_(('pending', 'running')),
+                                  db.func.coalesce(Job.heartbeat_time, Job.created_time) < cutoff)
+                .values(status='failed', message='执行任务的进程已退出', finished_time=datetime.now())
+            ).rowcount
+
+    def cleanup(self, retention_days=7):
+        """删除超过保留期的已结束任务及其结果文件"""
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        old = Job.query.filter(Job.status.in_(FINISHED), Job.created_time < cutoff).all()
+        for job in old:
+            shutil.rmtree(os.path.join(self.result_dir, job.job_id), ignore_errors=True)
+            db.session.delete(job)
+        db.session.commit()
+        return len(old)
+
+    def status(self):
+        with self._lock:
+            live = len(self._live)
+        return dict(self.stats, workers=self.workers, live=live,
+                    heartbeat=bool(self._heartbeat_thread and self._heartbeat_thread.is_alive()))
+
+
+def job_dict(job):
+    """任务状态（轮询接口返回的 JSON）"""
+    return {
+        'job_id': job.job_id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'cancel_requested': job.cancel_requested,
+        'result': json.loads(job.result) if job.result else None,
+        'has_file': bool(job.result_file),
+        'created_time': job.created_time.strftime('%Y-%m-%d %H:%M:%S') if job.created_time else None,
+        'started_time': job.started_time.strftime('%Y-%m-%d %H:%M:%S') if job.started_time else None,
+        'finished_time': job.finished_time.strftime('%Y-%m-%d %H:%M:%S') if job.finished_time else None,
+    }
+
+
+jobs = JobRunner()
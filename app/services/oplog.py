@@ -0,0 +1,200 @@
+"""操作日志异步写入
+
+业务代码调用 oplog.log(...) 只把记录放进内存队列，不占用业务事务；
+后台线程攒够 LOG_BATCH_SIZE 条或每隔 LOG_FLUSH_SECONDS 秒批量插入一次，
+进程退出时把队列中剩余的记录写完。写入线程在第一次记日志时才启动，
+开发服务器重载、多 worker 部署时每个进程各自维护自己的队列。
+
+operation_log 按 log_date 分区：MySQL 上每月一个 RANGE 分区，
+maintain_partitions() 提前建好后续月份的分区，并整分区删除超过保留期的日志；
+其他数据库按日期删除过期日志。
+"""
+import atexit
+import queue
+import threading
+import time
+import traceback
+from datetime import date, datetime
+
+from sqlalchemy import insert, text
+
+from app import db
+from app.models import OperationLog
+
+
+class OperationLogWriter:
+    def __init__(self):
+        self._app = None
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.batch_size = 200
+        self.flush_seconds = 2.0
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'last_error': None}
+
+    def init_app(self, app):
+        self._app = app
+        self.batch_size = app.config['LOG_BATCH_SIZE']
+        self.flush_seconds = app.config['LOG_FLUSH_SECONDS']
+        self._queue = queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE'])
+        atexit.register(self.shutdown)
+
+    def log(self, operation, detail='', user_id=None, username=None, ip_address=None):
+        """记录一条操作日志（在请求中调用时自动取当前登录用户和IP）"""
+        from flask import has_request_context, request, session
+        if has_request_context():
+            user_id = user_id if user_id is not None else session.get('user_id')
+            username = username or session.get('real_name') or session.get('username')
+            ip_address = ip_address or request.remote_addr
+        now = datetime.now()
+        record = {
+            'log_date': now.date(),
+            'operation_time': now,
+            'user_id': user_id,
+            'username': username,
+            'operation': operation,
+            'detail': (detail or '')[:500],
+            'ip_address': ip_address,
+        }
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+            self.stats['queued'] += 1
+        except queue.Full:
+            # 队列满说明数据库写入跟不上，直接同步写入，不丢日志
+            self._write([record])
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='oplog-writer', daemon=True)
+            self._thread.start()
+
+    def _write(self, batch):
+        with self._app.app_context():
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(OperationLog), batch)
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+            except Exception:
+                self.stats['dropped'] += len(batch)
+                self.stats['last_error'] = traceback.format_exc()
+                print(f"操作日志写入失败，丢弃 {len(batch)} 条：\n{self.stats['last_error']}")
+
+    def _take(self, item, batch, waiters):
+        # 队列中的 Event 是 flush() 的请求：写出手头的记录后通知调用方
+        if isinstance(item, threading.Event):
+            waiters.append(item)
+        else:
+            batch.append(item)
+
+    def _drain(self, batch, waiters, limit):
+        while len(batch) < limit:
+            try:
+                self._take(self._queue.get_nowait(), batch, waiters)
+            except queue.Empty:
+                break
+
+    def _loop(self):
+        batch, waiters = [], []
+        deadline = time.monotonic() + self.flush_seconds
+        while not self._stop.is_set():
+            try:
+                self._take(self._queue.get(timeout=max(0.0, deadline - time.monotonic())), batch, waiters)
+                self._drain(batch, waiters, self.batch_size)
+            except queue.Empty:
+                pass
+            if batch and (waiters or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+            while waiters:
+                waiters.pop().set()
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_seconds
+        # 退出前写完剩余记录
+        self._drain(batch, waiters, float('inf'))
+        if batch:
+            self._write(batch)
+        for waiter in waiters:
+            waiter.set()
+
+    def flush(self, timeout=10):
+        """等待队列中已有的记录全部写入（测试、手动维护时使用）"""
+        if self._thread and self._thread.is_alive():
+            waiter = threading.Event()
+            self._queue.put(waiter)
+            waiter.wait(timeout)
+            return
+        batch, waiters = [], []
+        self._drain(batch, waiters, float('inf'))
+        if batch:
+            self._write(batch)
+        for waiter in waiters:
+            waiter.set()
+
+    def shutdown(self, timeout=10):
+        """停止写入线程并写完剩余记录（进程退出时自动调用）"""
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+        if self._queue is not None:
+            self.flush()
+
+    def status(self):
+        status = dict(self.stats, pending=self._queue.qsize() if self._queue else 0)
+        if status['last_error']:
+            status['last_error'] = status['last_error'].strip().splitlines()[-1]
+        return status
+
+
+def _month_add(value, months):
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def maintain_partitions(retention_months=12, months_ahead=2, today=None):
+    """维护日志分区：建好后续月份分区，删除超过保留期的日志"""
+    today = today or date.today()
+    this_month = date(today.year, today.month, 1)
+    cutoff = _month_add(this_month, -retention_months)
+
+    if db.engine.dialect.name != 'mysql':
+        OperationLog.query.filter(OperationLog.log_date < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return
+
+    existing = {row[0] for row in db.session.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'operation_log' AND PARTITION_NAME IS NOT NULL"
+    ))}
+    if not existing:
+        return  # 非分区表（如早期手工建表），跳过
+
+    # 从 p_future 中拆出后续月份的分区（分区名 pYYYYMM，上界为下月1日）
+    for i in range(months_ahead + 1):
+        month = _month_add(this_month, i)
+        name = f"p{month.strftime('%Y%m')}"
+        if name in existing:
+            continue
+        upper = _month_add(month, 1).strftime('%Y-%m-%d')
+        db.session.execute(text(
+            f"ALTER TABLE operation_log REORGANIZE PARTITION p_future INTO ("
+            f"PARTITION {name} VALUES LESS THAN ('{upper}'), "
+            f"PARTITION p_future VALUES LESS THAN (MAXVALUE))"
+        ))
+        existing.add(name)
+
+    # 整分区删除过期日志
+    expired = sorted(name for name in existing if name != 'p_future' and name[1:] < cutoff.strftime('%Y%m'))
+    if expired:
+        db.session.execute(text(f"ALTER TABLE operation_log DROP PARTITION {', '.join(expired)}"))
+    db.session.commit()
+
+
+oplog = OperationLogWriter()
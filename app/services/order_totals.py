@@ -0,0 +1,74 @@
+"""单据主表汇总字段：总金额 total_amount、明细行数 line_count、总数量 total_quantity
+
+改动明细的路由（入库/出库 新增、编辑，/api 新增）在同一事务中调用 apply() 按新明细重算主表字段，
+列表和报表只读主表，不再按明细汇总。
+已有数据（或绕过业务流程改动过的明细）用 backfill() 按明细重算一次：迁移 v003 会自动执行，
+也可以在报表页提交后台任务 order_totals_backfill 重新计算。
+"""
+from sqlalchemy import func, select, update
+
+from app import db
+from app.models import Purchase, PurchaseDetail, Sale, SaleDetail
+from app.services.jobs import jobs
+
+# (主表, 明细表, 单号列名)
+ORDERS = ((Purchase, PurchaseDetail, 'purchase_id'), (Sale, SaleDetail, 'sale_id'))
+
+
+def apply(order, details):
+    """按明细（PurchaseDetail / SaleDetail 列表）设置单据主表的汇总字段"""
+    order.line_count = len(details)
+    order.total_quantity = sum(d.quantity or 0 for d in details)
+    order.total_amount = round(sum(d.amount or 0 for d in details), 2)
+    return order
+
+
+def backfill_statement(header, detail, key, order_ids=None):
+    """按明细重算主表汇总字段的 UPDATE 语句（order_ids 为空时更新整张表）
+
+    早期通过 API 新增的明细没有写金额，按 数量×单价 计算。
+    """
+    table, detail = header.__table__, detail.__table__
+    matches = detail.c[key] == table.c[key]
+    amount = func.coalesce(detail.c.amount, detail.c.quantity * detail.c.unit_price)
+    # 用 ORM 语句执行，报表缓存、首页指标能感知到主表被批量更新
+    statement = update(header).execution_options(synchronize_session=False).values(
+        line_count=select(func.count()).select_from(detail).where(matches).scalar_subquery(),
+        total_quantity=func.coalesce(select(func.sum(detail.c.quantity)).where(matches).scalar_subquery(), 0),
+        total_amount=func.coalesce(select(func.round(func.sum(amount), 2)).where(matches).scalar_subquery(), 0),
+    )
+    if order_ids is not None:
+        statement = statement.where(table.c[key].in_(order_ids))
+    return statement
+
+
+def backfill(batch_size=1000, progress=None):
+    """按明细重算全部单据的汇总字段（按单号分批提交，避免长时间锁表），返回 {表名: 单据数}"""
+    counts = {}
+    for index, (header, detail, key) in enumerate(ORDERS):
+        order_key = getattr(header, key)
+        total = db.session.scalar(select(func.count()).select_from(header)) or 0
+        done, last_id = 0, None
+        while True:
+            query = select(order_key).order_by(order_key).limit(batch_size)
+            if last_id is not None:
+                query = query.where(order_key > last_id)
+            order_ids = db.session.scalars(query).all()
+            if not order_ids:
+                break
+            db.session.execute(backfill_statement(header, detail, key, order_ids))
+            db.session.commit()
+            done += len(order_ids)
+            last_id = order_ids[-1]
+            if progress:
+                percent = (index + done / max(total, 1)) * 100 / len(ORDERS)
+                progress(percent, f'正在重算 {header.__tablename__}：{done}/{total}')
+        counts[header.__tablename__] = done
+    return counts
+
+
+@jobs.register('order_totals_backfill')
+def backfill_job(ctx):
+    """后台任务：按明细重算采购单、销售单的汇总字段"""
+    ctx.progress(0, '正在重算单据汇总字段', force=True)
+    return backfill(progress=ctx.progress)
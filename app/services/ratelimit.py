@@ -0,0 +1,188 @@
+"""限流与并发控制：按 用户+接口类别 限制请求速率和同时处理的请求数，避免个别用户的导出、大范围报表拖慢所有人
+
+接口类别（classify()，按端点名和请求方法判断）：
+  bulk    导出、导入、备份恢复与下载、后台重算（对账、回填、补货计算、效期扫描）
+  report  统计报表
+  write   新增、修改、删除（POST/PUT/DELETE，以及 GET 方式的删除链接）
+  read    其余页面和查询接口
+登录、登出、静态文件、运行指标不限制。
+
+每个 用户+类别 一个令牌桶：每秒补充 rate 个令牌，最多积累 burst 个，每个请求消耗一个，桶空时拒绝。
+并发上限：concurrency 为每个用户该类别同时处理的请求数，bulk、report 还计入该用户排队中、执行中的后台任务
+（导出、报表提交后在后台执行，请求本身很快返回）；total_concurrency 为本进程该类别同时处理的请求数。
+超出时直接拒绝而不排队，收银（write/read）不会被后台操作占满线程。先检查令牌和进程内并发，
+通过后才查询数据库中的后台任务数，被拒绝的请求（包括短时间内的大量重试）不访问数据库。
+拒绝时返回 429 和 Retry-After（秒）：接口请求返回 JSON，页面返回提示文字。
+异步只读接口 /api/async/ 不经过 Flask，由 AsgiApp 按 read 类别调用 acquire()/release()，与页面查询共用令牌桶。
+
+计数在各进程内独立（多 worker 部署时每个 worker 各自计数，后台任务数在数据库中统计，各进程一致）。
+"""
+import math
+import threading
+import time
+from functools import partial
+
+from flask import Response, g, jsonify, request, session
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Job
+
+CLASSES = ('bulk', 'report', 'write', 'read')
+LABELS = {'bulk': '导出/导入', 'report': '统计报表', 'write': '保存', 'read': '查询'}
+EXEMPT_BLUEPRINTS = ('auth', 'metrics')
+BULK_SUFFIXES = ('_export', '_import', '_restore', '_download', '_reconcile', '_backfill', '_run', '_scan')
+JOB_CLASSES = ('bulk', 'report')  # 计入后台任务的类别（报表任务类型以 report_ 开头，其余任务算 bulk）
+MAX_BUCKETS = 10000  # 令牌桶超过该数量时清理已补满的桶
+
+
+def classify(endpoint, method):
+    """请求所属的接口类别，不限制的请求返回 None"""
+    if endpoint is None or endpoint == 'static' or endpoint.split('.', 1)[0] in EXEMPT_BLUEPRINTS:
+        return None
+    name = endpoint.rsplit('.', 1)[-1]
+    if name.endswith(BULK_SUFFIXES):
+        return 'bulk'
+    if endpoint.startswith('report.'):
+        return 'report'
+    if method not in ('GET', 'HEAD', 'OPTIONS') or name.endswith('_delete'):
+        return 'write'
+    return 'read'
+
+
+def _active_jobs(user_id, kind):
+    """用户排队中、执行中的后台任务数"""
+    report = Job.kind.like('report_%')
+    with db.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(Job).where(
+            Job.created_by == user_id, Job.status.in_(('pending', 'running')),
+            report if kind == 'report' else ~report,
+        )).scalar()
+
+
+def _too_many(kind, retry_after):
+    message = f'{LABELS[kind]}请求过于频繁，请 {retry_after} 秒后重试'
+    if request.path.startswith('/api/') or request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'status': 'error', 'message': message})
+    else:
+        response = Response(message, mimetype='text/plain')
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+class RateLimiter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.limits = {}
+        self._buckets = {}  # (用户, 类别) -> (令牌数, 上次补充时间)
+        self._active = {}  # (用户, 类别) -> 处理中的请求数
+        self._total = dict.fromkeys(CLASSES, 0)  # 类别 -> 本进程处理中的请求数
+        self.stats = {kind: {'allowed': 0, 'rate_limited': 0, 'concurrency_limited': 0} for kind in CLASSES}
+
+    def init_app(self, app):
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        self.limits = app.config['RATE_LIMITS']
+        if self.enabled:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        kind = classify(request.endpoint, request.method)
+        if kind not in self.limits:
+            return None
+        user = session.get('user_id') or request.remote_addr
+        active_jobs = None
+        if kind in JOB_CLASSES and 'user_id' in session:
+            active_jobs = partial(_active_jobs, user, kind)
+        retry_after = self.acquire(user, kind, active_jobs)
+        if retry_after:
+            return _too_many(kind, retry_after)
+        g.rate_limit_slot = (user, kind)
+        return None
+
+    def _after_request(self, response):
+        # 流式响应（列表导出）在视图返回后才生成内容，响应关闭时再释放名额
+        if response.is_streamed and 'rate_limit_slot' in g:
+            user, kind = g.pop('rate_limit_slot')
+            response.call_on_close(lambda: self.release(user, kind))
+        return response
+
+    def _teardown_request(self, exc):
+        slot = g.pop('rate_limit_slot', None)
+        if slot is not None:
+            self.release(*slot)
+
+    def _refused(self, key, kind, jobs, now):
+        """（持有锁时调用）检查并发和令牌：超出限制时计数并返回建议的重试等待秒数，否则返回 0（不占用名额）"""
+        limit = self.limits[kind]
+        stats = self.stats[kind]
+        total = limit.get('total_concurrency')
+        if self._active.get(key, 0) + jobs >= limit['concurrency'] or (total and self._total[kind] >= total):
+            stats['concurrency_limited'] += 1
+            return max(1, math.ceil(1 / limit['rate']))  # 大约补充一个令牌的时间
+        tokens, updated = self._buckets.get(key, (limit['burst'], now))
+        tokens = min(limit['burst'], tokens + (now - updated) * limit['rate'])
+        self._buckets[key] = (tokens, now)
+        if tokens < 1:
+            stats['rate_limited'] += 1
+            return math.ceil((1 - tokens) / limit['rate'])
+        return 0
+
+    def acquire(self, user, kind, active_jobs=None):
+        """占用一个请求名额：成功返回 0，超出限制返回建议的重试等待秒数
+
+        active_jobs 为返回该用户排队中、执行中后台任务数的函数（查询数据库），令牌和进程内并发检查通过后才调用。
+        """
+        key = (user, kind)
+        jobs = 0
+        if active_jobs is not None:
+            with self._lock:
+                retry_after = self._refused(key, kind, 0, time.monotonic())
+            if retry_after:
+                return retry_after
+            jobs = active_jobs()
+        with self._lock:
+            now = time.monotonic()
+            retry_after = self._refused(key, kind, jobs, now)
+            if retry_after:
+                return retry_after
+            stats = self.stats[kind]
+            tokens, _ = self._buckets[key]
+            self._buckets[key] = (tokens - 1, now)
+            self._active[key] = self._active.get(key, 0) + 1
+            self._total[kind] += 1
+            stats['allowed'] += 1
+            if len(self._buckets) > MAX_BUCKETS:
+                self._prune(now)
+            return 0
+
+    def release(self, user, kind):
+        with self._lock:
+            key = (user, kind)
+            self._active[key] -= 1
+            if not self._active[key]:
+                del self._active[key]
+            self._total[kind] -= 1
+
+    def _prune(self, now):
+        """清理已补满、没有处理中请求的令牌桶（与新建的桶等价）"""
+        for key, (tokens, updated) in list(self._buckets.items()):
+            limit = self.limits[key[1]]
+            if key not in self._active and tokens + (now - updated) * limit['rate'] >= limit['burst']:
+                del self._buckets[key]
+
+    def status(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'active': dict(self._total),
+                'buckets': len(self._buckets),
+                'classes': {kind: dict(stats) for kind, stats in self.stats.items()},
+                'limits': self.limits,
+            }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,148 @@
+"""读写分离：只读页面、只读接口和报表任务的查询发往只读副本，写入仍走主库
+
+配置 REPLICA_DATABASE_URL 后，副本作为 SQLAlchemy 绑定 SQLALCHEMY_BINDS['replica'] 创建引擎。
+db.session 使用 RoutingSession：在 @read_replica 装饰的视图（或 with use_replica(): 代码块）中，
+SELECT 语句改用副本引擎；flush、写语句以及未标记的代码仍然使用主库。
+
+副本延迟：每隔 REPLICA_CHECK_SECONDS 检查一次（MySQL 读取 SHOW REPLICA STATUS 的 Seconds_Behind_Source），
+延迟超过 REPLICA_MAX_LAG_SECONDS、复制中断或副本无法连接时，只读查询自动回到主库，下次检查恢复后再切回。
+读己之写：某个用户的请求写入过数据后，REPLICA_STICKY_SECONDS 秒内该用户的只读请求仍走主库。
+
+本地测试可用两个 SQLite 文件分别作为主库和副本（SQLite 没有复制延迟，视为 0）。
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+REPLICA_BIND = 'replica'
+
+# 当前代码块是否允许读副本（请求线程、后台任务线程各自独立）
+_reading = contextvars.ContextVar('read_replica', default=False)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.max_lag = 5
+        self.check_interval = 5
+        self.sticky_seconds = 10
+        self.healthy = True
+        self.lag = None
+        self.last_error = None
+        self._checked_at = None
+        self.stats = {'replica_reads': 0, 'fallback_reads': 0, 'checks': 0, 'check_errors': 0}
+
+    def init_app(self, app):
+        self.enabled = REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+        self.max_lag = app.config['REPLICA_MAX_LAG_SECONDS']
+        self.check_interval = app.config['REPLICA_CHECK_SECONDS']
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        if self.enabled:
+            app.after_request(self._remember_write)
+
+    def _remember_write(self, response):
+        # 本次请求写入过数据：该用户随后一段时间的只读请求走主库，避免读不到刚提交的修改
+        if g.get('db_wrote'):
+            session['db_primary_until'] = time.time() + self.sticky_seconds
+        return response
+
+    def allowed(self):
+        """当前请求是否可以读副本（未启用、刚写入过数据的用户不读副本）"""
+        if not self.enabled:
+            return False
+        if has_request_context() and session.get('db_primary_until', 0) > time.time():
+            return False
+        return True
+
+    def engine_for_read(self, engines):
+        """副本可用时返回副本引擎，否则返回 None（改用主库）"""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                    self._check(engines[REPLICA_BIND])
+                    self._checked_at = now
+        if self.healthy:
+            self.stats['replica_reads'] += 1
+            return engines[REPLICA_BIND]
+        self.stats['fallback_reads'] += 1
+        return None
+
+    def _check(self, engine):
+        self.stats['checks'] += 1
+        try:
+            with engine.connect() as conn:
+                self.lag = replica_lag(conn)
+        except Exception as e:
+            self.stats['check_errors'] += 1
+            self.healthy, self.lag, self.last_error = False, None, str(e)
+            return
+        self.last_error = None
+        self.healthy = self.lag is not None and self.lag <= self.max_lag
+
+    def status(self):
+        return dict(self.stats, enabled=self.enabled, healthy=self.healthy, lag_seconds=self.lag,
+                    max_lag_seconds=self.max_lag, last_error=self.last_error)
+
+
+def replica_lag(conn):
+    """副本延迟（秒）；复制线程中断时返回 None，非 MySQL 或未配置复制的实例视为 0"""
+    if conn.dialect.name != 'mysql':
+        conn.execute(text('SELECT 1'))
+        return 0
+    try:
+        row = conn.execute(text('SHOW REPLICA STATUS')).mappings().first()
+        column = 'Seconds_Behind_Source'
+    except Exception:
+        # MySQL 8.0.22 之前的版本
+        row = conn.execute(text('SHOW SLAVE STATUS')).mappings().first()
+        column = 'Seconds_Behind_Master'
+    if row is None:
+        return 0
+    return row[column]
+
+
+class RoutingSession(Session):
+    """只读代码块中的 SELECT 发往副本，其余按 Flask-SQLAlchemy 的绑定规则选择引擎"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _reading.get() and not self._flushing and clause is not None and clause.is_select:
+            engine = replica_router.engine_for_read(self._db.engines)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+@contextmanager
+def use_replica():
+    """代码块内的只读查询走副本（副本不可用时自动回到主库）"""
+    token = _reading.set(replica_router.allowed())
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+def read_replica(func):
+    """装饰只读视图或报表任务：其中的查询走副本"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,172 @@
+"""报表结果缓存：按 (报表, 规范化参数) 缓存计算结果，TTL 过期 + LRU 容量上限
+
+报表任务计算完成后写入缓存，同样的报表再次打开时直接返回缓存结果，不访问数据库。
+缓存项记录依赖的单据类型（purchase / sale）和日期范围，会话提交时按本次改动精确失效：
+  - 新增、修改、删除采购单/销售单（含明细），且改动前或改动后为已审核状态
+  - 单据日期（改动前、改动后）落在缓存项的日期范围内；不限日期的报表（库存汇总）只要有相关改动就失效
+改动前的值无法确定（未加载）或通过 query.update()/delete() 批量修改时，相关类型的缓存全部失效。
+
+缓存在各进程内独立，其他进程提交的改动不会使本进程的缓存失效，最长在 REPORT_CACHE_TTL 秒后过期。
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+from sqlalchemy import event, inspect
+
+from app.models import Purchase, PurchaseDetail, Sale, SaleDetail
+from app.services.replica import RoutingSession
+
+# 单据主表：类型、日期字段；明细表：所属主表、关联字段
+TRACKED = {Purchase: ('purchase', 'purchase_date'), Sale: ('sale', 'sale_date')}
+DETAILS = {PurchaseDetail: (Purchase, 'purchase_id'), SaleDetail: (Sale, 'sale_id')}
+_UNKNOWN = object()
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _normalize(value):
+    """参数规范化：日期统一为 YYYY-MM-DD，其余转为去掉首尾空白的字符串"""
+    day = _as_date(value) if isinstance(value, (str, date)) else None
+    return day.isoformat() if day else str(value).strip()
+
+
+class ReportCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.ttl = 600
+        self.max_entries = 256
+        self.epoch = 0  # 每次失效加一，计算期间发生过失效的结果不写入缓存
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.ttl = app.config['REPORT_CACHE_TTL']
+        self.max_entries = app.config['REPORT_CACHE_MAX_ENTRIES']
+
+    @staticmethod
+    def key(report, params):
+        return report, tuple(sorted((name, _normalize(value)) for name, value in params.items()))
+
+    def get(self, report, **params):
+        """缓存的报表结果，未命中或已过期时返回 None"""
+        key = self.key(report, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['expires'] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry['value']
+
+    def put(self, report, value, depends, start=None, end=None, epoch=None, **params):
+        """写入报表结果；depends 为依赖的单据类型，start/end 为依赖的日期范围（None 表示不限）。
+        epoch 为开始计算时的 self.epoch，此后发生过失效则放弃写入（结果可能已过时）"""
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return False
+            key = self.key(report, params)
+            self._entries[key] = {'value': value, 'expires': time.monotonic() + self.ttl, 'depends': set(depends),
+                                  'start': _as_date(start) if start else None, 'end': _as_date(end) if end else None}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return True
+
+    def invalidate(self, kind, day=None):
+        """使依赖 kind 类型单据、日期范围包含 day 的缓存失效（day 为 None 时该类型全部失效）"""
+        with self._lock:
+            self.epoch += 1
+            stale = [key for key, entry in self._entries.items()
+                     if kind in entry['depends'] and (day is None or entry['start'] is None
+                                                      or entry['start'] <= day <= entry['end'])]
+            for key in stale:
+                del self._entries[key]
+            self.stats['invalidations'] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.epoch += 1
+            self._entries.clear()
+
+    def status(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries, ttl=self.ttl)
+
+
+def _values(state, attr):
+    """字段改动前后的取值；改动前的值未加载时包含 _UNKNOWN"""
+    if attr in state.unloaded and state.has_identity and not state.deleted:
+        getattr(state.obj(), attr)  # 未修改、已过期的字段先从数据库加载
+    history = state.attrs[attr].history
+    values = set(history.sum())
+    if not values or (history.added and not history.deleted and state.has_identity):
+        values.add(_UNKNOWN)
+    return values
+
+
+def _header_changes(state, kind, date_attr):
+    statuses = _values(state, 'audit_status')
+    if 1 not in statuses and _UNKNOWN not in statuses:
+        return set()  # 改动前后都不是已审核状态，不影响报表
+    return {(kind, None if value is _UNKNOWN else _as_date(value)) for value in _values(state, date_attr)}
+
+
+def _detail_changes(session, obj, header_class, key_attr):
+    kind, date_attr = TRACKED[header_class]
+    header = session.get(header_class, getattr(obj, key_attr)) if getattr(obj, key_attr) else None
+    if header is None:
+        return {(kind, None)}
+    if header.audit_status != 1:
+        return set()
+    return {(kind, _as_date(getattr(header, date_attr)))}
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _collect_changes(session, flush_context, instances):
+    changes = session.info.setdefault('report_changes', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        cls = type(obj)
+        if cls in TRACKED:
+            changes.update(_header_changes(inspect(obj), *TRACKED[cls]))
+        elif cls in DETAILS:
+            changes.update(_detail_changes(session, obj, *DETAILS[cls]))
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    # query.update() / query.delete() 不经过 flush，无法得知涉及哪些单据
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete) or orm_execute_state.bind_mapper is None:
+        return
+    cls = orm_execute_state.bind_mapper.class_
+    header_class = cls if cls in TRACKED else DETAILS.get(cls, (None,))[0]
+    if header_class is not None:
+        orm_execute_state.session.info.setdefault('report_changes', set()).add((TRACKED[header_class][0], None))
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _apply_changes(session):
+    for kind, day in session.info.pop('report_changes', ()):
+        report_cache.invalidate(kind, day)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('report_changes', None)
+
+
+report_cache = ReportCache()
@@ -0,0 +1,163 @@
+"""销售日汇总（日期 × 药品 × 仓库 × 分类）
+
+销售单审核通过、撤销审核、删除时按明细增量更新 sales_daily_rollup（计入时用数据库的 upsert，
+并发审核同一天、同一药品的销售单不会因唯一约束冲突而失败）；
+每晚对最近几天做一次对账重建，修正绕过业务流程的数据变动。
+报表查询只读汇总表，按维度分组并限制返回行数。
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import update, insert, select, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app import db
+from app.models import Medicine, Sale, SaleDetail, SalesDailyRollup
+
+# 报表可用的分组维度
+DIMENSIONS = {
+    'day': SalesDailyRollup.sale_date,
+    'medicine': SalesDailyRollup.medicine_id,
+    'warehouse': SalesDailyRollup.warehouse_id,
+    'category': SalesDailyRollup.category_id,
+}
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    return value
+
+
+def _upsert_statement():
+    """按数据库方言生成基于 uq_rollup_day_medicine_warehouse 的累加 upsert 语句，不支持的数据库返回 None"""
+    table = SalesDailyRollup.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        new = stmt.inserted
+    elif dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        new = stmt.excluded
+    else:
+        return None
+
+    values = {col: table.c[col] + new[col] for col in ('quantity', 'amount', 'line_count')}
+    if dialect == 'mysql':
+        return stmt.on_duplicate_key_update(**values)
+    return stmt.on_conflict_do_update(index_elements=['sale_date', 'medicine_id', 'warehouse_id'], set_=values)
+
+
+def apply_sale(sale_date, warehouse_id, details, sign):
+    """把一张销售单的明细计入（sign=1）或移出（sign=-1）日汇总
+
+    details 为 SaleDetail 对象或 (medicine_id, quantity, amount) 序列。
+    """
+    sale_date = _to_date(sale_date)
+    warehouse_id = int(warehouse_id) if warehouse_id not in (None, '') else 0
+
+    totals = {}
+    for d in details:
+        if isinstance(d, SaleDetail):
+            medicine_id, quantity, amount = d.medicine_id, d.quantity, d.amount
+        else:
+            medicine_id, quantity, amount = d
+        key = int(medicine_id)
+        qty_sum, amount_sum, lines = totals.get(key, (0, 0.0, 0))
+        totals[key] = (qty_sum + (quantity or 0), amount_sum + (amount or 0), lines + 1)
+    if not totals:
+        return
+
+    categories = dict(db.session.execute(
+        select(Medicine.id, Medicine.category_id).where(Medicine.id.in_(list(totals.keys())))
+    ).all())
+
+    upsert = _upsert_statement() if sign > 0 else None
+    for medicine_id, (quantity, amount, lines) in totals.items():
+        if upsert is not None:
+            db.session.execute(upsert.values(
+                sale_date=sale_date, medicine_id=medicine_id, warehouse_id=warehouse_id,
+                category_id=categories.get(medicine_id) or 0,
+                quantity=quantity, amount=amount, line_count=lines
+            ))
+            continue
+        result = db.session.execute(
+            update(SalesDailyRollup)
+            .where(
+                SalesDailyRollup.sale_date == sale_date,
+                SalesDailyRollup.medicine_id == medicine_id,
+                SalesDailyRollup.warehouse_id == warehouse_id
+            )
+            .values(
+                quantity=SalesDailyRollup.quantity + sign * quantity,
+                amount=SalesDailyRollup.amount + sign * amount,
+                line_count=SalesDailyRollup.line_count + sign * lines
+            )
+        )
+        if result.rowcount == 0 and sign > 0:
+            db.session.add(SalesDailyRollup(
+                sale_date=sale_date, medicine_id=medicine_id, warehouse_id=warehouse_id,
+                category_id=categories.get(medicine_id) or 0,
+                quantity=quantity, amount=amount, line_count=lines
+            ))
+
+
+def reconcile(start, end):
+    """按明细重建 [start, end] 日期范围内的汇总，返回重建后的行数"""
+    start, end = _to_date(start), _to_date(end)
+    db.session.execute(
+        SalesDailyRollup.__table__.delete().where(SalesDailyRollup.sale_date.between(start, end))
+    )
+    warehouse = func.coalesce(Sale.warehouse_id, 0)
+    db.session.execute(
+        insert(SalesDailyRollup).from_select(
+            ['sale_date', 'medicine_id', 'warehouse_id', 'category_id', 'quantity', 'amount', 'line_count'],
+            select(
+                Sale.sale_date,
+                SaleDetail.medicine_id,
+                warehouse,
+                func.coalesce(func.max(Medicine.category_id), 0),
+                func.coalesce(func.sum(SaleDetail.quantity), 0),
+                func.coalesce(func.sum(SaleDetail.amount), 0),
+                func.count(SaleDetail.id)
+            )
+            .join(Sale, SaleDetail.sale_id == Sale.sale_id)
+            .outerjoin(Medicine, SaleDetail.medicine_id == Medicine.id)
+            .where(Sale.audit_status == 1, Sale.sale_date.between(start, end))
+            .group_by(Sale.sale_date, SaleDetail.medicine_id, warehouse)
+        )
+    )
+    db.session.commit()
+    return SalesDailyRollup.query.filter(SalesDailyRollup.sale_date.between(start, end)).count()
+
+
+def reconcile_recent(days=7):
+    """每晚对账：重建最近 days 天（含今天）的汇总"""
+    today = date.today()
+    return reconcile(today - timedelta(days=days - 1), today)
+
+
+def sales_summary(dimension, start, end, warehouse_id=None, category_id=None, limit=100):
+    """按维度汇总销售：返回 [{key, quantity, amount, line_count}]，按金额倒序（按日为日期正序）"""
+    key = DIMENSIONS[dimension]
+    query = select(
+        key.label('key'),
+        func.sum(SalesDailyRollup.quantity).label('quantity'),
+        func.sum(SalesDailyRollup.amount).label('amount'),
+        func.sum(SalesDailyRollup.line_count).label('line_count')
+    ).where(SalesDailyRollup.sale_date.between(_to_date(start), _to_date(end)))
+    if warehouse_id is not None:
+        query = query.where(SalesDailyRollup.warehouse_id == warehouse_id)
+    if category_id is not None:
+        query = query.where(SalesDailyRollup.category_id == category_id)
+    query = query.group_by(key).having(func.sum(SalesDailyRollup.line_count) > 0)
+    query = query.order_by(key.asc() if dimension == 'day' else func.sum(SalesDailyRollup.amount).desc())
+
+    rows = db.session.execute(query.limit(limit)).all()
+    return [{
+        'key': row.key.strftime('%Y-%m-%d') if dimension == 'day' else row.key,
+        'quantity': int(row.quantity or 0),
+        'amount': round(float(row.amount or 0), 2),
+        'line_count': int(row.line_count or 0),
+    } for row in rows]
@@ -0,0 +1,190 @@
+"""进程内定时任务：后台线程按每日固定时间或 cron 表达式执行登记的任务（在应用上下文中运行）
+
+多 worker 部署时每个 worker 都启动调度线程，但只有拿到锁文件（SCHEDULER_LOCK_FILE）排他锁的进程执行任务，
+其余进程待命；持锁进程退出（或被重启）后锁自动释放，由下一个检查到的进程接替。
+"""
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支持多进程部署，不加锁
+    fcntl = None
+
+
+class CronSchedule:
+    """五段式 cron 表达式：分 时 日 月 周（周日为 0 或 7），支持 *、*/n、a-b、a-b/n 和逗号列表
+
+    日和周都不是 * 时，满足其一即可（与 crontab 相同）。
+    """
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f'cron 表达式需要 5 段（分 时 日 月 周）：{expression}')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        )
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for item in field.split(','):
+            body, _, step = item.partition('/')
+            if body == '*':
+                start, end = low, high
+            elif '-' in body:
+                start, end = (int(x) for x in body.split('-'))
+            else:
+                start = end = int(body)
+            if start < low or end > high or start > end:
+                raise ValueError(f'cron 字段超出范围 {low}-{high}：{item}')
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, day):
+        in_month = day.day in self.days
+        in_week = (day.isoweekday() % 7) in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, now):
+        """now 之后（不含）的下一次执行时间"""
+        start = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(366 * 5):  # 最多向后找 5 年（如 2月29日）
+            if day.month in self.months and self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        run_at = day.replace(hour=hour, minute=minute)
+                        if run_at >= start:
+                            return run_at
+            day += timedelta(days=1)
+        raise ValueError(f'cron 表达式没有可执行的时间：{self.expression}')
+
+
+class Scheduler:
+    """简单的定时任务调度器（每日固定时间或 cron 表达式）"""
+
+    def __init__(self, poll_interval=30):
+        self.poll_interval = poll_interval  # 检查间隔（秒）
+        self.jobs = {}
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.lock_file = None
+        self._lock_fd = None
+
+    def add_daily_job(self, name, func, at='01:00'):
+        """登记每日任务，at 为 HH:MM"""
+        hour, minute = (int(x) for x in at.split(':'))
+        self.add_cron_job(name, func, f'{minute} {hour} * * *')
+
+    def add_cron_job(self, name, func, cron):
+        """登记按 cron 表达式执行的任务，如 '30 1 * * *'（每天 01:30）、'0 */6 * * 1-5'"""
+        schedule = CronSchedule(cron)
+        self.jobs[name] = {
+            'func': func,
+            'schedule': schedule,
+            'next_run': schedule.next_after(datetime.now()),
+            'last_run': None,
+            'last_error': None,
+        }
+
+    def start(self, app, use_reloader=False):
+        """启动调度线程（使用开发服务器自动重载时只在子进程中启动，避免重复执行）"""
+        if not app.config.get('SCHEDULER_ENABLED', True):
+            return
+        if use_reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self._app = app
+        self.lock_file = app.config.get('SCHEDULER_LOCK_FILE') or None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def is_leader(self):
+        """本进程是否负责执行任务（未配置锁文件时总是执行；否则尝试获取锁，拿到后一直持有到进程退出）"""
+        if not self.lock_file or fcntl is None:
+            return True
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._lock_fd = fd
+        # 拿到锁时重新计算下次执行时间，不补跑待命期间错过的任务
+        now = datetime.now()
+        for job in self.jobs.values():
+            job['next_run'] = job['schedule'].next_after(now)
+        return True
+
+    def role(self):
+        """调度线程状态：off（未启动）、leader（执行任务）、standby（待命）"""
+        if not (self._thread and self._thread.is_alive()):
+            return 'off'
+        if not self.lock_file or fcntl is None or self._lock_fd is not None:
+            return 'leader'
+        return 'standby'
+
+    def run_job(self, name):
+        """立即执行一个任务（在应用上下文中），返回任务结果"""
+        job = self.jobs[name]
+        with self._app.app_context():
+            from app import db
+            try:
+                result = job['func']()
+                job['last_error'] = None
+                return result
+            except Exception:
+                db.session.rollback()
+                job['last_error'] = traceback.format_exc()
+                print(f"定时任务 {name} 执行失败：\n{job['last_error']}")
+            finally:
+                job['last_run'] = datetime.now()
+                db.session.remove()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self.is_leader():
+                self._stop.wait(self.poll_interval)
+                continue
+            now = datetime.now()
+            for name, job in list(self.jobs.items()):
+                if now >= job['next_run']:
+                    job['next_run'] = job['schedule'].next_after(now)
+                    self.run_job(name)
+            self._stop.wait(self.poll_interval)
+
+    def status(self):
+        """各任务的下次执行时间和上次执行情况"""
+        return {
+            name: {
+                'cron': job['schedule'].expression,
+                'next_run': job['next_run'].strftime('%Y-%m-%d %H:%M:%S'),
+                'last_run': job['last_run'].strftime('%Y-%m-%d %H:%M:%S') if job['last_run'] else None,
+                'last_error': job['last_error'],
+            }
+            for name, job in self.jobs.items()
+        }
+
+
+scheduler = Scheduler()
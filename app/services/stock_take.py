@@ -0,0 +1,119 @@
+"""库存盘点（批量上传扫描结果）
+
+上传的 CSV 按行流式解析（不整体读入内存），同一药品多次扫描的数量累加；
+一次查询取出所有涉及药品的系统库存，用 numpy 计算差异，
+批量写入盘点明细，可选在同一事务内按差异调整系统库存。
+"""
+import csv
+import io
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select, insert, update, bindparam
+
+from app import db
+from app.models import Medicine, StockCheck, StockCheckDetail
+
+# CSV 表头（兼容中文列名）
+ID_COLUMNS = ('medicine_id', '药品ID')
+COUNT_COLUMNS = ('actual_stock', '实盘数量')
+MAX_ERRORS = 50  # 最多返回的错误行数
+
+
+class StockTakeError(Exception):
+    """盘点文件无法处理（表头缺失、没有有效数据等）"""
+
+
+def _pick(header, candidates):
+    for name in candidates:
+        if name in header:
+            return header.index(name)
+    raise StockTakeError(f"CSV 缺少列：{' 或 '.join(candidates)}")
+
+
+def parse_counts(stream, encoding='utf-8-sig'):
+    """流式解析扫描结果，返回 (medicine_ids, counts, errors)
+
+    medicine_ids/counts 为按药品ID合并后的 numpy 数组，errors 为 [(行号, 原因)]。
+    """
+    reader = csv.reader(io.TextIOWrapper(stream, encoding=encoding, newline=''))
+    header = [h.strip() for h in next(reader, [])]
+    id_idx, count_idx = _pick(header, ID_COLUMNS), _pick(header, COUNT_COLUMNS)
+
+    ids, counts, errors = [], [], []
+    for line_no, row in enumerate(reader, start=2):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        try:
+            medicine_id = int(row[id_idx])
+            count = int(row[count_idx])
+        except (IndexError, ValueError):
+            errors.append((line_no, '药品ID或数量不是整数'))
+            continue
+        if count < 0:
+            errors.append((line_no, '数量不能为负数'))
+            continue
+        ids.append(medicine_id)
+        counts.append(count)
+
+    if not ids:
+        raise StockTakeError('文件中没有有效的盘点数据')
+    ids = np.array(ids, dtype=np.int64)
+    counts = np.array(counts, dtype=np.int64)
+    # 同一药品多次扫描（如分货架盘点）数量累加
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    totals = np.zeros(len(unique_ids), dtype=np.int64)
+    np.add.at(totals, inverse, counts)
+    return unique_ids, totals, errors[:MAX_ERRORS]
+
+
+def create_check(checker, check_date, medicine_ids, counts, remark=None, apply=False):
+    """生成盘点单及明细，apply=True 时按差异调整系统库存（同一事务）
+
+    返回 (check_id, 统计信息)；未知药品ID不写入明细，列在 unknown_ids 中。
+    """
+    rows = db.session.execute(
+        select(Medicine.id, Medicine.stock).where(Medicine.id.in_(medicine_ids.tolist()))
+    ).all()
+    if not rows:
+        raise StockTakeError('文件中的药品ID在系统中都不存在')
+    known = np.array([r[0] for r in rows], dtype=np.int64)
+    system = np.array([r[1] or 0 for r in rows], dtype=np.int64)
+
+    # 按药品ID对齐：medicine_ids 已排序，searchsorted 找到每个系统药品的实盘数量
+    order = np.argsort(known)
+    known, system = known[order], system[order]
+    actual = counts[np.searchsorted(medicine_ids, known)]
+    diff = actual - system
+    changed = diff != 0
+
+    unknown_ids = np.setdiff1d(medicine_ids, known)
+    check_id = f"CHECK{datetime.now().strftime('%Y%m%d%H%M%S%f')[:-3]}"
+    try:
+        db.session.add(StockCheck(check_id=check_id, checker=checker, check_date=check_date, remark=remark))
+        db.session.flush()
+        db.session.execute(insert(StockCheckDetail), [
+            {'check_id': check_id, 'medicine_id': m, 'system_stock': s, 'actual_stock': a, 'diff': d}
+            for m, s, a, d in zip(known.tolist(), system.tolist(), actual.tolist(), diff.tolist())
+        ])
+        if apply and changed.any():
+            # 按差异增减而不是直接覆盖，盘点期间发生的销售/入库不会被抹掉
+            table = Medicine.__table__
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('b_id')).values(stock=table.c.stock + bindparam('b_diff')),
+                [{'b_id': m, 'b_diff': d} for m, d in zip(known[changed].tolist(), diff[changed].tolist())]
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return check_id, {
+        'lines': len(known),
+        'unknown': len(unknown_ids),
+        'unknown_ids': unknown_ids[:MAX_ERRORS].tolist(),
+        'changed': int(changed.sum()),
+        'gain': int(diff[diff > 0].sum()),
+        'loss': int(-diff[diff < 0].sum()),
+        'applied': bool(apply),
+    }
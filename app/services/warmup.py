@@ -0,0 +1,60 @@
+"""多进程部署的预热（gunicorn.conf.py 中调用）
+
+preload_app 时主进程导入应用后调用 prepare()：完成 ORM 映射配置、编译全部模板，
+fork 出的 worker 直接继承这些结果，不必每个进程各自在第一个请求时完成。
+每个 worker 启动后调用 warm_worker()：丢弃从主进程继承的连接，预先建立连接池中的连接，
+执行一遍常用的基础数据查询（药品、分类、单位、供应商、仓库，填充 SQLAlchemy 语句编译缓存）并计算首页 KPI。
+"""
+import time
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import configure_mappers
+
+from app import db
+
+# 本进程的预热耗时（秒），见 /metrics/ 中的 worker
+stats = {'prepare_seconds': None, 'warm_seconds': None}
+
+
+def prepare(app):
+    """主进程（fork 之前）：不连接数据库，返回耗时（秒）"""
+    started = time.perf_counter()
+    configure_mappers()
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)
+    stats['prepare_seconds'] = round(time.perf_counter() - started, 3)
+    return stats['prepare_seconds']
+
+
+def dispose_engines(app):
+    """丢弃从主进程继承的连接（close=False：不关闭父进程仍在使用的连接，只是本进程不再复用）"""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def warm_worker(app):
+    """worker 进程启动后：建立连接、执行常用查询，返回耗时（秒）"""
+    from app.models import Medicine, MedicineCategory, Unit, Supplier, Warehouse
+    from app.services.dashboard import dashboard
+
+    started = time.perf_counter()
+    with app.app_context():
+        # 同时取出多个连接，让连接池中提前建好这些连接
+        connections = []
+        try:
+            for _ in range(min(app.config['WARMUP_POOL_CONNECTIONS'], app.config['DB_POOL_SIZE'])):
+                connection = db.engine.connect()
+                connections.append(connection)
+                connection.execute(text('SELECT 1'))
+        finally:
+            for connection in connections:
+                connection.close()
+        for model in (MedicineCategory, Unit, Supplier, Warehouse):
+            db.session.execute(select(model)).scalars().all()
+        db.session.execute(select(Medicine).limit(1)).scalars().all()
+        dashboard.kpis()
+        db.session.remove()
+    stats['warm_seconds'] = round(time.perf_counter() - started, 3)
+    return stats['warm_seconds']
@@ -0,0 +1,16 @@
+"""ASGI 入口：异步只读接口 /api/async/ 与 Flask 应用挂在同一个进程（需安装 asgiref、uvicorn 及异步驱动）
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('APP_ENV', 'production')
+
+from run import app as flask_app  # noqa: E402
+from app.asgi import create_asgi_app  # noqa: E402
+
+app = create_asgi_app(flask_app)
+application = app
@@ -0,0 +1,87 @@
+"""进程冷启动耗时：启动新的 Python 进程创建应用，对比启动时的数据库结构检查与原来的 create_all + 查询管理员
+
+每轮启动一个子进程，分别计时：导入（app 包与依赖）、create_app()（注册蓝图、初始化服务、结构版本检查），
+再在同一进程中用新建的连接各执行一次结构版本检查和原来每次启动都做的 db.create_all() + 查询管理员（对照）。
+默认使用临时 SQLite 文件；也可以通过 DATABASE_URL 指向一个测试库（不会删除数据，空库会自动建表）。
+
+    python benchmark_startup.py               # 默认 10 轮
+    python benchmark_startup.py --runs 30
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from app import create_app, db
+from app.migrations import ensure_schema
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+status, first_check = app.extensions['schema_status']
+with app.app_context():
+    # 两种检查都从新建连接开始计时（create_app 中的第一次检查还包含引擎初始化）
+    db.engine.dispose()
+    _, check = ensure_schema(app)
+    db.engine.dispose()
+    begin = time.perf_counter()
+    db.create_all()
+    from app.models import User
+    User.query.filter_by(username='admin').first()
+    legacy = time.perf_counter() - begin
+print(json.dumps({{
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_check': first_check,
+    'schema_check': check,
+    'legacy_check': legacy,
+    'status': status,
+}}))
+'''
+
+
+def run_child(env):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD.format(root=ROOT)], env=env, cwd=ROOT,
+                            check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - started
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='进程冷启动耗时')
+    parser.add_argument('--runs', type=int, default=10, help='启动多少次（取中位数）')
+    args = parser.parse_args()
+
+    env = dict(os.environ, SCHEDULER_ENABLED='0')
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'pharmacy_startup.db'))
+    print(f"数据库：{env['DATABASE_URL'].split('@')[-1]}")
+    first = run_child(env)  # 第一次启动：空库建表并登记迁移
+    print(f"首次启动：{first['status']}，结构检查 {first['first_check'] * 1000:.1f} ms")
+
+    runs = [run_child(env) for _ in range(args.runs)]
+    print(f'\n{args.runs} 次启动（中位数，结构状态 {runs[-1]["status"]}）')
+    rows = [
+        ('进程启动到应用可用（含解释器启动）', 'process'),
+        ('导入 app 包', 'import'),
+        ('create_app()', 'create_app'),
+        ('  其中结构版本检查（含引擎初始化）', 'first_check'),
+        ('结构版本检查', 'schema_check'),
+        ('原 create_all + 查询管理员（对照）', 'legacy_check'),
+    ]
+    for name, key in rows:
+        print(f'{name:<28}{statistics.median(r[key] for r in runs) * 1000:>10.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
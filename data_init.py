@@ -13,6 +13,8 @@ from app.models import (
     Sale, SaleDetail,
     StockCheck, StockCheckDetail
 )
+from app import migrations
+from app.services import fefo, rollup, order_totals
 from run import app
 
 # 初始化Faker（中文数据）
@@ -33,6 +35,7 @@ def init_data():
         # 1. 清空现有表并重建（谨慎使用！）
         db.drop_all()
         db.create_all()
+        migrations.stamp()  # 新建的表已是最新结构，登记全部迁移
         print("数据库表已重置")
 
         # 2. 生成药品分类
@@ -169,6 +172,7 @@ def init_data():
                 audit_status=random.choice([0, 1, 2])  # 0待审核，1通过，2驳回
             )
             db.session.add(purchase)
+            purchase_details = []
 
             # 每个采购单包含1-4种药品
             for _ in range(random.randint(1, 4)):
@@ -192,10 +196,17 @@ def init_data():
                     amount=quantity * unit_price
                 )
                 db.session.add(detail)
+                purchase_details.append(detail)
 
                 # 已审核的采购单更新库存
                 if purchase.audit_status == 1:
                     medicine.stock += quantity
+
+            order_totals.apply(purchase, purchase_details)
+
+            # 已审核的采购单生成批次
+            if purchase.audit_status == 1:
+                fefo.receive_purchase(purchase, purchase_details)
         db.session.commit()
         print(f"生成 {PURCHASE_COUNT} 个采购单（含明细）")
 
@@ -218,6 +229,8 @@ def init_data():
                 audit_status=random.choice([0, 1, 2])
             )
             db.session.add(sale)
+            sold_items = []
+            sale_details = []
 
             # 每个销售单包含1-3种药品（确保库存足够）
             for _ in range(random.randint(1, 3)):
@@ -236,11 +249,21 @@ def init_data():
                     amount=quantity * unit_price
                 )
                 db.session.add(detail)
+                sale_details.append(detail)
 
                 # 已审核的销售单更新库存
                 if sale.audit_status == 1 and medicine.stock >= quantity:
                     medicine.stock -= quantity
+                    sold_items.append((medicine.id, quantity))
+
+            order_totals.apply(sale, sale_details)
+
+            # 已审核的销售单按近效期先出消耗批次
+            if sold_items:
+                fefo.allocate_sale(sale_id, warehouse.id, sold_items)
         db.session.commit()
+        # 按已审核销售单生成销售日汇总
+        rollup.reconcile(datetime.now().date() - timedelta(days=120), datetime.now().date())
         print(f"生成 {SALE_COUNT} 个销售单（含明细）")
 
         # 9. 生成药品盘点单及明细
@@ -0,0 +1,74 @@
+"""gunicorn 配置（生产环境）：gunicorn -c gunicorn.conf.py wsgi:app
+
+- 预派生 WEB_WORKERS 个 worker 进程（默认 CPU 核数×2+1），每个 worker WEB_THREADS 个线程
+- preload_app：主进程只导入一次应用，完成 ORM 映射配置、模板编译后再 fork，worker 直接继承
+- 每个 worker 启动后丢弃从主进程继承的数据库连接，预先建立连接池、执行常用查询后再接收请求
+- 定时任务：每个 worker 启动调度线程，通过锁文件只有一个 worker 执行，其余待命
+- 平滑重启：kill -HUP <主进程>  按新配置启动新 worker，旧 worker 处理完当前请求后退出
+  （preload_app 时 HUP 不会重新加载代码；发布新代码用 kill -USR2 启动新主进程，确认正常后 kill -QUIT 旧主进程）
+- 后台任务（导出、导入、报表）在提交它的 worker 进程内执行：worker 退出前最多等待 graceful_timeout 秒让执行中的
+  任务完成，未开始的和仍未完成的任务标记为失败，需要重新提交。因此默认不启用 max_requests（按请求数定期替换
+  worker 会中断其中的任务）；确需启用（WEB_MAX_REQUESTS）时选择业务低峰，并让长任务留在 graceful_timeout 以内
+
+数据库连接数 = worker 数 ×（DB_POOL_SIZE + DB_MAX_OVERFLOW），按数据库 max_connections 调整 WEB_WORKERS。
+"""
+import multiprocessing
+import os
+import tempfile
+
+os.environ.setdefault('APP_ENV', 'production')
+os.environ.setdefault('SCHEDULER_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'pharmacy-scheduler.lock'))
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS') or 4)
+preload_app = True
+timeout = 120           # worker 无响应多久后重启（秒），长耗时的导出、报表在后台任务中执行
+graceful_timeout = 30   # 平滑重启、停止时等待当前请求完成的时间（秒）
+keepalive = 5
+# 每个 worker 处理多少请求后自动替换（0=不替换）；替换会中断该 worker 中执行时间超过 graceful_timeout 的后台任务
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS') or 0)
+max_requests_jitter = max_requests // 10
+pidfile = os.environ.get('WEB_PIDFILE', os.path.join(tempfile.gettempdir(), 'pharmacy-gunicorn.pid'))
+proc_name = 'pharmacy'
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """主进程：应用已导入（preload_app），fork worker 之前完成不需要数据库的预热"""
+    from wsgi import app
+    from app.services import warmup
+    server.log.info('预热完成（映射配置、模板编译）：%.2f 秒', warmup.prepare(app))
+
+
+def post_fork(server, worker):
+    """worker 进程：丢弃从主进程继承的连接，各进程使用自己的连接池"""
+    from wsgi import app
+    from app.services import warmup
+    warmup.dispose_engines(app)
+
+
+def post_worker_init(worker):
+    """worker 进程：接收请求前预建连接、执行常用查询，并启动定时任务线程（通过锁文件只有一个 worker 执行任务）"""
+    from wsgi import app
+    from app.services import warmup
+    from app.services.scheduler import scheduler
+    try:
+        worker.log.info('worker %s 预热完成：%.2f 秒', worker.pid, warmup.warm_worker(app))
+    except Exception as e:
+        # 数据库暂时不可用时照常启动，第一次请求时再建立连接
+        worker.log.warning('worker %s 预热失败：%s', worker.pid, e)
+    scheduler.start(app)
+
+
+def worker_exit(server, worker):
+    """worker 退出（平滑重启、max_requests 替换）前：等待本进程的后台任务完成（不超过 graceful_timeout，
+    主进程届时会强制结束 worker），再写完操作日志队列"""
+    from app.services.jobs import jobs
+    from app.services.oplog import oplog
+    failed = jobs.shutdown(timeout=max(server.cfg.graceful_timeout - 5, 0))
+    if failed:
+        worker.log.warning('worker %s 退出时有 %s 个后台任务未完成，已标记为失败', worker.pid, failed)
+    oplog.shutdown()
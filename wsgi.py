@@ -0,0 +1,15 @@
+"""生产环境 WSGI 入口（开发调试仍使用 python run.py）
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('APP_ENV', 'production')
+
+from app.migrations import require_current_schema  # noqa: E402
+from run import app  # noqa: E402
+
+require_current_schema(app)  # 数据库结构不是最新版本时拒绝启动（先执行 flask --app run schema upgrade）
+application = app